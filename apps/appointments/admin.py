@@ -1,7 +1,7 @@
 # en apps/appointments/admin.py
 
 from django.contrib import admin
-from .models import Appointment, PsychologistAvailability
+from .models import Appointment, PsychologistAvailability, CalendarFeedToken, SlotHold, WaitlistEntry
 
 class AppointmentAdmin(admin.ModelAdmin):
     list_display = ('patient', 'psychologist', 'appointment_date', 'start_time', 'status', 'is_paid')
@@ -17,6 +17,19 @@ class PsychologistAvailabilityAdmin(admin.ModelAdmin):
         return obj.get_weekday_display()
     get_weekday_display.short_description = 'Día de la Semana'
 
+class SlotHoldAdmin(admin.ModelAdmin):
+    list_display = ('patient', 'psychologist', 'appointment_date', 'start_time', 'expires_at')
+    list_filter = ('appointment_date', 'psychologist')
+
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ('patient', 'psychologist', 'specialization', 'date_from', 'date_to', 'status')
+    list_filter = ('status', 'specialization')
+
+class CalendarFeedTokenAdmin(admin.ModelAdmin):
+    list_display = ('psychologist', 'created_at')
+    search_fields = ('psychologist__first_name', 'psychologist__last_name', 'psychologist__email')
+    readonly_fields = ('token', 'created_at')
+
 # NO registrar en el admin por defecto - se registran en admin sites específicos
 # admin.site.register(Appointment, AppointmentAdmin)
 # admin.site.register(PsychologistAvailability, PsychologistAvailabilityAdmin)
@@ -24,4 +37,7 @@ class PsychologistAvailabilityAdmin(admin.ModelAdmin):
 # Registrar también en el tenant admin
 from config.tenant_admin import tenant_admin_site
 tenant_admin_site.register(Appointment, AppointmentAdmin)
-tenant_admin_site.register(PsychologistAvailability, PsychologistAvailabilityAdmin)
\ No newline at end of file
+tenant_admin_site.register(PsychologistAvailability, PsychologistAvailabilityAdmin)
+tenant_admin_site.register(CalendarFeedToken, CalendarFeedTokenAdmin)
+tenant_admin_site.register(SlotHold, SlotHoldAdmin)
+tenant_admin_site.register(WaitlistEntry, WaitlistEntryAdmin)
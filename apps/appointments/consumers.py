@@ -0,0 +1,116 @@
+# apps/appointments/consumers.py
+import asyncio
+import json
+from datetime import date, timedelta
+
+from channels.generic.websocket import AsyncWebsocketConsumer
+
+from . import realtime
+
+# Ventana en la que se agrupan los eventos de un mismo grupo
+COALESCE_WINDOW = 0.5
+# Semanas a las que puede estar suscrita una misma conexión
+MAX_SUBSCRIBED_WEEKS = 8
+
+
+class AvailabilityConsumer(AsyncWebsocketConsumer):
+    """
+    Cambios de disponibilidad de un psicólogo en tiempo real.
+
+    Conexión: ws/availability/<psychologist_id>/?token=<token>
+    Mensajes del cliente:
+        {"action": "subscribe", "week_start": "YYYY-MM-DD"}
+        {"action": "unsubscribe", "week_start": "YYYY-MM-DD"}
+    Eventos al cliente:
+        {"type": "availability_changed", "psychologist_id": 5,
+         "changes": [{"date": ..., "start_time": ..., "end_time": ..., "state": "busy"|"free"}],
+         "refresh": false}
+    """
+
+    async def connect(self):
+        self.user = self.scope.get('user')
+        if self.user is None or self.user.is_anonymous:
+            await self.close()
+            return
+
+        self.psychologist_id = int(self.scope['url_route']['kwargs']['psychologist_id'])
+        tenant = self.scope.get('tenant')
+        self.tenant_schema = tenant.schema_name if tenant else 'public'
+        self.week_groups = set()
+        self.pending = {}
+        self.pending_refresh = False
+        self.flush_task = None
+
+        # El grupo del psicólogo recibe los cambios que afectan a todas las semanas
+        self.psychologist_group = realtime.psychologist_group(self.psychologist_id, self.tenant_schema)
+        await self.channel_layer.group_add(self.psychologist_group, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if not hasattr(self, 'psychologist_group'):
+            return
+        if self.flush_task:
+            self.flush_task.cancel()
+        for group in {self.psychologist_group} | self.week_groups:
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+            action = data['action']
+            week_start = date.fromisoformat(data['week_start'])
+        except (ValueError, KeyError, TypeError):
+            await self.send(text_data=json.dumps({'type': 'error', 'error': 'Mensaje inválido'}))
+            return
+
+        # Una ventana de 7 días que no empieza en lunes abarca dos semanas ISO
+        groups = {
+            realtime.week_group(self.psychologist_id, realtime.week_monday(day), self.tenant_schema)
+            for day in (week_start, week_start + timedelta(days=6))
+        }
+
+        if action == 'subscribe':
+            groups -= self.week_groups
+            if len(self.week_groups) + len(groups) > MAX_SUBSCRIBED_WEEKS:
+                await self.send(text_data=json.dumps({
+                    'type': 'error',
+                    'error': f'Máximo {MAX_SUBSCRIBED_WEEKS} semanas suscritas por conexión'
+                }))
+                return
+            for group in groups:
+                await self.channel_layer.group_add(group, self.channel_name)
+            self.week_groups |= groups
+        elif action == 'unsubscribe':
+            for group in groups & self.week_groups:
+                await self.channel_layer.group_discard(group, self.channel_name)
+            self.week_groups -= groups
+        else:
+            await self.send(text_data=json.dumps({'type': 'error', 'error': 'Acción desconocida'}))
+            return
+
+        await self.send(text_data=json.dumps({
+            'type': action + 'd',
+            'week_start': week_start.isoformat(),
+        }))
+
+    # Recibir evento desde el grupo
+    async def availability_changed(self, event):
+        for change in event['changes']:
+            self.pending[(change['date'], change.get('start_time'))] = change
+        self.pending_refresh = self.pending_refresh or event['refresh']
+
+        if self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(COALESCE_WINDOW)
+        pending, self.pending = self.pending, {}
+        refresh, self.pending_refresh = self.pending_refresh, False
+        self.flush_task = None
+
+        await self.send(text_data=json.dumps({
+            'type': 'availability_changed',
+            'psychologist_id': self.psychologist_id,
+            'changes': list(pending.values()),
+            'refresh': refresh,
+        }))
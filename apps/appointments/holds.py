@@ -0,0 +1,190 @@
+# apps/appointments/holds.py
+
+"""
+Reservas temporales de horario (SlotHold) para el checkout.
+
+Flujo:
+1. create_hold(): retiene el horario durante HOLD_DURATION sin crear la cita.
+2. convert_hold_to_appointment(): al confirmar el pago, crea la cita y
+   borra la reserva en la misma transacción.
+3. release_expired_holds(): el reaper libera en lote las reservas vencidas.
+
+Las reservas con sesión de Stripe siguen vigentes PAYMENT_GRACE después de
+expires_at: un pago completado justo antes del vencimiento puede confirmarse
+(confirm-payment o webhook) un poco más tarde y la reserva debe seguir ahí.
+"""
+
+from datetime import datetime, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Appointment, SlotHold, WaitlistEntry
+from . import schedule_cache, realtime
+
+# Stripe exige que una sesión de checkout viva al menos 30 minutos
+HOLD_DURATION = timedelta(minutes=31)
+# Margen para confirmar pagos completados justo antes del vencimiento
+PAYMENT_GRACE = timedelta(minutes=15)
+
+
+class SlotUnavailable(Exception):
+    """El horario ya está ocupado por una cita o por otra reserva activa."""
+
+
+def _live(now):
+    """Reservas vigentes: sin vencer o, si tienen pago en curso, dentro del margen."""
+    return Q(expires_at__gt=now) | Q(
+        stripe_session_id__isnull=False,
+        expires_at__gt=now - PAYMENT_GRACE
+    )
+
+
+def active_holds(psychologist_id, date_from, date_to=None):
+    """Reservas vigentes de un psicólogo en un rango de fechas."""
+    return SlotHold.objects.filter(
+        _live(timezone.now()),
+        psychologist_id=psychologist_id,
+        appointment_date__range=(date_from, date_to or date_from)
+    )
+
+
+def active_holds_for(psychologist_ids, date_from, date_to):
+    """Reservas vigentes de varios psicólogos en un rango (una sola consulta)."""
+    return SlotHold.objects.filter(
+        _live(timezone.now()),
+        psychologist_id__in=psychologist_ids,
+        appointment_date__range=(date_from, date_to)
+    )
+
+
+def create_hold(patient, psychologist, appointment_date, start_time, duration=HOLD_DURATION, **fields):
+    """
+    Retiene un horario para el paciente. Lanza SlotUnavailable si hay una
+    cita activa que se solapa o si otro paciente tiene una reserva vigente.
+    """
+    profile = psychologist.professional_profile
+    end_time = (
+        datetime.combine(appointment_date, start_time) +
+        timedelta(minutes=profile.session_duration)
+    ).time()
+    now = timezone.now()
+
+    try:
+        with transaction.atomic():
+            # Reservas vencidas o del mismo paciente en este horario: se reemplazan
+            SlotHold.objects.filter(
+                psychologist=psychologist,
+                appointment_date=appointment_date,
+                start_time=start_time
+            ).filter(
+                ~_live(now) | Q(patient=patient)
+            ).delete()
+
+            if Appointment.objects.filter(
+                psychologist=psychologist,
+                appointment_date=appointment_date,
+                status__in=['pending', 'confirmed'],
+                start_time__lt=end_time,
+                end_time__gt=start_time
+            ).exists():
+                raise SlotUnavailable('Ya existe una cita en este horario')
+
+            if active_holds(psychologist.id, appointment_date).filter(
+                start_time__lt=end_time,
+                end_time__gt=start_time
+            ).exclude(patient=patient).exists():
+                raise SlotUnavailable('Este horario está reservado temporalmente por otro paciente')
+
+            hold = SlotHold.objects.create(
+                patient=patient,
+                psychologist=psychologist,
+                appointment_date=appointment_date,
+                start_time=start_time,
+                end_time=end_time,
+                consultation_fee=fields.pop('consultation_fee', profile.consultation_fee),
+                expires_at=now + duration,
+                **fields
+            )
+    except IntegrityError:
+        # Otro checkout insertó la reserva entre nuestra comprobación y el INSERT
+        raise SlotUnavailable('Este horario está reservado temporalmente por otro paciente')
+
+    schedule_cache.invalidate_date(psychologist.id, appointment_date)
+    realtime.slot_changed(psychologist.id, appointment_date, start_time, end_time, 'busy')
+    return hold
+
+
+def release_hold(hold):
+    """Libera una reserva concreta (p. ej. si falla la creación de la sesión de pago)."""
+    hold.delete()
+    schedule_cache.invalidate_date(hold.psychologist_id, hold.appointment_date)
+    realtime.slot_changed(hold.psychologist_id, hold.appointment_date, hold.start_time, hold.end_time, 'free')
+
+
+def convert_hold_to_appointment(hold_id):
+    """
+    Convierte la reserva en una cita pagada y confirmada de forma atómica.
+    Devuelve None si la reserva ya no existe (p. ej. ya fue convertida).
+    """
+    with transaction.atomic():
+        hold = SlotHold.objects.select_for_update().filter(id=hold_id).first()
+        if hold is None:
+            return None
+
+        try:
+            with transaction.atomic():
+                appointment = Appointment.objects.create(
+                    patient_id=hold.patient_id,
+                    psychologist_id=hold.psychologist_id,
+                    appointment_date=hold.appointment_date,
+                    start_time=hold.start_time,
+                    end_time=hold.end_time,
+                    appointment_type=hold.appointment_type,
+                    reason_for_visit=hold.reason_for_visit,
+                    notes=hold.notes,
+                    consultation_fee=hold.consultation_fee,
+                    is_paid=True,
+                    status='confirmed'
+                )
+        except IntegrityError:
+            raise SlotUnavailable('El horario fue ocupado mientras se procesaba el pago')
+
+        hold.delete()
+
+        # Si el horario se le ofreció desde la lista de espera, queda agendada
+        # (aunque la oferta ya hubiera vencido y volviera a 'waiting')
+        WaitlistEntry.objects.filter(
+            patient_id=hold.patient_id,
+            status__in=['offered', 'waiting', 'expired'],
+            offer_psychologist_id=hold.psychologist_id,
+            offer_date=hold.appointment_date,
+            offer_start_time=hold.start_time
+        ).update(status='booked')
+
+    return appointment
+
+
+def release_expired_holds(now=None):
+    """
+    Libera en lote las reservas vencidas del tenant actual. SlotHold no tiene
+    señales ni relaciones inversas, así que el DELETE es una sola sentencia.
+    Devuelve la lista de horarios liberados (psychologist_id, fecha, hora_inicio, hora_fin).
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        expired = list(
+            SlotHold.objects.select_for_update(skip_locked=True).exclude(
+                _live(now)
+            ).values_list('id', 'psychologist_id', 'appointment_date', 'start_time', 'end_time')
+        )
+        if expired:
+            SlotHold.objects.filter(id__in=[row[0] for row in expired]).delete()
+
+    released = [row[1:] for row in expired]
+    for psychologist_id, appointment_date in {(row[0], row[1]) for row in released}:
+        schedule_cache.invalidate_date(psychologist_id, appointment_date)
+    for psychologist_id, appointment_date, start_time, end_time in released:
+        realtime.slot_changed(psychologist_id, appointment_date, start_time, end_time, 'free')
+    return released
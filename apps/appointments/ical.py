@@ -0,0 +1,181 @@
+# apps/appointments/ical.py
+
+"""
+Generación incremental del feed iCalendar de un psicólogo.
+
+Cada sondeo de un cliente de calendario cuesta una sola consulta sobre el
+índice (psychologist, updated_at): MAX(updated_at) y COUNT(*) forman la
+marca de agua. Si coincide con la cacheada se responde desde la caché (o
+con 304); si no, sólo se regeneran los VEVENT de las citas modificadas
+después de la marca anterior.
+"""
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import Appointment
+
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+# Citas pasadas que siguen apareciendo en el calendario
+FEED_PAST_DAYS = 180
+
+PRODID = '-//Psico SAS//Agenda de citas//ES'
+STATUS_MAP = {
+    'pending': 'TENTATIVE',
+    'confirmed': 'CONFIRMED',
+    'completed': 'CONFIRMED',
+    'no_show': 'CONFIRMED',
+    'cancelled': 'CANCELLED',
+}
+
+EVENT_COLUMNS = (
+    'id', 'appointment_date', 'start_time', 'end_time', 'status',
+    'appointment_type', 'meeting_link', 'updated_at', 'created_at',
+    'patient__first_name', 'patient__last_name',
+)
+
+
+def _tenant():
+    return getattr(connection, 'schema_name', 'public')
+
+
+def _feed_key(psychologist_id):
+    return f'ical_feed:{_tenant()}:{psychologist_id}'
+
+
+def token_cache_key(token):
+    return f'ical_token:{_tenant()}:{token}'
+
+
+def _escape(text):
+    return (
+        (text or '')
+        .replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+    )
+
+
+def _fold(line):
+    """Pliega líneas de más de 75 octetos (RFC 5545 §3.1)."""
+    raw = line.encode('utf-8')
+    if len(raw) <= 75:
+        return line
+    parts = []
+    current = ''
+    limit = 75
+    for char in line:
+        if len((current + char).encode('utf-8')) > limit:
+            parts.append(current)
+            current = char
+            limit = 74  # el espacio inicial de continuación cuenta
+        else:
+            current += char
+    parts.append(current)
+    return '\r\n '.join(parts)
+
+
+def _utc(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _local_to_utc(day, time_value):
+    return _utc(timezone.make_aware(datetime.combine(day, time_value)))
+
+
+def _render_event(row):
+    patient_name = f"{row['patient__first_name']} {row['patient__last_name']}".strip()
+    modality = 'En línea' if row['appointment_type'] == 'online' else 'Presencial'
+    lines = [
+        'BEGIN:VEVENT',
+        f"UID:appointment-{row['id']}@{_tenant()}.psicoadmin.xyz",
+        f"DTSTAMP:{_utc(row['updated_at'])}",
+        f"CREATED:{_utc(row['created_at'])}",
+        f"LAST-MODIFIED:{_utc(row['updated_at'])}",
+        f"DTSTART:{_local_to_utc(row['appointment_date'], row['start_time'])}",
+        f"DTEND:{_local_to_utc(row['appointment_date'], row['end_time'])}",
+        f"SUMMARY:{_escape(f'Cita con {patient_name}')}",
+        f"DESCRIPTION:{_escape(modality)}",
+        f"STATUS:{STATUS_MAP.get(row['status'], 'CONFIRMED')}",
+    ]
+    if row['meeting_link']:
+        lines.append(f"URL:{row['meeting_link']}")
+    lines.append('END:VEVENT')
+    return '\r\n'.join(_fold(line) for line in lines)
+
+
+def _render_calendar(events):
+    header = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        'X-WR-CALNAME:Citas',
+    ]
+    body = [events[key] for key in sorted(events)]
+    return '\r\n'.join(header + body + ['END:VCALENDAR']) + '\r\n'
+
+
+def _feed_queryset(psychologist_id):
+    since = timezone.localdate() - timedelta(days=FEED_PAST_DAYS)
+    return Appointment.objects.filter(
+        psychologist_id=psychologist_id,
+        appointment_date__gte=since
+    )
+
+
+def get_watermark(psychologist_id):
+    """(último updated_at, número de citas) del feed en una sola consulta."""
+    result = _feed_queryset(psychologist_id).order_by().aggregate(
+        last_modified=Max('updated_at'),
+        total=Count('id')
+    )
+    return result['last_modified'], result['total']
+
+
+def get_feed(psychologist_id):
+    """
+    Devuelve el estado del feed {'body', 'etag', 'last_modified', 'total'},
+    regenerando sólo lo necesario a partir de la marca de agua.
+    """
+    key = _feed_key(psychologist_id)
+    last_modified, total = get_watermark(psychologist_id)
+    state = cache.get(key)
+
+    if state and state['last_modified'] == last_modified and state['total'] == total:
+        return state
+
+    queryset = _feed_queryset(psychologist_id)
+
+    if state and state['last_modified'] and last_modified:
+        events = dict(state['events'])
+        for row in queryset.filter(
+            updated_at__gt=state['last_modified']
+        ).values(*EVENT_COLUMNS):
+            events[row['id']] = _render_event(row)
+        if len(events) != total:
+            # Citas borradas o que salieron de la ventana de fechas
+            current_ids = set(queryset.values_list('id', flat=True))
+            events = {pk: event for pk, event in events.items() if pk in current_ids}
+    else:
+        events = {
+            row['id']: _render_event(row)
+            for row in queryset.values(*EVENT_COLUMNS).iterator(chunk_size=500)
+        }
+
+    state = {
+        'events': events,
+        'body': _render_calendar(events),
+        'etag': f'"{psychologist_id}-{total}-{last_modified.timestamp() if last_modified else 0}"',
+        'last_modified': last_modified,
+        'total': total,
+    }
+    cache.set(key, state, FEED_CACHE_TIMEOUT)
+    return state
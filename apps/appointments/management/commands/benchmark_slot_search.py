@@ -0,0 +1,140 @@
+"""
+Comando para medir la búsqueda de próximos horarios libres (slot_search).
+Ejecutar con: python manage.py benchmark_slot_search --psychologists 200 --occupancy 0.8
+
+Genera en memoria N psicólogos con disponibilidad de lunes a viernes y citas
+aleatorias que ocupan --occupancy de sus horarios (no se toca la BD) y mide
+dos formas de obtener los --limit horarios más próximos:
+- completa: genera todos los horarios del horizonte y los ordena
+- merge: slot_search.merge_free_slots (heapq.merge, se detiene en N)
+"""
+
+import heapq
+import random
+import time
+from datetime import datetime, time as dtime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.appointments import slot_search
+from apps.appointments.models import PsychologistAvailability
+from apps.professionals.models import ProfessionalProfile
+
+WORKDAY_WINDOWS = [(dtime(8, 0), dtime(12, 0)), (dtime(14, 0), dtime(19, 0))]
+
+
+class Command(BaseCommand):
+    help = 'Mide slot_search con N psicólogos generados en memoria'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--psychologists', type=int, default=200, help='Número de psicólogos')
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=14,
+            help=f'Horizonte de búsqueda en días (máximo {slot_search.MAX_HORIZON_DAYS})'
+        )
+        parser.add_argument('--limit', type=int, default=10, help='Horarios pedidos')
+        parser.add_argument(
+            '--occupancy',
+            type=float,
+            default=0.8,
+            help='Fracción de horarios ya reservados (0-1)'
+        )
+        parser.add_argument('--repeat', type=int, default=20, help='Repeticiones por medición')
+        parser.add_argument('--seed', type=int, default=42, help='Semilla del generador aleatorio')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['occupancy'] < 1:
+            raise CommandError('--occupancy debe estar entre 0 y 1 (sin incluir 1)')
+
+        rng = random.Random(options['seed'])
+        horizon_days = min(max(options['days'], 1), slot_search.MAX_HORIZON_DAYS)
+        now = timezone.localtime().replace(tzinfo=None)
+        start_date = now.date()
+
+        profiles_by_user, availabilities, busy = self._build_dataset(
+            rng, options['psychologists'], start_date, horizon_days, options['occupancy']
+        )
+        self.stdout.write(
+            f'🧠 {len(profiles_by_user)} psicólogos, {horizon_days} días, '
+            f'{options["occupancy"]:.0%} ocupado, limit={options["limit"]}'
+        )
+
+        args = (profiles_by_user, availabilities, busy, start_date, horizon_days, now, options['limit'])
+        full = self._measure(self._full_sort, args, options['repeat'])
+        merged = self._measure(slot_search.merge_free_slots, args, options['repeat'])
+
+        if [slot[1:] for slot in full[0]] != [slot[1:] for slot in merged[0]]:
+            raise CommandError('Las dos búsquedas no devuelven los mismos horarios')
+
+        self._report('Completa', full[1])
+        self._report('Merge', merged[1])
+        if merged[1]:
+            self.stdout.write(self.style.SUCCESS(f'📊 Merge es {full[1] / merged[1]:.1f}x más rápido'))
+
+    def _build_dataset(self, rng, count, start_date, horizon_days, occupancy):
+        profiles_by_user = {}
+        availabilities = {}
+        busy = {}
+        for user_id in range(1, count + 1):
+            profile = ProfessionalProfile(user_id=user_id, session_duration=rng.choice([45, 50, 60]))
+            profiles_by_user[user_id] = profile
+            availabilities[user_id] = [
+                PsychologistAvailability(
+                    psychologist_id=user_id,
+                    weekday=weekday,
+                    start_time=window_start,
+                    end_time=window_end,
+                    blocked_dates=[]
+                )
+                for weekday in range(5)
+                for window_start, window_end in WORKDAY_WINDOWS
+            ]
+
+            duration = timedelta(minutes=profile.session_duration)
+            for offset in range(horizon_days):
+                current_date = start_date + timedelta(days=offset)
+                if current_date.weekday() >= 5:
+                    continue
+                for window_start, window_end in WORKDAY_WINDOWS:
+                    slot_start = datetime.combine(current_date, window_start)
+                    window_close = datetime.combine(current_date, window_end)
+                    while slot_start + duration <= window_close:
+                        if rng.random() < occupancy:
+                            busy.setdefault(user_id, {}).setdefault(current_date, []).append(
+                                (slot_start.time(), (slot_start + duration).time())
+                            )
+                        slot_start += duration
+        return profiles_by_user, availabilities, busy
+
+    @staticmethod
+    def _full_sort(profiles_by_user, availabilities, busy, start_date, horizon_days, now, limit):
+        # Referencia: todos los horarios de todos los psicólogos, ordenados
+        slots = [
+            slot
+            for user_id, profile in profiles_by_user.items()
+            for slot in slot_search._free_slots(
+                profile, availabilities[user_id], busy.get(user_id, {}), start_date, horizon_days, now
+            )
+        ]
+        return [
+            (profiles_by_user[psychologist_id], slot_date, start_time, end_time)
+            for _, psychologist_id, slot_date, start_time, end_time in heapq.nsmallest(limit, slots)
+        ]
+
+    @staticmethod
+    def _measure(search, args, repeat):
+        """Devuelve (resultado, mejor tiempo en segundos)."""
+        best = None
+        result = None
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            result = search(*args)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return result, best
+
+    def _report(self, label, elapsed):
+        self.stdout.write(self.style.SUCCESS(f'⏱️ {label}: {elapsed * 1000:.2f} ms'))
@@ -0,0 +1,221 @@
+# apps/appointments/management/commands/check_query_plans.py
+
+"""
+Comando para verificar que las consultas principales de los endpoints
+usan su índice compuesto.
+
+Ejecutar con: python manage.py check_query_plans [--tenant mindcare] [--seed 20000]
+
+Cada consulta declara el índice que debe aparecer en el plan (no basta con
+que no haya Seq Scan: el planner podría usar otro índice, p. ej. el de la FK).
+Sin --seed se usan los datos y estadísticas reales del tenant. Con --seed N
+se insertan N filas representativas por tabla, se ejecuta ANALYZE y se
+inspeccionan los planes; todo dentro de una transacción que se revierte
+(pensado para schemas vacíos como el de los tests: ANALYZE deja el número de
+filas estimado de la tabla aunque se revierta).
+"""
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django_tenants.utils import schema_context, get_tenant_model
+
+from apps.appointments.models import Appointment
+from apps.chat.models import ChatMessage
+from apps.clinical_history.models import MedicationReminder
+from apps.payment_system.models import PaymentTransaction
+
+# Valores de los datos sembrados: pocos psicólogos, muchos pacientes y citas
+SEED_PSYCHOLOGISTS = 20
+SEED_APPOINTMENTS_PER_DAY = 8
+
+
+def get_hot_queries():
+    """
+    Devuelve (nombre, índice esperado, queryset) de las consultas críticas de cada endpoint.
+    Los valores concretos no importan: sólo se inspecciona el plan.
+    """
+    today = timezone.now().date()
+    return [
+        (
+            'appointments.psychologist_agenda',
+            'appt_psych_date_status_idx',
+            Appointment.objects.filter(
+                psychologist_id=1,
+                appointment_date__gte=today,
+                status__in=['pending', 'confirmed'],
+            ),
+        ),
+        (
+            'appointments.patient_history',
+            'appt_patient_date_idx',
+            Appointment.objects.filter(
+                patient_id=1,
+                appointment_date__lt=today,
+            ).order_by('-appointment_date'),
+        ),
+        (
+            'chat.messages_polling',
+            'chat_appt_id_idx',
+            ChatMessage.objects.filter(appointment_id=1, id__gt=0).order_by('id'),
+        ),
+        (
+            'clinical_history.due_reminders',
+            'med_reminder_active_time_idx',
+            MedicationReminder.objects.filter(
+                is_active=True,
+                time__range=(time(8, 0), time(8, 10)),
+            ),
+        ),
+        (
+            'payment_system.completed_payments',
+            'payment_status_paid_at_idx',
+            PaymentTransaction.objects.filter(
+                status='completed',
+                paid_at__gte=timezone.now() - timedelta(days=30),
+            ),
+        ),
+    ]
+
+
+def seed_rows(count):
+    """
+    Inserta `count` filas por tabla con una distribución parecida a la real.
+    Las FK de Django son DEFERRABLE INITIALLY DEFERRED, así que los ids de
+    usuario, cita o receta no necesitan existir: la transacción se revierte
+    antes de comprobarlas.
+    """
+    today = timezone.now().date()
+    now = timezone.now()
+    days = max(count // (SEED_PSYCHOLOGISTS * SEED_APPOINTMENTS_PER_DAY), 1)
+    first_day = today - timedelta(days=days * 5 // 6)
+    patients = max(count // 10, 1)
+
+    appointments = []
+    for index in range(count):
+        slot = index // SEED_PSYCHOLOGISTS
+        appointment_date = first_day + timedelta(days=slot // SEED_APPOINTMENTS_PER_DAY)
+        start = datetime.combine(appointment_date, time(8, 0)) + timedelta(
+            hours=slot % SEED_APPOINTMENTS_PER_DAY
+        )
+        if appointment_date < today:
+            status = 'cancelled' if index % 10 == 0 else 'completed'
+        else:
+            status = 'confirmed' if index % 2 else 'pending'
+        appointments.append(Appointment(
+            patient_id=index % patients + 1,
+            psychologist_id=index % SEED_PSYCHOLOGISTS + 1,
+            appointment_date=appointment_date,
+            start_time=start.time(),
+            end_time=(start + timedelta(minutes=50)).time(),
+            status=status,
+            consultation_fee=Decimal('50.00'),
+        ))
+    Appointment.objects.bulk_create(appointments, batch_size=2000)
+
+    ChatMessage.objects.bulk_create([
+        ChatMessage(
+            appointment_id=index % max(count // 20, 1) + 1,
+            sender_id=index % patients + 1,
+            message='Mensaje de prueba',
+        )
+        for index in range(count)
+    ], batch_size=2000)
+
+    MedicationReminder.objects.bulk_create([
+        MedicationReminder(
+            prescription_id=index % max(count // 3, 1) + 1,
+            time=time((index // 60) % 24, index % 60),
+            days_of_week=[0, 1, 2, 3, 4, 5, 6],
+            is_active=index % 5 != 0,
+        )
+        for index in range(count)
+    ], batch_size=2000)
+
+    PaymentTransaction.objects.bulk_create([
+        PaymentTransaction(
+            patient_id=index % patients + 1,
+            stripe_session_id=f'cs_seed_{index}',
+            amount=Decimal('50.00'),
+            status='completed' if index % 10 else 'failed',
+            paid_at=now - timedelta(hours=index % (2 * 365 * 24)) if index % 10 else None,
+        )
+        for index in range(count)
+    ], batch_size=2000)
+
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for model in (Appointment, ChatMessage, MedicationReminder, PaymentTransaction):
+            cursor.execute(f'ANALYZE {quote(model._meta.db_table)}')
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta EXPLAIN sobre las consultas principales y falla si alguna no usa su índice'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant',
+            type=str,
+            help='Schema del tenant específico (ej: mindcare, bienestar)',
+            default=None
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Filas representativas por tabla a insertar (y revertir) antes del EXPLAIN',
+        )
+        parser.add_argument(
+            '--verbose-plans',
+            action='store_true',
+            help='Mostrar el plan completo de cada consulta',
+        )
+
+    def handle(self, *args, **options):
+        specific_tenant = options.get('tenant')
+        verbose_plans = options.get('verbose_plans', False)
+
+        Tenant = get_tenant_model()
+        tenants = Tenant.objects.exclude(schema_name='public')
+        if specific_tenant:
+            tenants = tenants.filter(schema_name=specific_tenant)
+            if not tenants.exists():
+                raise CommandError(f'Tenant "{specific_tenant}" no encontrado')
+
+        failures = []
+
+        for tenant in tenants:
+            self.stdout.write(f'\n🏥 Procesando tenant: {tenant.schema_name}')
+
+            with schema_context(tenant.schema_name):
+                plans = self.explain_all(options['seed'])
+
+            for name, index_name, plan in plans:
+                if verbose_plans:
+                    self.stdout.write(plan)
+
+                if index_name not in plan:
+                    failures.append(f'{tenant.schema_name}:{name}')
+                    self.stdout.write(self.style.ERROR(f'  ❌ {name}: no usa {index_name}'))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f'  ✅ {name} ({index_name})'))
+
+        if failures:
+            raise CommandError(f'Consultas sin índice: {", ".join(failures)}')
+
+        self.stdout.write(self.style.SUCCESS('\n📊 Todas las consultas usan su índice'))
+
+    def explain_all(self, seed):
+        """Devuelve (nombre, índice, plan) de cada consulta. Siembra y revierte si seed > 0."""
+        with transaction.atomic():
+            if seed:
+                seed_rows(seed)
+            plans = [
+                (name, index_name, queryset.explain())
+                for name, index_name, queryset in get_hot_queries()
+            ]
+            transaction.set_rollback(True)
+        return plans
@@ -0,0 +1,154 @@
+# apps/appointments/management/commands/close_past_appointments.py
+
+"""
+Comando para cerrar las citas pasadas que quedaron en 'pending' o 'confirmed'.
+Ejecutar con: python manage.py close_past_appointments [--workers 4]
+
+- Citas confirmadas (o pendientes ya pagadas) -> 'no_show'
+- Citas pendientes sin pagar -> 'cancelled' (vencidas)
+
+Por cada tenant se ejecuta un único UPDATE ... RETURNING y las entradas de
+bitácora se insertan con un bulk_create en la misma transacción. Como sólo
+toca citas en 'pending'/'confirmed', es idempotente y puede correr como
+cron job cada pocos minutos.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from django_tenants.utils import schema_context, get_tenant_model
+
+from apps.appointments.models import Appointment
+from apps.appointments import schedule_cache
+from apps.auditlog.models import LogEntry
+from apps.clinic_admin import analytics
+
+CLOSE_PAST_APPOINTMENTS_SQL = """
+WITH stale AS (
+    SELECT id, status AS previous_status
+    FROM {table}
+    WHERE appointment_date < %(today)s
+      AND status IN ('pending', 'confirmed')
+    FOR UPDATE SKIP LOCKED
+)
+UPDATE {table} AS ap
+SET status = CASE
+        WHEN stale.previous_status = 'pending' AND NOT ap.is_paid THEN 'cancelled'
+        ELSE 'no_show'
+    END,
+    updated_at = %(now)s
+FROM stale
+WHERE ap.id = stale.id
+RETURNING ap.id, ap.psychologist_id, ap.patient_id, ap.appointment_date,
+          stale.previous_status, ap.status
+"""
+
+STATUS_MESSAGES = {
+    'no_show': 'marcada como no asistida',
+    'cancelled': 'cancelada por vencimiento (pendiente sin pagar)',
+}
+
+
+def close_past_appointments(today=None):
+    """
+    Cierra las citas pasadas del tenant actual y registra la bitácora.
+    Devuelve la lista de filas actualizadas
+    (id, psychologist_id, patient_id, fecha, estado_anterior, estado_nuevo).
+    """
+    now = timezone.now()
+    sql = CLOSE_PAST_APPOINTMENTS_SQL.format(
+        table=connection.ops.quote_name(Appointment._meta.db_table)
+    )
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {'today': today or timezone.localdate(), 'now': now})
+            rows = cursor.fetchall()
+
+        LogEntry.objects.bulk_create([
+            LogEntry(
+                level='INFO',
+                action=f'Cita {appointment_id} {STATUS_MESSAGES[new_status]} (proceso automático)',
+                details={
+                    'appointment_id': appointment_id,
+                    'psychologist_id': psychologist_id,
+                    'patient_id': patient_id,
+                    'appointment_date': appointment_date.isoformat(),
+                    'previous_status': previous_status,
+                    'new_status': new_status,
+                },
+            )
+            for appointment_id, psychologist_id, patient_id, appointment_date, previous_status, new_status in rows
+        ], batch_size=500)
+
+    # El UPDATE no dispara señales: invalidamos las cachés aquí
+    if rows:
+        for psychologist_id, appointment_date in {(row[1], row[3]) for row in rows}:
+            schedule_cache.invalidate_date(psychologist_id, appointment_date)
+        analytics.invalidate()
+
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Marca como no asistidas o vencidas las citas pasadas de todos los tenants'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Número máximo de tenants procesados en paralelo (por defecto 4)'
+        )
+
+    def handle(self, *args, **options):
+        Tenant = get_tenant_model()
+        schema_names = list(
+            Tenant.objects.exclude(schema_name='public').values_list('schema_name', flat=True)
+        )
+        today = timezone.localdate()
+
+        total_no_show = 0
+        total_cancelled = 0
+        errors = 0
+
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            futures = {
+                executor.submit(self._process_tenant, schema_name, today): schema_name
+                for schema_name in schema_names
+            }
+            for future in as_completed(futures):
+                schema_name = futures[future]
+                try:
+                    rows = future.result()
+                except Exception as e:
+                    errors += 1
+                    self.stdout.write(self.style.ERROR(f'❌ {schema_name}: {e}'))
+                    continue
+
+                no_show = sum(1 for row in rows if row[5] == 'no_show')
+                cancelled = len(rows) - no_show
+                if rows:
+                    self.stdout.write(
+                        f'🏥 {schema_name}: {no_show} no asistidas, {cancelled} vencidas'
+                    )
+                total_no_show += no_show
+                total_cancelled += cancelled
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'📊 Total: {total_no_show} no asistidas, {total_cancelled} vencidas '
+                f'en {len(schema_names)} tenants ({errors} con errores)'
+            )
+        )
+
+    @staticmethod
+    def _process_tenant(schema_name, today):
+        # Cada hilo usa su propia conexión; se cierra al terminar el tenant
+        try:
+            with schema_context(schema_name):
+                return close_past_appointments(today)
+        finally:
+            connection.close()
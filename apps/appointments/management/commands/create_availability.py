@@ -2,7 +2,10 @@
 
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from apps.appointments.models import PsychologistAvailability
+from apps.appointments import schedule_cache
+from apps.clinic_admin import analytics
 from datetime import time
 
 User = get_user_model()
@@ -37,14 +40,11 @@ class Command(BaseCommand):
             (time(17, 0), time(21, 0)),
         ]
         
-        created_count = 0
+        new_availabilities = []
         
         for psychologist in psychologists:
             self.stdout.write(f'Creando disponibilidad para {psychologist.get_full_name()}...')
             
-            # Limpiar disponibilidad existente
-            PsychologistAvailability.objects.filter(psychologist=psychologist).delete()
-            
             # Asignar horarios variados
             if psychologist.id % 3 == 0:
                 # Horario matutino (Lunes a Viernes)
@@ -60,35 +60,37 @@ class Command(BaseCommand):
                 days = [1, 2, 3, 4, 5]  # Mar-Sáb
             
             for day in days:
-                availability = PsychologistAvailability.objects.create(
+                new_availabilities.append(PsychologistAvailability(
                     psychologist=psychologist,
                     weekday=day,
                     start_time=schedule[0],
                     end_time=schedule[1],
                     is_active=True
-                )
-                created_count += 1
+                ))
             
             # Algunos psicólogos también trabajan en horario adicional
             if psychologist.id % 2 == 0:
-                # Agregar horario de tarde algunos días
+                # Agregar horario de tarde algunos días (19:00 no coincide con ningún horario base)
                 extra_days = [1, 3]  # Martes y Jueves
                 extra_schedule = (time(19, 0), time(21, 0))
                 
                 for day in extra_days:
-                    if not PsychologistAvailability.objects.filter(
+                    new_availabilities.append(PsychologistAvailability(
                         psychologist=psychologist,
                         weekday=day,
-                        start_time=extra_schedule[0]
-                    ).exists():
-                        PsychologistAvailability.objects.create(
-                            psychologist=psychologist,
-                            weekday=day,
-                            start_time=extra_schedule[0],
-                            end_time=extra_schedule[1],
-                            is_active=True
-                        )
-                        created_count += 1
+                        start_time=extra_schedule[0],
+                        end_time=extra_schedule[1],
+                        is_active=True
+                    ))
+        
+        # Limpiar la disponibilidad existente y crear la nueva en lote
+        with transaction.atomic():
+            PsychologistAvailability.objects.filter(psychologist__in=psychologists).delete()
+            created_count = len(PsychologistAvailability.objects.bulk_create(new_availabilities))
+        
+        for psychologist in psychologists:
+            schedule_cache.invalidate_psychologist(psychologist.id)
+        analytics.invalidate()
         
         self.stdout.write(
             self.style.SUCCESS(
@@ -0,0 +1,45 @@
+# apps/appointments/management/commands/release_expired_holds.py
+
+"""
+Comando para liberar las reservas temporales (SlotHold) vencidas y volver
+a ofrecer esos horarios a la lista de espera.
+Ejecutar con: python manage.py release_expired_holds
+
+En producción lo ejecuta cada minuto el cron release-expired-holds de render.yaml.
+"""
+
+from django.core.management.base import BaseCommand
+from django_tenants.utils import schema_context, get_tenant_model
+
+from apps.appointments.holds import release_expired_holds
+from apps.appointments import waitlist
+
+
+class Command(BaseCommand):
+    help = 'Libera en lote las reservas temporales de horario vencidas en todos los tenants'
+
+    def handle(self, *args, **options):
+        Tenant = get_tenant_model()
+        tenants = Tenant.objects.exclude(schema_name='public')
+
+        total_released = 0
+
+        for tenant in tenants:
+            with schema_context(tenant.schema_name):
+                # Primero vencen las ofertas (vuelven a 'waiting'; find_candidates
+                # no reofrece el mismo horario a quien lo dejó vencer)
+                expired_offers = waitlist.expire_offers()
+                released = release_expired_holds()
+                offered = waitlist.offer_released_slots(released)
+                waitlist.close_expired_entries()
+
+            if released or expired_offers:
+                self.stdout.write(
+                    f'🏥 {tenant.schema_name}: {len(released)} reservas liberadas, '
+                    f'{expired_offers} ofertas vencidas, {offered} horarios reofrecidos'
+                )
+            total_released += len(released)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'📊 Total de reservas liberadas: {total_released}')
+        )
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-19 11:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY no puede ejecutarse dentro de una transacción
+    atomic = False
+
+    dependencies = [
+        ('appointments', '0006_calendarfeedtoken'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='appointment',
+            index=models.Index(fields=['psychologist', 'updated_at'], name='appt_psych_updated_idx'),
+        ),
+    ]
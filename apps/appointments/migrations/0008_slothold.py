@@ -0,0 +1,40 @@
+# Generated by Django 5.1.4 on 2026-10-19 12:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0007_appointment_appt_psych_updated_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appointment_date', models.DateField()),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('appointment_type', models.CharField(choices=[('online', 'En línea'), ('in_person', 'Presencial')], default='in_person', max_length=20)),
+                ('reason_for_visit', models.TextField(blank=True)),
+                ('notes', models.TextField(blank=True)),
+                ('consultation_fee', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('stripe_session_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('patient', models.ForeignKey(limit_choices_to={'user_type': 'patient'}, on_delete=django.db.models.deletion.CASCADE, related_name='slot_holds_made', to=settings.AUTH_USER_MODEL)),
+                ('psychologist', models.ForeignKey(limit_choices_to={'user_type': 'professional'}, on_delete=django.db.models.deletion.CASCADE, related_name='slot_holds', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Reserva Temporal',
+                'verbose_name_plural': 'Reservas Temporales',
+                'indexes': [models.Index(fields=['psychologist', 'appointment_date'], name='hold_psych_date_idx')],
+                'unique_together': {('psychologist', 'appointment_date', 'start_time')},
+            },
+        ),
+    ]
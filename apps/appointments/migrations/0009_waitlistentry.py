@@ -0,0 +1,47 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0008_slothold'),
+        ('professionals', '0004_careplan'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_from', models.DateField()),
+                ('date_to', models.DateField()),
+                ('preferred_start_time', models.TimeField(blank=True, null=True)),
+                ('preferred_end_time', models.TimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('waiting', 'En espera'), ('offered', 'Horario ofrecido'), ('booked', 'Agendada'), ('expired', 'Oferta vencida'), ('cancelled', 'Cancelada')], default='waiting', max_length=10)),
+                ('offer_date', models.DateField(blank=True, null=True)),
+                ('offer_start_time', models.TimeField(blank=True, null=True)),
+                ('offer_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('offer_psychologist', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('patient', models.ForeignKey(limit_choices_to={'user_type': 'patient'}, on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to=settings.AUTH_USER_MODEL)),
+                ('psychologist', models.ForeignKey(blank=True, limit_choices_to={'user_type': 'professional'}, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_requests', to=settings.AUTH_USER_MODEL)),
+                ('specialization', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='professionals.specialization')),
+            ],
+            options={
+                'verbose_name': 'Lista de Espera',
+                'verbose_name_plural': 'Listas de Espera',
+                'ordering': ['created_at'],
+                'indexes': [
+                    models.Index(fields=['status', 'date_from', 'date_to'], name='waitlist_status_dates_idx'),
+                    models.Index(fields=['psychologist', 'status'], name='waitlist_psych_status_idx'),
+                    models.Index(fields=['specialization', 'status'], name='waitlist_spec_status_idx'),
+                    models.Index(fields=['status', 'offer_expires_at'], name='waitlist_offer_expiry_idx'),
+                ],
+            },
+        ),
+    ]
@@ -5,6 +5,7 @@ from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from datetime import datetime, timedelta
+import secrets
 
 class PsychologistAvailability(models.Model):
     """
@@ -131,7 +132,22 @@ class Appointment(models.Model):
     
     class Meta:
         ordering = ['-appointment_date', '-start_time']
-        unique_together = ['psychologist', 'appointment_date', 'start_time']
+        constraints = [
+            # Un horario cancelado puede volver a agendarse
+            models.UniqueConstraint(
+                fields=['psychologist', 'appointment_date', 'start_time'],
+                condition=~models.Q(status='cancelled'),
+                name='appt_unique_active_slot'
+            ),
+        ]
+        indexes = [
+            # Agenda del psicólogo filtrada por fecha y estado
+            models.Index(fields=['psychologist', 'appointment_date', 'status'], name='appt_psych_date_status_idx'),
+            # Citas del paciente ordenadas por fecha
+            models.Index(fields=['patient', 'appointment_date'], name='appt_patient_date_idx'),
+            # Marca de agua del feed iCalendar: MAX(updated_at) por psicólogo
+            models.Index(fields=['psychologist', 'updated_at'], name='appt_psych_updated_idx'),
+        ]
         verbose_name = 'Cita'
         verbose_name_plural = 'Citas'
     
@@ -199,6 +215,168 @@ class Appointment(models.Model):
         return f"{self.patient.get_full_name()} con {self.psychologist.get_full_name()} - {self.appointment_date} {self.start_time}"
 
 
+class SlotHold(models.Model):
+    """
+    Reserva temporal (lease) de un horario mientras el paciente paga.
+    Sustituye a las citas 'pending' fantasma: si el pago no se completa
+    antes de expires_at, el reaper la borra y el horario queda libre.
+    """
+    psychologist = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='slot_holds',
+        limit_choices_to={'user_type': 'professional'}
+    )
+    patient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='slot_holds_made',
+        limit_choices_to={'user_type': 'patient'}
+    )
+    appointment_date = models.DateField()
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    # Datos para crear la cita al confirmar el pago
+    appointment_type = models.CharField(
+        max_length=20,
+        choices=Appointment.APPOINTMENT_TYPE,
+        default='in_person'
+    )
+    reason_for_visit = models.TextField(blank=True)
+    notes = models.TextField(blank=True)
+    consultation_fee = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+    stripe_session_id = models.CharField(max_length=255, blank=True, null=True)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # Dos checkouts concurrentes no pueden retener el mismo horario
+        unique_together = ['psychologist', 'appointment_date', 'start_time']
+        indexes = [
+            models.Index(fields=['psychologist', 'appointment_date'], name='hold_psych_date_idx'),
+        ]
+        verbose_name = 'Reserva Temporal'
+        verbose_name_plural = 'Reservas Temporales'
+
+    @property
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
+
+    def __str__(self):
+        return f"Reserva {self.appointment_date} {self.start_time} hasta {self.expires_at}"
+
+
+class WaitlistEntry(models.Model):
+    """
+    Lista de espera: el paciente quiere un horario con un psicólogo concreto
+    (o de una especialidad) dentro de una ventana de fechas y horas.
+    Cuando se libera un horario compatible se le ofrece con una reserva corta.
+    """
+    STATUS_CHOICES = [
+        ('waiting', 'En espera'),
+        ('offered', 'Horario ofrecido'),
+        ('booked', 'Agendada'),
+        ('expired', 'Oferta vencida'),
+        ('cancelled', 'Cancelada'),
+    ]
+
+    patient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='waitlist_entries',
+        limit_choices_to={'user_type': 'patient'}
+    )
+    # Uno de los dos: psicólogo concreto o cualquier psicólogo de la especialidad
+    psychologist = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='waitlist_requests',
+        limit_choices_to={'user_type': 'professional'}
+    )
+    specialization = models.ForeignKey(
+        'professionals.Specialization',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='waitlist_entries'
+    )
+
+    date_from = models.DateField()
+    date_to = models.DateField()
+    # Franja horaria preferida (vacía = cualquier hora)
+    preferred_start_time = models.TimeField(null=True, blank=True)
+    preferred_end_time = models.TimeField(null=True, blank=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='waiting')
+
+    # Horario ofrecido (la reserva temporal correspondiente es un SlotHold)
+    offer_psychologist = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    offer_date = models.DateField(null=True, blank=True)
+    offer_start_time = models.TimeField(null=True, blank=True)
+    offer_expires_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            # Búsqueda de candidatos por rango de fechas
+            models.Index(fields=['status', 'date_from', 'date_to'], name='waitlist_status_dates_idx'),
+            models.Index(fields=['psychologist', 'status'], name='waitlist_psych_status_idx'),
+            models.Index(fields=['specialization', 'status'], name='waitlist_spec_status_idx'),
+            # Vencimiento de ofertas
+            models.Index(fields=['status', 'offer_expires_at'], name='waitlist_offer_expiry_idx'),
+        ]
+        verbose_name = 'Lista de Espera'
+        verbose_name_plural = 'Listas de Espera'
+
+    def clean(self):
+        if not self.psychologist_id and not self.specialization_id:
+            raise ValidationError('Debe indicar un psicólogo o una especialización')
+        if self.date_from > self.date_to:
+            raise ValidationError('La fecha inicial debe ser anterior a la final')
+
+    def __str__(self):
+        return f"{self.patient.get_full_name()} en espera ({self.date_from} - {self.date_to})"
+
+
+class CalendarFeedToken(models.Model):
+    """
+    Token secreto para el feed iCalendar (.ics) de un psicólogo.
+    Los clientes de calendario no envían cabeceras de autenticación,
+    así que el token va en la URL y puede regenerarse si se filtra.
+    """
+    psychologist = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='calendar_feed_token',
+        limit_choices_to={'user_type': 'professional'}
+    )
+    token = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Token de Calendario'
+        verbose_name_plural = 'Tokens de Calendario'
+
+    @staticmethod
+    def generate_token():
+        return secrets.token_urlsafe(32)
+
+    def __str__(self):
+        return f"Feed iCal de {self.psychologist.get_full_name()}"
+
+
 class TimeSlot(models.Model):
     """
     Modelo auxiliar para generar slots de tiempo disponibles
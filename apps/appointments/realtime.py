@@ -0,0 +1,164 @@
+# apps/appointments/realtime.py
+
+"""
+Publicación en tiempo real de cambios de disponibilidad (WebSocket).
+
+Grupos de channels:
+- availability_<tenant>_<psicólogo>_<lunes ISO>: cambios de horarios de esa semana.
+- availability_<tenant>_<psicólogo>: cambios que afectan a todas las semanas
+  (disponibilidad semanal o perfil), que obligan a recargar el horario.
+
+Los cambios se acumulan en un lote por transacción (y por savepoint) que se
+publica con on_commit, un mensaje por grupo: una ráfaga dentro de la misma
+transacción (p. ej. un bulk_create de citas recurrentes) produce un solo
+evento. Si la transacción o el savepoint se revierte, Django descarta el
+callback y el lote con él. El consumidor agrupa además los eventos que
+llegan dentro de una ventana corta.
+
+Sin REALTIME_PUBLISH (WSGI sin Redis) no se encola nada.
+"""
+
+import logging
+import threading
+import weakref
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_pending = threading.local()
+
+
+def _tenant():
+    return getattr(connection, 'schema_name', 'public')
+
+
+def week_monday(day):
+    return day - timedelta(days=day.weekday())
+
+
+def psychologist_group(psychologist_id, tenant=None):
+    return f'availability_{tenant or _tenant()}_{psychologist_id}'
+
+
+def week_group(psychologist_id, monday, tenant=None):
+    return f'{psychologist_group(psychologist_id, tenant)}_{monday.isoformat()}'
+
+
+class _Batch:
+    """Cambios de una transacción: {grupo: {'psychologist_id', 'changes', 'refresh'}}"""
+
+    def __init__(self, key=None):
+        self.key = key
+        self.groups = {}
+
+    def __call__(self):
+        # Django mantiene el callback vivo hasta terminar todos los on_commit:
+        # un cambio hecho desde otro callback debe empezar un lote nuevo
+        batches = getattr(_pending, 'batches', {})
+        if batches.get(self.key) is self:
+            del batches[self.key]
+        _publish(self.groups)
+
+
+def _current_batch():
+    """
+    Lote del savepoint en curso (o de la transacción si no hay savepoints).
+    Los lotes se guardan por tuple(connection.savepoint_ids) en un diccionario
+    de referencias débiles: la única referencia fuerte es la que guarda
+    on_commit. Cuando Django descarta el callback (se revirtió el savepoint o
+    la transacción) el lote desaparece y el siguiente cambio empieza uno
+    nuevo, aunque los ids de savepoint se repitan en otra transacción.
+    Sólo se reutiliza el último lote creado: si entretanto se abrió otro en
+    un savepoint, los lotes se publican en el orden en que ocurrieron los
+    cambios.
+    """
+    batches = getattr(_pending, 'batches', None)
+    if batches is None:
+        batches = _pending.batches = weakref.WeakValueDictionary()
+        _pending.last = lambda: None
+
+    key = tuple(connection.savepoint_ids)
+    batch = batches.get(key)
+    last = _pending.last()
+    if batch is None or (last is not None and last is not batch):
+        batch = batches[key] = _Batch(key)
+        _pending.last = weakref.ref(batch)
+        transaction.on_commit(batch)
+    return batch
+
+
+def _queue(group, psychologist_id, change=None, refresh=False):
+    if not settings.REALTIME_PUBLISH:
+        return
+
+    # Fuera de una transacción (autocommit) el cambio ya es definitivo
+    batch = _current_batch() if connection.in_atomic_block else _Batch()
+    entry = batch.groups.setdefault(group, {
+        'psychologist_id': psychologist_id,
+        'changes': {},
+        'refresh': False,
+    })
+    if change is not None:
+        # El último cambio de un mismo horario reemplaza a los anteriores
+        entry['changes'][(change['date'], change.get('start_time'))] = change
+    entry['refresh'] = entry['refresh'] or refresh
+
+    if not connection.in_atomic_block:
+        batch()
+
+
+def _publish(groups):
+    if not groups:
+        return
+
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    for group, entry in groups.items():
+        try:
+            async_to_sync(channel_layer.group_send)(group, {
+                'type': 'availability.changed',
+                'psychologist_id': entry['psychologist_id'],
+                'changes': list(entry['changes'].values()),
+                'refresh': entry['refresh'],
+            })
+        except Exception as e:
+            # Un fallo del channel layer nunca debe romper la operación original
+            logger.warning(f'No se pudo publicar el cambio de disponibilidad en {group}: {e}')
+
+
+def slot_changed(psychologist_id, slot_date, start_time, end_time, state):
+    """
+    Publica el nuevo estado de un horario concreto.
+    state: 'busy' (cita o reserva activa) o 'free' (horario liberado).
+    """
+    _queue(
+        week_group(psychologist_id, week_monday(slot_date)),
+        psychologist_id,
+        change={
+            'date': slot_date.isoformat(),
+            'start_time': start_time.strftime('%H:%M'),
+            'end_time': end_time.strftime('%H:%M'),
+            'state': state,
+        }
+    )
+
+
+def date_changed(psychologist_id, slot_date):
+    """Publica que un día cambió sin detallar el horario (p. ej. una cita reprogramada)."""
+    _queue(
+        week_group(psychologist_id, week_monday(slot_date)),
+        psychologist_id,
+        change={'date': slot_date.isoformat(), 'refresh': True}
+    )
+
+
+def psychologist_changed(psychologist_id):
+    """Publica que cambió la disponibilidad semanal: los clientes recargan el horario."""
+    _queue(psychologist_group(psychologist_id), psychologist_id, refresh=True)
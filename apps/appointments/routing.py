@@ -0,0 +1,7 @@
+# apps/appointments/routing.py
+from django.urls import re_path
+from . import consumers
+
+websocket_urlpatterns = [
+    re_path(r'ws/availability/(?P<psychologist_id>\d+)/$', consumers.AvailabilityConsumer.as_asgi()),
+]
@@ -0,0 +1,108 @@
+# apps/appointments/schedule_cache.py
+
+"""
+Caché del horario semanal de cada psicólogo (get_psychologist_schedule).
+
+Clave: (tenant, psicólogo, versión, week_start). La versión del psicólogo se
+incrementa cuando cambia su disponibilidad o su perfil, lo que invalida de
+golpe todas sus semanas sin tener que recorrer claves. Los cambios de una
+cita sólo invalidan las semanas que contienen su fecha.
+
+Requiere una caché compartida entre procesos (Redis, ver REDIS_URL en
+settings): con LocMemCache cada worker tiene su propia copia y las
+invalidaciones sólo llegan al proceso que hizo el cambio, así que los demás
+servirían horarios viejos hasta SCHEDULE_CACHE_TIMEOUT.
+"""
+
+import hashlib
+import json
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+
+SCHEDULE_CACHE_TIMEOUT = 60 * 60  # 1 hora
+STATS_HITS_KEY = 'schedule_cache:hits'
+STATS_MISSES_KEY = 'schedule_cache:misses'
+
+
+def _tenant():
+    return getattr(connection, 'schema_name', 'public')
+
+
+def _version_key(psychologist_id):
+    return f'schedule_cache:{_tenant()}:{psychologist_id}:version'
+
+
+def _get_version(psychologist_id):
+    return cache.get_or_set(_version_key(psychologist_id), 1, timeout=None)
+
+
+def _schedule_key(psychologist_id, week_start, version=None):
+    if version is None:
+        version = _get_version(psychologist_id)
+    return f'schedule_cache:{_tenant()}:{psychologist_id}:v{version}:{week_start.isoformat()}'
+
+
+def compute_etag(payload):
+    """ETag fuerte calculado sobre el JSON canónico del payload."""
+    raw = json.dumps(payload, cls=DjangoJSONEncoder, sort_keys=True)
+    return '"' + hashlib.sha1(raw.encode('utf-8')).hexdigest() + '"'
+
+
+def get_cached_schedule(psychologist_id, week_start):
+    """Devuelve (payload, etag) o None, y actualiza los contadores de aciertos."""
+    entry = cache.get(_schedule_key(psychologist_id, week_start))
+    _incr(STATS_HITS_KEY if entry is not None else STATS_MISSES_KEY)
+    return entry
+
+
+def set_cached_schedule(psychologist_id, week_start, payload):
+    etag = compute_etag(payload)
+    cache.set(
+        _schedule_key(psychologist_id, week_start),
+        (payload, etag),
+        SCHEDULE_CACHE_TIMEOUT
+    )
+    return etag
+
+
+def invalidate_psychologist(psychologist_id):
+    """Invalida todas las semanas de un psicólogo subiendo su versión."""
+    key = _version_key(psychologist_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, timeout=None)
+
+
+def invalidate_date(psychologist_id, appointment_date):
+    """
+    Invalida las semanas que contienen la fecha. week_start puede ser
+    cualquier día, así que son los 7 inicios posibles [fecha-6, fecha].
+    """
+    version = _get_version(psychologist_id)
+    cache.delete_many([
+        _schedule_key(psychologist_id, appointment_date - timedelta(days=offset), version)
+        for offset in range(7)
+    ])
+
+
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def get_stats():
+    hits = cache.get(STATS_HITS_KEY, 0)
+    misses = cache.get(STATS_MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else 0.0,
+    }
@@ -2,10 +2,13 @@
 
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Appointment, PsychologistAvailability, TimeSlot
+from .models import Appointment, PsychologistAvailability, TimeSlot, WaitlistEntry
 from apps.professionals.serializers import ProfessionalProfileSerializer
 from datetime import datetime, timedelta
 from apps.payment_system.models import PatientPlan
+from django.db import IntegrityError, connection, transaction
+from . import schedule_cache, holds, realtime
+from apps.clinic_admin import analytics
 
 User = get_user_model()
 
@@ -32,6 +35,154 @@ class PsychologistAvailabilitySerializer(serializers.ModelSerializer):
         return data
 
 
+class WeeklyIntervalSerializer(serializers.Serializer):
+    weekday = serializers.ChoiceField(choices=PsychologistAvailability.WEEKDAYS)
+    start_time = serializers.TimeField()
+    end_time = serializers.TimeField()
+
+    def validate(self, data):
+        if data['start_time'] >= data['end_time']:
+            raise serializers.ValidationError(
+                "La hora de inicio debe ser menor que la hora de fin"
+            )
+        return data
+
+
+class WeeklyTemplateSerializer(serializers.Serializer):
+    """
+    Plantilla semanal completa de un psicólogo. Se compara en memoria con
+    las filas existentes y se aplica con un bulk_create, un bulk_update y
+    un DELETE dentro de una transacción. Se usa con apply(psicólogo), no
+    con save().
+    """
+    intervals = WeeklyIntervalSerializer(many=True, allow_empty=True)
+    # Si es True sólo se calcula el diff y las citas afectadas, sin guardar
+    dry_run = serializers.BooleanField(default=False)
+
+    def validate_intervals(self, intervals):
+        by_weekday = {}
+        for interval in intervals:
+            by_weekday.setdefault(interval['weekday'], []).append(interval)
+
+        for weekday, day_intervals in by_weekday.items():
+            day_intervals.sort(key=lambda i: i['start_time'])
+            for previous, current in zip(day_intervals, day_intervals[1:]):
+                if current['start_time'] == previous['start_time']:
+                    raise serializers.ValidationError(
+                        f"El horario del día {weekday} a las {current['start_time']} está repetido"
+                    )
+                if current['start_time'] < previous['end_time']:
+                    raise serializers.ValidationError(
+                        f"Los horarios del día {weekday} se solapan "
+                        f"({previous['start_time']}-{previous['end_time']} y "
+                        f"{current['start_time']}-{current['end_time']})"
+                    )
+        return intervals
+
+    def compute_diff(self, psychologist):
+        """
+        Devuelve (a_crear, a_actualizar, ids_a_borrar) comparando en memoria.
+        Bloquea las filas leídas: hay que llamarlo dentro de una transacción.
+        """
+        # Se agrupa por (día, hora de inicio) sin perder filas: si hubiera más
+        # de una con la misma clave, se conserva la primera y el resto se borra
+        existing = {}
+        duplicates = []
+        for availability in PsychologistAvailability.objects.select_for_update().filter(
+            psychologist=psychologist
+        ).order_by('id'):
+            key = (availability.weekday, availability.start_time)
+            if key in existing:
+                duplicates.append(availability.id)
+            else:
+                existing[key] = availability
+
+        to_create, to_update = [], []
+        desired_keys = set()
+        for interval in self.validated_data['intervals']:
+            key = (interval['weekday'], interval['start_time'])
+            desired_keys.add(key)
+            current = existing.get(key)
+            if current is None:
+                to_create.append(PsychologistAvailability(
+                    psychologist=psychologist,
+                    weekday=interval['weekday'],
+                    start_time=interval['start_time'],
+                    end_time=interval['end_time'],
+                    is_active=True
+                ))
+            elif current.end_time != interval['end_time'] or not current.is_active:
+                # Se conservan las fechas bloqueadas de la fila existente
+                current.end_time = interval['end_time']
+                current.is_active = True
+                to_update.append(current)
+
+        to_delete = duplicates + [
+            availability.id for key, availability in existing.items()
+            if key not in desired_keys
+        ]
+        return to_create, to_update, to_delete
+
+    def orphaned_appointments(self, psychologist):
+        """Citas futuras activas que quedarían fuera de la nueva plantilla."""
+        by_weekday = {}
+        for interval in self.validated_data['intervals']:
+            by_weekday.setdefault(interval['weekday'], []).append(interval)
+
+        appointments = Appointment.objects.filter(
+            psychologist=psychologist,
+            appointment_date__gte=datetime.now().date(),
+            status__in=['pending', 'confirmed']
+        ).select_related('patient').only(
+            'id', 'appointment_date', 'start_time', 'end_time', 'status',
+            'patient__id', 'patient__first_name', 'patient__last_name'
+        ).order_by('appointment_date', 'start_time')
+
+        return [
+            appointment for appointment in appointments
+            if not any(
+                interval['start_time'] <= appointment.start_time and
+                appointment.end_time <= interval['end_time']
+                for interval in by_weekday.get(appointment.appointment_date.weekday(), [])
+            )
+        ]
+
+    def apply(self, psychologist):
+        # El diff se calcula con las filas bloqueadas: dos envíos simultáneos
+        # de la plantilla se aplican uno detrás de otro sobre datos frescos
+        with transaction.atomic():
+            to_create, to_update, to_delete = self.compute_diff(psychologist)
+            if not self.validated_data['dry_run']:
+                PsychologistAvailability.objects.bulk_create(to_create)
+                PsychologistAvailability.objects.bulk_update(to_update, ['end_time', 'is_active'])
+                PsychologistAvailability.objects.filter(id__in=to_delete).delete()
+        orphaned = self.orphaned_appointments(psychologist)
+
+        if not self.validated_data['dry_run']:
+            # bulk_create y bulk_update no disparan señales (el DELETE sí envía
+            # post_delete por fila); se invalida una sola vez para todo el cambio
+            schedule_cache.invalidate_psychologist(psychologist.id)
+            realtime.psychologist_changed(psychologist.id)
+            analytics.invalidate()
+
+        return {
+            'created': len(to_create),
+            'updated': len(to_update),
+            'deleted': len(to_delete),
+            'orphaned_appointments': [
+                {
+                    'id': appointment.id,
+                    'patient_name': appointment.patient.get_full_name(),
+                    'appointment_date': appointment.appointment_date,
+                    'start_time': appointment.start_time,
+                    'end_time': appointment.end_time,
+                    'status': appointment.status,
+                }
+                for appointment in orphaned
+            ],
+        }
+
+
 class TimeSlotSerializer(serializers.ModelSerializer):
     psychologist_name = serializers.CharField(source='psychologist.get_full_name', read_only=True)
     
@@ -131,6 +282,19 @@ class AppointmentSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError(
                     "Ya existe una cita en este horario"
                 )
+
+            # Las reservas de checkout de otros pacientes también ocupan el horario
+            held = holds.active_holds(psychologist.id, appointment_date).filter(
+                start_time__lt=calculated_end_time,
+                end_time__gt=start_time
+            )
+            request = self.context.get('request')
+            if request is not None:
+                held = held.exclude(patient=request.user)
+            if held.exists():
+                raise serializers.ValidationError(
+                    "Este horario está reservado temporalmente por otro paciente"
+                )
         
         return data
 
@@ -167,6 +331,20 @@ class AppointmentCreateSerializer(serializers.ModelSerializer):
         # --- (Validación de horario...) ---
         # ... (Copia tu lógica de validación de horario aquí) ...
 
+        # Un horario retenido por el checkout de otro paciente no se puede agendar
+        if hasattr(psychologist, 'professional_profile'):
+            end_time = (
+                datetime.combine(appointment_date, start_time) +
+                timedelta(minutes=psychologist.professional_profile.session_duration)
+            ).time()
+            if holds.active_holds(psychologist.id, appointment_date).filter(
+                start_time__lt=end_time,
+                end_time__gt=start_time
+            ).exclude(patient=patient).exists():
+                raise serializers.ValidationError(
+                    "Este horario está reservado temporalmente por otro paciente"
+                )
+
 
         # --- 👇 NUEVA LÓGICA DE VALIDACIÓN DE PLAN (CU-44) 👇 ---
         if patient_plan_id:
@@ -232,6 +410,255 @@ class AppointmentCreateSerializer(serializers.ModelSerializer):
         return appointment
 
 
+class RecurringAppointmentSerializer(serializers.Serializer):
+    """
+    Reserva de una serie de citas (ej: todos los martes a las 10:00 durante 8 semanas).
+    Valida todas las fechas con una consulta de disponibilidad y una de citas,
+    e inserta las aceptadas con un solo bulk_create.
+    """
+    FREQUENCY_DAYS = {'weekly': 7, 'biweekly': 14}
+    MAX_OCCURRENCES = 52
+    BOOKING_ATTEMPTS = 2
+
+    psychologist = serializers.PrimaryKeyRelatedField(
+        queryset=User.objects.filter(user_type='professional', is_active=True)
+    )
+    start_date = serializers.DateField()
+    start_time = serializers.TimeField()
+    frequency = serializers.ChoiceField(choices=list(FREQUENCY_DAYS), default='weekly')
+    occurrences = serializers.IntegerField(min_value=1, max_value=MAX_OCCURRENCES)
+    appointment_type = serializers.ChoiceField(choices=Appointment.APPOINTMENT_TYPE, default='in_person')
+    reason_for_visit = serializers.CharField(required=False, allow_blank=True, default='')
+    patient_plan_id = serializers.IntegerField(required=False, allow_null=True)
+    # Si es True, un solo conflicto cancela toda la serie
+    all_or_nothing = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if data['start_date'] < datetime.now().date():
+            raise serializers.ValidationError("No se pueden agendar citas en fechas pasadas")
+
+        if not hasattr(data['psychologist'], 'professional_profile'):
+            raise serializers.ValidationError("No se pudo determinar la duración de la sesión.")
+
+        interval = timedelta(days=self.FREQUENCY_DAYS[data['frequency']])
+        data['dates'] = [
+            data['start_date'] + interval * i for i in range(data['occurrences'])
+        ]
+        return data
+
+    def _find_conflicts(self, psychologist, dates, start_time, end_time):
+        """
+        Devuelve {fecha: motivo} para las fechas no reservables, usando una
+        consulta para las disponibilidades y otra (por rango) para las citas.
+        """
+        availabilities = {}
+        for availability in PsychologistAvailability.objects.filter(
+            psychologist=psychologist,
+            is_active=True,
+            weekday__in={d.weekday() for d in dates}
+        ):
+            availabilities.setdefault(availability.weekday, []).append(availability)
+
+        existing = {}
+        for appointment_date, existing_start, existing_end, existing_status in Appointment.objects.filter(
+            psychologist=psychologist,
+            appointment_date__range=(dates[0], dates[-1])
+        ).values_list('appointment_date', 'start_time', 'end_time', 'status'):
+            existing.setdefault(appointment_date, []).append(
+                (existing_start, existing_end, existing_status)
+            )
+
+        # Reservas temporales de checkout de otros pacientes ocupan el horario
+        for appointment_date, existing_start, existing_end in holds.active_holds(
+            psychologist.id, dates[0], dates[-1]
+        ).exclude(patient=self.context['request'].user).values_list(
+            'appointment_date', 'start_time', 'end_time'
+        ):
+            existing.setdefault(appointment_date, []).append(
+                (existing_start, existing_end, 'pending')
+            )
+
+        conflicts = {}
+        for appointment_date in dates:
+            candidates = [
+                a for a in availabilities.get(appointment_date.weekday(), [])
+                if a.start_time <= start_time and end_time <= a.end_time
+            ]
+            if not candidates:
+                conflicts[appointment_date] = "El psicólogo no está disponible en este horario"
+                continue
+            if all(str(appointment_date) in a.blocked_dates for a in candidates):
+                conflicts[appointment_date] = "El psicólogo no está disponible en esta fecha"
+                continue
+            for existing_start, existing_end, existing_status in existing.get(appointment_date, []):
+                # La restricción única (psicólogo, fecha, hora) excluye sólo las canceladas
+                same_slot = existing_start == start_time and existing_status != 'cancelled'
+                overlaps = (
+                    existing_status in ['pending', 'confirmed'] and
+                    existing_start < end_time and existing_end > start_time
+                )
+                if same_slot or overlaps:
+                    conflicts[appointment_date] = "Ya existe una cita en este horario"
+                    break
+        return conflicts
+
+    def _get_plan(self, patient, psychologist, patient_plan_id):
+        try:
+            plan = PatientPlan.objects.select_for_update().select_related('plan').get(
+                id=patient_plan_id,
+                patient=patient,
+                is_active=True
+            )
+        except PatientPlan.DoesNotExist:
+            raise serializers.ValidationError("El plan de cuidado seleccionado no es válido.")
+
+        if plan.plan.psychologist_id != psychologist.id:
+            raise serializers.ValidationError("Este plan no es válido para el psicólogo seleccionado.")
+        return plan
+
+    def _book(self, patient, psychologist, profile, validated_data, start_time, end_time):
+        """Crea las citas reservables en una transacción. Devuelve (creadas, conflictos)."""
+        dates = validated_data['dates']
+        with transaction.atomic():
+            # Serializa las series del mismo psicólogo: dos series solapadas
+            # (misma hora o no) no pueden pasar a la vez el informe de conflictos
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [psychologist.id])
+
+            conflicts = self._find_conflicts(psychologist, dates, start_time, end_time)
+            accepted = [d for d in dates if d not in conflicts]
+
+            plan = None
+            if validated_data.get('patient_plan_id'):
+                plan = self._get_plan(patient, psychologist, validated_data['patient_plan_id'])
+                # Las sesiones se descuentan al completar la cita, así que las
+                # citas futuras ya reservadas con el plan también cuentan.
+                reserved = plan.appointments_used.filter(
+                    status__in=['pending', 'confirmed']
+                ).count()
+                available_sessions = max(plan.sessions_remaining - reserved, 0)
+                for appointment_date in accepted[available_sessions:]:
+                    conflicts[appointment_date] = "No te quedan sesiones en este plan."
+                accepted = accepted[:available_sessions]
+
+            if conflicts and validated_data['all_or_nothing']:
+                accepted = []
+
+            appointments = [
+                Appointment(
+                    patient=patient,
+                    psychologist=psychologist,
+                    appointment_date=appointment_date,
+                    start_time=start_time,
+                    end_time=end_time,
+                    appointment_type=validated_data['appointment_type'],
+                    reason_for_visit=validated_data['reason_for_visit'],
+                    notes=f"[Agendada con Plan ID: {plan.id}]" if plan else '',
+                    patient_plan=plan,
+                    is_paid=bool(plan),
+                    status='confirmed' if plan else 'pending',
+                    consultation_fee=0 if plan else profile.consultation_fee,
+                )
+                for appointment_date in accepted
+            ]
+            return Appointment.objects.bulk_create(appointments), conflicts
+
+    def create(self, validated_data):
+        patient = self.context['request'].user
+        psychologist = validated_data['psychologist']
+        profile = psychologist.professional_profile
+        start_time = validated_data['start_time']
+        dates = validated_data['dates']
+        end_time = (
+            datetime.combine(dates[0], start_time) + timedelta(minutes=profile.session_duration)
+        ).time()
+
+        # Una cita suelta puede ocupar una de las fechas entre el informe de
+        # conflictos y el INSERT (restricción appt_unique_active_slot). Al
+        # reintentar, esa cita ya está confirmada y el informe la reporta.
+        for attempt in range(self.BOOKING_ATTEMPTS):
+            try:
+                created, conflicts = self._book(
+                    patient, psychologist, profile, validated_data, start_time, end_time
+                )
+                break
+            except IntegrityError:
+                if attempt == self.BOOKING_ATTEMPTS - 1:
+                    raise serializers.ValidationError(
+                        "El horario cambió mientras se agendaba la serie. Intenta de nuevo."
+                    )
+
+        # bulk_create no dispara señales: invalidamos la caché de horarios aquí
+        for appointment in created:
+            schedule_cache.invalidate_date(psychologist.id, appointment.appointment_date)
+            realtime.slot_changed(
+                psychologist.id, appointment.appointment_date,
+                appointment.start_time, appointment.end_time, 'busy'
+            )
+        if created:
+            analytics.invalidate()
+
+        return {
+            'created': created,
+            'conflicts': [
+                {
+                    'appointment_date': str(appointment_date),
+                    'start_time': start_time.strftime('%H:%M'),
+                    'error': reason,
+                }
+                for appointment_date, reason in sorted(conflicts.items())
+            ],
+        }
+
+
+class WaitlistEntrySerializer(serializers.ModelSerializer):
+    psychologist_name = serializers.CharField(source='psychologist.get_full_name', read_only=True)
+    specialization_name = serializers.CharField(source='specialization.name', read_only=True)
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+
+    MAX_WINDOW_DAYS = 60
+
+    class Meta:
+        model = WaitlistEntry
+        fields = [
+            'id', 'psychologist', 'psychologist_name', 'specialization',
+            'specialization_name', 'date_from', 'date_to',
+            'preferred_start_time', 'preferred_end_time', 'status',
+            'status_display', 'offer_date', 'offer_start_time',
+            'offer_expires_at', 'created_at'
+        ]
+        read_only_fields = [
+            'id', 'status', 'offer_date', 'offer_start_time',
+            'offer_expires_at', 'created_at'
+        ]
+
+    def validate(self, data):
+        if not data.get('psychologist') and not data.get('specialization'):
+            raise serializers.ValidationError("Debe indicar un psicólogo o una especialización")
+
+        psychologist = data.get('psychologist')
+        if psychologist and psychologist.user_type != 'professional':
+            raise serializers.ValidationError("El psicólogo seleccionado no es válido")
+
+        if data['date_from'] < datetime.now().date():
+            raise serializers.ValidationError("No se puede esperar turno en fechas pasadas")
+        if data['date_to'] < data['date_from']:
+            raise serializers.ValidationError("La fecha inicial debe ser anterior a la final")
+        if (data['date_to'] - data['date_from']).days > self.MAX_WINDOW_DAYS:
+            raise serializers.ValidationError(
+                f"La ventana de fechas no puede superar {self.MAX_WINDOW_DAYS} días"
+            )
+
+        start = data.get('preferred_start_time')
+        end = data.get('preferred_end_time')
+        if (start is None) != (end is None):
+            raise serializers.ValidationError("Indique inicio y fin de la franja horaria preferida")
+        if start and start >= end:
+            raise serializers.ValidationError("La hora de inicio debe ser menor que la hora de fin")
+
+        return data
+
+
 class AvailablePsychologistSerializer(serializers.ModelSerializer):
     """Serializer para mostrar psicólogos disponibles con sus slots de tiempo"""
     professional_profile = ProfessionalProfileSerializer(read_only=True)
@@ -266,6 +693,9 @@ class AvailablePsychologistSerializer(serializers.ModelSerializer):
             is_active=True
         )
         
+        # Horarios retenidos por un checkout en curso
+        held = list(holds.active_holds(obj.id, search_date).values_list('start_time', 'end_time'))
+        
         slots = []
         for availability in availabilities:
             # Verificar si la fecha está bloqueada
@@ -292,7 +722,10 @@ class AvailablePsychologistSerializer(serializers.ModelSerializer):
                     start_time__lt=slot_end,
                     end_time__gt=slot_start,
                     status__in=['pending', 'confirmed']
-                ).exists()
+                ).exists() or any(
+                    held_start < slot_end and held_end > slot_start
+                    for held_start, held_end in held
+                )
                 
                 if not is_booked:
                     slots.append({
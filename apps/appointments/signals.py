@@ -0,0 +1,100 @@
+# apps/appointments/signals.py
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from apps.professionals.models import ProfessionalProfile
+from .models import Appointment, PsychologistAvailability
+from . import schedule_cache, realtime
+
+
+@receiver(post_init, sender=Appointment)
+def remember_original_slot(sender, instance, **kwargs):
+    """
+    Guarda psicólogo y fecha originales para poder invalidar también la
+    semana anterior cuando una cita se reprograma. No consulta la BD.
+    """
+    deferred = instance.get_deferred_fields()
+    if 'psychologist' in deferred or 'appointment_date' in deferred:
+        instance._original_slot = None
+    else:
+        instance._original_slot = (instance.psychologist_id, instance.appointment_date)
+
+
+# Las invalidaciones se hacen en on_commit: si se borrara la caché antes del
+# commit, una lectura concurrente podría volver a cachear el horario viejo.
+# Sin transacción abierta, on_commit ejecuta la función en el acto.
+
+def _invalidate_dates_on_commit(slots):
+    def invalidate():
+        for psychologist_id, appointment_date in slots:
+            schedule_cache.invalidate_date(psychologist_id, appointment_date)
+
+    transaction.on_commit(invalidate)
+
+
+def _invalidate_psychologist_on_commit(psychologist_id):
+    transaction.on_commit(lambda: schedule_cache.invalidate_psychologist(psychologist_id))
+
+
+def _invalidate_appointment_weeks(instance):
+    slots = {(instance.psychologist_id, instance.appointment_date)}
+    original = getattr(instance, '_original_slot', None)
+    if original and original[0] and original[1]:
+        slots.add(original)
+
+    _invalidate_dates_on_commit(slots)
+    for psychologist_id, appointment_date in slots:
+        if (psychologist_id, appointment_date) != (instance.psychologist_id, instance.appointment_date):
+            # Cita reprogramada: el horario anterior no se conoce, se recarga el día
+            realtime.date_changed(psychologist_id, appointment_date)
+
+    instance._original_slot = (instance.psychologist_id, instance.appointment_date)
+
+
+def _publish_slot(instance, occupied):
+    realtime.slot_changed(
+        instance.psychologist_id,
+        instance.appointment_date,
+        instance.start_time,
+        instance.end_time,
+        'busy' if occupied else 'free'
+    )
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, **kwargs):
+    _invalidate_appointment_weeks(instance)
+    _publish_slot(instance, instance.status in ('pending', 'confirmed'))
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, **kwargs):
+    _invalidate_appointment_weeks(instance)
+    _publish_slot(instance, False)
+
+
+@receiver(post_save, sender=PsychologistAvailability)
+@receiver(post_delete, sender=PsychologistAvailability)
+def availability_changed(sender, instance, **kwargs):
+    _invalidate_psychologist_on_commit(instance.psychologist_id)
+    realtime.psychologist_changed(instance.psychologist_id)
+
+
+@receiver(post_save, sender=ProfessionalProfile)
+def profile_changed(sender, instance, **kwargs):
+    # La duración de sesión define los slots de toda la semana
+    _invalidate_psychologist_on_commit(instance.user_id)
+    realtime.psychologist_changed(instance.user_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def psychologist_user_changed(sender, instance, update_fields=None, **kwargs):
+    # El horario cacheado incluye nombre y email del psicólogo
+    if instance.user_type != 'professional':
+        return
+    if update_fields is not None and not {'first_name', 'last_name', 'email'} & set(update_fields):
+        return
+    _invalidate_psychologist_on_commit(instance.pk)
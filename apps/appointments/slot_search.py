@@ -0,0 +1,125 @@
+# apps/appointments/slot_search.py
+
+"""
+Búsqueda de los próximos horarios libres entre todos los psicólogos.
+
+Se hacen cuatro consultas en total (perfiles, disponibilidades, citas y
+reservas temporales del rango) y luego, para cada psicólogo, un generador
+produce sus horarios libres en orden cronológico. heapq.merge combina los
+generadores (k-way merge con un heap) y la búsqueda se detiene en cuanto
+se obtienen N horarios, sin generar el resto del horizonte.
+"""
+
+import heapq
+from datetime import datetime, timedelta
+from itertools import islice
+
+from django.utils import timezone
+
+from .models import Appointment, PsychologistAvailability
+from . import holds
+
+MAX_HORIZON_DAYS = 30
+
+
+def _free_slots(profile, availabilities, busy, start_date, horizon_days, now):
+    """
+    Genera (inicio, psychologist_id, fecha, hora_inicio, hora_fin) en orden.
+    busy: {fecha: [(inicio, fin), ...]} con citas y reservas activas.
+    """
+    duration = timedelta(minutes=profile.session_duration or 60)
+    by_weekday = {}
+    for availability in availabilities:
+        by_weekday.setdefault(availability.weekday, []).append(availability)
+
+    for offset in range(horizon_days):
+        current_date = start_date + timedelta(days=offset)
+        day_busy = busy.get(current_date, [])
+        day_slots = set()
+
+        for availability in by_weekday.get(current_date.weekday(), []):
+            if str(current_date) in availability.blocked_dates:
+                continue
+
+            slot_start = datetime.combine(current_date, availability.start_time)
+            window_end = datetime.combine(current_date, availability.end_time)
+            while slot_start + duration <= window_end:
+                slot_end = slot_start + duration
+                start_time, end_time = slot_start.time(), slot_end.time()
+                if slot_start > now and not any(
+                    busy_start < end_time and busy_end > start_time
+                    for busy_start, busy_end in day_busy
+                ):
+                    day_slots.add((slot_start, start_time, end_time))
+                slot_start = slot_end
+
+        for slot_start, start_time, end_time in sorted(day_slots):
+            yield (slot_start, profile.user_id, current_date, start_time, end_time)
+
+
+def find_next_available(profiles, limit, horizon_days, start_date=None):
+    """
+    Devuelve los `limit` horarios libres más próximos entre `profiles`
+    (lista de ProfessionalProfile con user cargado) como tuplas
+    (profile, fecha, hora_inicio, hora_fin).
+    """
+    horizon_days = min(horizon_days, MAX_HORIZON_DAYS)
+    now = timezone.localtime().replace(tzinfo=None)
+    start_date = max(start_date or now.date(), now.date())
+    end_date = start_date + timedelta(days=horizon_days - 1)
+
+    profiles_by_user = {profile.user_id: profile for profile in profiles}
+    user_ids = list(profiles_by_user)
+    if not user_ids:
+        return []
+
+    availabilities = {}
+    for availability in PsychologistAvailability.objects.filter(
+        psychologist_id__in=user_ids,
+        is_active=True
+    ).only('psychologist_id', 'weekday', 'start_time', 'end_time', 'blocked_dates'):
+        availabilities.setdefault(availability.psychologist_id, []).append(availability)
+
+    busy = {}
+    for psychologist_id, appointment_date, start_time, end_time in Appointment.objects.filter(
+        psychologist_id__in=user_ids,
+        appointment_date__range=(start_date, end_date),
+        status__in=['pending', 'confirmed']
+    ).values_list('psychologist_id', 'appointment_date', 'start_time', 'end_time'):
+        busy.setdefault(psychologist_id, {}).setdefault(appointment_date, []).append((start_time, end_time))
+
+    for psychologist_id, appointment_date, start_time, end_time in holds.active_holds_for(
+        user_ids, start_date, end_date
+    ).values_list('psychologist_id', 'appointment_date', 'start_time', 'end_time'):
+        busy.setdefault(psychologist_id, {}).setdefault(appointment_date, []).append((start_time, end_time))
+
+    return merge_free_slots(
+        profiles_by_user, availabilities, busy, start_date, horizon_days, now, limit
+    )
+
+
+def merge_free_slots(profiles_by_user, availabilities, busy, start_date, horizon_days, now, limit):
+    """
+    Combina los horarios libres de cada psicólogo y devuelve los `limit`
+    más próximos. No toca la BD (lo usa también benchmark_slot_search).
+    availabilities: {psychologist_id: [PsychologistAvailability, ...]}
+    busy: {psychologist_id: {fecha: [(inicio, fin), ...]}}
+    """
+    generators = [
+        _free_slots(
+            profiles_by_user[user_id],
+            availabilities[user_id],
+            busy.get(user_id, {}),
+            start_date,
+            horizon_days,
+            now
+        )
+        for user_id in profiles_by_user
+        if user_id in availabilities
+    ]
+
+    return [
+        (profiles_by_user[psychologist_id], slot_date, start_time, end_time)
+        for _, psychologist_id, slot_date, start_time, end_time
+        in islice(heapq.merge(*generators), limit)
+    ]
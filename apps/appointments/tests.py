@@ -1,3 +1,341 @@
-from django.test import TestCase
+from contextlib import contextmanager
+from datetime import time, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django_tenants.test.cases import TenantTestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.professionals.models import ProfessionalProfile
+
+from . import realtime
+from .management.commands import check_query_plans
+from .models import Appointment, PsychologistAvailability, SlotHold
+from .serializers import AppointmentCreateSerializer
+from .views import AppointmentViewSet, PsychologistAvailabilityViewSet
+
+User = get_user_model()
+
+
+@contextmanager
+def assert_statements(test_case, expected):
+    """
+    Como assertNumQueries, sin contar los SET search_path que django-tenants
+    envía antes de cada consulta.
+    """
+    with CaptureQueriesContext(connection) as context:
+        yield
+    statements = [
+        query['sql'] for query in context.captured_queries
+        if not query['sql'].startswith('SET search_path')
+    ]
+    test_case.assertEqual(
+        len(statements), expected,
+        f'{len(statements)} consultas, {expected} esperadas:\n' + '\n'.join(statements)
+    )
+
+
+class AppointmentQueryCountTests(TenantTestCase):
+    """
+    Número de consultas de los endpoints de citas. No debe crecer con la
+    cantidad de citas: paciente y psicólogo salen del mismo JOIN.
+    """
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Clínica de pruebas'
+
+    def setUp(self):
+        # TenantTestCase no aplica @override_settings de clase (no llama a super().setUpClass)
+        no_publish = override_settings(REALTIME_PUBLISH=False)
+        no_publish.enable()
+        self.addCleanup(no_publish.disable)
+        self.factory = APIRequestFactory()
+        self.patient = User.objects.create_user(
+            email='paciente@example.com', password='x',
+            first_name='Ana', last_name='Pérez', user_type='patient'
+        )
+        self.psychologist = User.objects.create_user(
+            email='psicologo@example.com', password='x',
+            first_name='Luis', last_name='Gómez', user_type='professional'
+        )
+        today = timezone.localdate()
+        # Citas pasadas (historial) y futuras (próximas), más que una página de upcoming
+        self.appointments = [
+            Appointment.objects.create(
+                patient=self.patient,
+                psychologist=self.psychologist,
+                appointment_date=today + timedelta(days=offset),
+                start_time=time(10, 0),
+                end_time=time(11, 0),
+                consultation_fee=50,
+                status='pending' if offset > 0 else 'completed',
+            )
+            for offset in range(-5, 15)
+        ]
+        self.future = self.appointments[-1]
+
+    def _call(self, user, method, action, pk=None):
+        view = AppointmentViewSet.as_view({method: action})
+        request = getattr(self.factory, method)('/api/appointments/appointments/')
+        force_authenticate(request, user=user)
+        kwargs = {'pk': pk} if pk is not None else {}
+        return view(request, **kwargs)
+
+    def test_list(self):
+        # COUNT de la paginación + la página
+        with assert_statements(self, 2):
+            response = self._call(self.patient, 'get', 'list')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], len(self.appointments))
+
+    def test_upcoming(self):
+        with assert_statements(self, 1):
+            response = self._call(self.patient, 'get', 'upcoming')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 10)
+
+    def test_history(self):
+        # Paginación por cursor: una sola consulta sin COUNT
+        with assert_statements(self, 1):
+            response = self._call(self.psychologist, 'get', 'history')
+        self.assertEqual(response.status_code, 200)
+        # Las 5 pasadas y la de hoy, que ya está completada
+        self.assertEqual(len(response.data['results']), 6)
+
+    def test_retrieve(self):
+        with assert_statements(self, 1):
+            response = self._call(self.patient, 'get', 'retrieve', self.future.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['psychologist_name'], 'Luis Gómez')
+
+    def test_confirm(self):
+        # Cita + UPDATE
+        with assert_statements(self, 2):
+            response = self._call(self.psychologist, 'post', 'confirm', self.future.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'confirmed')
+
+    def test_cancel(self):
+        # Cita + UPDATE + candidatos de la lista de espera (en on_commit)
+        with assert_statements(self, 3), self.captureOnCommitCallbacks(execute=True):
+            response = self._call(self.patient, 'post', 'cancel', self.future.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'cancelled')
+
+    def test_cancel_survives_waitlist_error(self):
+        with mock.patch('apps.appointments.waitlist.offer_slot', side_effect=RuntimeError('BD caída')), \
+                self.assertLogs('apps.appointments.waitlist', 'ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self._call(self.patient, 'post', 'cancel', self.future.pk)
+        self.assertEqual(response.status_code, 200)
+        self.future.refresh_from_db()
+        self.assertEqual(self.future.status, 'cancelled')
+
+    def test_complete(self):
+        Appointment.objects.filter(pk=self.future.pk).update(status='confirmed')
+        # SAVEPOINT + cita + UPDATE + RELEASE (la acción es atómica, sin plan)
+        with assert_statements(self, 4):
+            response = self._call(self.psychologist, 'post', 'complete', self.future.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'completed')
+
+
+class HeldSlotValidationTests(TenantTestCase):
+    """Un horario retenido por el checkout de otro paciente no se puede agendar."""
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Clínica de pruebas'
+
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            email='paciente@example.com', password='x',
+            first_name='Ana', last_name='Pérez', user_type='patient'
+        )
+        self.other_patient = User.objects.create_user(
+            email='otro@example.com', password='x',
+            first_name='Eva', last_name='Ríos', user_type='patient'
+        )
+        self.psychologist = User.objects.create_user(
+            email='psicologo@example.com', password='x',
+            first_name='Luis', last_name='Gómez', user_type='professional'
+        )
+        ProfessionalProfile.objects.create(
+            user=self.psychologist, license_number='PSI-1', bio='-', education='-',
+            experience_years=5, consultation_fee=50, session_duration=60
+        )
+        self.appointment_date = timezone.localdate() + timedelta(days=3)
+        SlotHold.objects.create(
+            patient=self.other_patient,
+            psychologist=self.psychologist,
+            appointment_date=self.appointment_date,
+            start_time=time(10, 0),
+            end_time=time(11, 0),
+            expires_at=timezone.now() + timedelta(minutes=10)
+        )
+
+    def _serializer(self, user, start_time):
+        request = APIRequestFactory().post('/api/appointments/appointments/')
+        request.user = user
+        return AppointmentCreateSerializer(data={
+            'psychologist': self.psychologist.id,
+            'appointment_date': self.appointment_date,
+            'start_time': start_time,
+        }, context={'request': request})
+
+    def test_overlapping_hold_of_another_patient(self):
+        serializer = self._serializer(self.patient, time(10, 30))
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('reservado temporalmente', str(serializer.errors))
+
+    def test_own_hold_and_free_slot(self):
+        self.assertTrue(self._serializer(self.other_patient, time(10, 0)).is_valid())
+        self.assertTrue(self._serializer(self.patient, time(11, 0)).is_valid())
+
+
+class WeeklyTemplateTests(TenantTestCase):
+    """La plantilla semanal reemplaza la disponibilidad con un solo diff."""
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Clínica de pruebas'
+
+    def setUp(self):
+        no_publish = override_settings(REALTIME_PUBLISH=False)
+        no_publish.enable()
+        self.addCleanup(no_publish.disable)
+        self.psychologist = User.objects.create_user(
+            email='psicologo@example.com', password='x',
+            first_name='Luis', last_name='Gómez', user_type='professional'
+        )
+        for weekday, end_time in [(0, time(13, 0)), (1, time(13, 0)), (2, time(13, 0))]:
+            PsychologistAvailability.objects.create(
+                psychologist=self.psychologist, weekday=weekday,
+                start_time=time(9, 0), end_time=end_time
+            )
+
+    def _put(self, dry_run=False):
+        request = APIRequestFactory().put('/api/appointments/availability/weekly-template/', {
+            'intervals': [
+                {'weekday': 0, 'start_time': '09:00', 'end_time': '13:00'},
+                {'weekday': 1, 'start_time': '09:00', 'end_time': '14:00'},
+                {'weekday': 3, 'start_time': '09:00', 'end_time': '13:00'},
+            ],
+            'dry_run': dry_run,
+        }, format='json')
+        force_authenticate(request, user=self.psychologist)
+        return PsychologistAvailabilityViewSet.as_view({'put': 'weekly_template'})(request)
+
+    def _schedule(self):
+        return sorted(
+            PsychologistAvailability.objects.filter(psychologist=self.psychologist)
+            .values_list('weekday', 'end_time')
+        )
+
+    def test_apply(self):
+        response = self._put()
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            {key: response.data[key] for key in ('created', 'updated', 'deleted')},
+            {'created': 1, 'updated': 1, 'deleted': 1}
+        )
+        self.assertEqual(self._schedule(), [(0, time(13, 0)), (1, time(14, 0)), (3, time(13, 0))])
+
+    def test_dry_run_does_not_save(self):
+        before = self._schedule()
+        response = self._put(dry_run=True)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(self._schedule(), before)
+
+
+class RealtimeBatchTests(TenantTestCase):
+    """Un evento por lote; lo revertido en un savepoint no se publica."""
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Clínica de pruebas'
+
+    def setUp(self):
+        publish = override_settings(REALTIME_PUBLISH=True)
+        publish.enable()
+        self.addCleanup(publish.disable)
+        patcher = mock.patch.object(realtime, '_publish')
+        self.publish = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.day = timezone.localdate() + timedelta(days=7)
+
+    def _slot(self, hour, state):
+        realtime.slot_changed(1, self.day, time(hour, 0), time(hour + 1, 0), state)
+
+    def _published(self):
+        """[(hora, estado)] de cada publicación, en orden."""
+        return [
+            [(change['start_time'], change['state']) for entry in call.args[0].values() for change in entry['changes'].values()]
+            for call in self.publish.call_args_list
+        ]
+
+    def test_changes_of_a_transaction_are_published_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self._slot(9, 'busy')
+                self._slot(10, 'busy')
+                self._slot(9, 'free')
+        self.assertEqual(self._published(), [[('09:00', 'free'), ('10:00', 'busy')]])
+
+    def test_rolled_back_savepoint_is_not_published(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self._slot(9, 'busy')
+                try:
+                    with transaction.atomic():
+                        self._slot(10, 'busy')
+                        raise ValueError
+                except ValueError:
+                    pass
+                self._slot(11, 'busy')
+        self.assertEqual(self._published(), [[('09:00', 'busy'), ('11:00', 'busy')]])
+
+    def test_released_savepoint_keeps_the_order(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self._slot(9, 'busy')
+                with transaction.atomic():
+                    self._slot(9, 'free')
+                self._slot(9, 'busy')
+        # El estado final que ven los clientes es el último cambio
+        self.assertEqual(self._published(), [[('09:00', 'busy')], [('09:00', 'free')], [('09:00', 'busy')]])
+
+
+class CheckQueryPlansTests(TenantTestCase):
+    """check_query_plans debe fallar si el plan no usa el índice esperado."""
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Clínica de pruebas'
+
+    def test_hot_queries_use_their_index(self):
+        out = StringIO()
+        call_command(
+            'check_query_plans', tenant=self.tenant.schema_name, seed=20000,
+            verbose_plans=True, stdout=out
+        )
+        self.assertIn('Todas las consultas usan su índice', out.getvalue())
+
+    def test_detects_missing_index(self):
+        # Si el plan no usa el índice declarado, el comando falla
+        queryset = Appointment.objects.filter(psychologist_id=1, appointment_date__gte=timezone.localdate())
+        with mock.patch.object(
+            check_query_plans, 'get_hot_queries',
+            return_value=[('appointments.missing', 'appt_missing_idx', queryset)]
+        ):
+            with self.assertRaisesMessage(CommandError, 'appointments.missing'):
+                call_command('check_query_plans', tenant=self.tenant.schema_name, seed=2000, stdout=StringIO())
@@ -10,11 +10,16 @@ from apps.clinical_history.views import SessionNoteViewSet
 router = DefaultRouter()
 router.register(r'appointments', views.AppointmentViewSet, basename='appointment')
 router.register(r'availability', views.PsychologistAvailabilityViewSet, basename='availability')
+router.register(r'waitlist', views.WaitlistEntryViewSet, basename='waitlist')
 
 urlpatterns = [
     # Custom endpoints - MUST come FIRST (specific routes before generic ones)
     path('search-psychologists/', views.search_available_psychologists, name='search-psychologists'),
+    path('next-available/', views.next_available_slots, name='next-available-slots'),
     path('psychologist/<int:psychologist_id>/schedule/', views.get_psychologist_schedule, name='psychologist-schedule'),
+    path('schedule-cache/stats/', views.schedule_cache_stats, name='schedule-cache-stats'),
+    path('calendar/feed/', views.my_calendar_feed, name='my-calendar-feed'),
+    path('calendar/<str:token>.ics', views.calendar_feed, name='calendar-feed'),
     
     # Rutas anidadas para notas de sesión
     path('appointments/<int:appointment_pk>/note/', SessionNoteViewSet.as_view({
@@ -1,12 +1,20 @@
 # apps/appointments/views.py
 
 from rest_framework import status, viewsets, permissions
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes, authentication_classes
 from rest_framework.response import Response
+from rest_framework.pagination import CursorPagination
+from rest_framework.renderers import BaseRenderer, JSONRenderer, BrowsableAPIRenderer
 from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.http import http_date, parse_http_date_safe, urlencode
 from django.db.models import Q
 from datetime import datetime, timedelta
-from .models import Appointment, PsychologistAvailability, TimeSlot
+from decimal import Decimal, InvalidOperation
+from .models import Appointment, PsychologistAvailability, TimeSlot, CalendarFeedToken, Referral, WaitlistEntry
 from apps.professionals.models import ProfessionalProfile
 from apps.professionals.models import ProfessionalProfile
 from apps.payment_system.models import PatientPlan
@@ -17,9 +25,14 @@ from .serializers import (
     PsychologistAvailabilitySerializer,
     TimeSlotSerializer,
     AvailablePsychologistSerializer,
-    ReferralCreateSerializer
+    ReferralCreateSerializer,
+    RecurringAppointmentSerializer,
+    WaitlistEntrySerializer,
+    WeeklyTemplateSerializer
 )
 from django.db import transaction
+from . import schedule_cache, ical, holds, waitlist, slot_search
+import json
 import logging
 
 User = get_user_model()
@@ -43,6 +56,62 @@ class IsPsychologist(permissions.BasePermission):
     """Solo psicólogos pueden acceder"""
     def has_permission(self, request, view):
         return request.user.is_authenticated and request.user.user_type == 'professional' # <-- CAMBIO AQUÍ
+# Filas por ida a la base de datos en la exportación NDJSON
+NDJSON_CHUNK_SIZE = 200
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Renderer para newline-delimited JSON. Sólo registra el formato 'ndjson'
+    para que la negociación de contenido acepte ?format=ndjson; la vista
+    devuelve directamente un StreamingHttpResponse.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, list):
+            return ''.join(
+                json.dumps(item, cls=DjangoJSONEncoder) + '\n' for item in data
+            ).encode(self.charset)
+        return (json.dumps(data, cls=DjangoJSONEncoder) + '\n').encode(self.charset)
+
+
+class AppointmentHistoryPagination(CursorPagination):
+    """
+    Paginación por cursor para el historial: el coste de cada página es
+    constante aunque el historial sea muy largo.
+    """
+    ordering = ('-appointment_date', '-start_time', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+# Columnas que lee AppointmentSerializer: todas las de la cita más el
+# nombre del paciente y del psicólogo (get_full_name).
+APPOINTMENT_SERIALIZER_COLUMNS = (
+    'id', 'patient', 'psychologist', 'appointment_date', 'start_time',
+    'end_time', 'appointment_type', 'status', 'reason_for_visit', 'notes',
+    'consultation_fee', 'is_paid', 'meeting_link', 'created_at', 'updated_at',
+    'patient_plan',
+    'patient__id', 'patient__first_name', 'patient__last_name',
+    'psychologist__id', 'psychologist__first_name', 'psychologist__last_name',
+)
+
+
+def optimized_appointment_queryset():
+    """
+    Queryset de citas sin N+1: un solo JOIN con paciente y psicólogo
+    y sólo las columnas que necesita AppointmentSerializer.
+    """
+    return Appointment.objects.select_related(
+        'patient', 'psychologist'
+    ).only(*APPOINTMENT_SERIALIZER_COLUMNS)
+
+
 class AppointmentViewSet(viewsets.ModelViewSet):
     """
     ViewSet para gestionar citas
@@ -52,7 +121,7 @@ class AppointmentViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         user = self.request.user
-        queryset = Appointment.objects.all()
+        queryset = optimized_appointment_queryset()
         
         # Filtrar por tipo de usuario
         if user.user_type == 'patient':
@@ -120,6 +189,33 @@ class AppointmentViewSet(viewsets.ModelViewSet):
 
         return Response(full_serializer.data)
     
+    @action(detail=False, methods=['post'], url_path='recurring')
+    def recurring(self, request):
+        """
+        Agendar una serie de citas (solo pacientes).
+        Body: psychologist, start_date, start_time, frequency (weekly|biweekly),
+        occurrences, appointment_type, reason_for_visit, patient_plan_id, all_or_nothing
+        """
+        if request.user.user_type != 'patient':
+            return Response(
+                {'error': 'Solo los pacientes pueden agendar citas'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        serializer = RecurringAppointmentSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        result = serializer.save()
+
+        return Response(
+            {
+                'created_count': len(result['created']),
+                'conflict_count': len(result['conflicts']),
+                'created': AppointmentSerializer(result['created'], many=True).data,
+                'conflicts': result['conflicts'],
+            },
+            status=status.HTTP_201_CREATED if result['created'] else status.HTTP_409_CONFLICT
+        )
+    
     @action(detail=True, methods=['post'])
     def confirm(self, request, pk=None):
         """Confirmar una cita (solo el psicólogo)"""
@@ -173,6 +269,14 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         appointment.notes += f"\n\nCancelado por {request.user.get_full_name()} el {now.strftime('%Y-%m-%d %H:%M')}"
         appointment.save()
         
+        # Ofrecer el horario liberado al primer paciente en lista de espera
+        waitlist.offer_slot_on_commit(
+            appointment.psychologist_id,
+            appointment.appointment_date,
+            appointment.start_time,
+            appointment.end_time
+        )
+        
         return Response(
             AppointmentSerializer(appointment).data,
             status=status.HTTP_200_OK
@@ -240,16 +344,43 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         serializer = AppointmentSerializer(appointments, many=True)
         return Response(serializer.data)
     
-    @action(detail=False, methods=['get'])
+    @action(
+        detail=False,
+        methods=['get'],
+        renderer_classes=[JSONRenderer, BrowsableAPIRenderer, NDJSONRenderer]
+    )
     def history(self, request):
-        """Obtener historial de citas"""
+        """
+        Obtener historial de citas.
+        - Por defecto: paginado por cursor (?cursor=...&page_size=...)
+        - ?format=ndjson: exportación completa en streaming, una cita por línea
+        """
         today = datetime.now().date()
         appointments = self.get_queryset().filter(
             Q(appointment_date__lt=today) | Q(status='completed')
         )
         
-        serializer = AppointmentSerializer(appointments, many=True)
-        return Response(serializer.data)
+        if request.query_params.get('format') == NDJSONRenderer.format:
+            return self._stream_ndjson(appointments)
+        
+        paginator = AppointmentHistoryPagination()
+        page = paginator.paginate_queryset(appointments, request, view=self)
+        serializer = AppointmentSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+    
+    def _stream_ndjson(self, queryset):
+        """
+        Serializa el queryset fila a fila con iterator() para que la memoria
+        del servidor no crezca con el tamaño del historial.
+        """
+        def rows():
+            for appointment in queryset.iterator(chunk_size=NDJSON_CHUNK_SIZE):
+                data = AppointmentSerializer(appointment).data
+                yield json.dumps(data, cls=DjangoJSONEncoder) + '\n'
+        
+        response = StreamingHttpResponse(rows(), content_type=NDJSONRenderer.media_type)
+        response['Content-Disposition'] = 'attachment; filename="appointment_history.ndjson"'
+        return response
 
     @action(detail=True, methods=['post'], url_path='refer')
     def refer_appointment(self, request, pk=None):
@@ -297,6 +428,13 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             appointment.notes += f"\n\n[Derivada a {referred_psychologist.get_full_name()} por: {data['reason']}]"
             appointment.save()
 
+            waitlist.offer_slot_on_commit(
+                appointment.psychologist_id,
+                appointment.appointment_date,
+                appointment.start_time,
+                appointment.end_time
+            )
+
             logger.info(f"Cita {appointment.id} derivada a {referred_psychologist.email} por {request.user.email}")
 
             return Response(
@@ -311,6 +449,41 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Error interno al crear la derivación.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class WaitlistEntryViewSet(viewsets.ModelViewSet):
+    """
+    Lista de espera del paciente autenticado.
+    Cuando se libera un horario compatible se le ofrece con una reserva corta
+    que puede pagar desde el checkout normal.
+    """
+    serializer_class = WaitlistEntrySerializer
+    permission_classes = [permissions.IsAuthenticated]
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
+
+    def get_queryset(self):
+        return WaitlistEntry.objects.filter(
+            patient=self.request.user
+        ).select_related('psychologist', 'specialization').order_by('-created_at')
+
+    def create(self, request, *args, **kwargs):
+        if request.user.user_type != 'patient':
+            return Response(
+                {'error': 'Solo los pacientes pueden anotarse en la lista de espera'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        return super().create(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        serializer.save(patient=self.request.user)
+
+    def destroy(self, request, *args, **kwargs):
+        """Salir de la lista de espera (se conserva el registro)"""
+        entry = self.get_object()
+        if entry.status in ['waiting', 'offered']:
+            entry.status = 'cancelled'
+            entry.save(update_fields=['status'])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 # apps/appointments/views.py
 
 class PsychologistAvailabilityViewSet(viewsets.ModelViewSet):
@@ -375,6 +548,26 @@ class PsychologistAvailabilityViewSet(viewsets.ModelViewSet):
         
         return super().update(request, *args, **kwargs)
     
+    @action(detail=False, methods=['put'], url_path='weekly-template')
+    def weekly_template(self, request):
+        """
+        Reemplazar la disponibilidad semanal completa del psicólogo.
+        Body: {"intervals": [{"weekday": 0, "start_time": "09:00", "end_time": "13:00"}, ...],
+               "dry_run": false}
+        Devuelve el resumen de cambios y las citas que quedarían fuera del nuevo horario.
+        """
+        if request.user.user_type != 'professional':
+            return Response(
+                {'error': 'Solo los psicólogos pueden editar su disponibilidad'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        serializer = WeeklyTemplateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = serializer.apply(request.user)
+        
+        return Response(result, status=status.HTTP_200_OK)
+    
     # ... (el resto de las funciones @action se quedan igual) ...
     @action(detail=True, methods=['post'])
     def block_date(self, request, pk=None):
@@ -536,17 +729,111 @@ def search_available_psychologists(request):
         'psychologists': serializer.data
     })
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def next_available_slots(request):
+    """
+    Próximos horarios libres entre todos los psicólogos que cumplan los filtros.
+    
+    Query params:
+    - specialization: ID de especialización (opcional)
+    - city: ciudad (opcional)
+    - max_fee: tarifa máxima (opcional)
+    - modality: online | in_person (opcional)
+    - limit: cantidad de horarios (por defecto 10, máximo 50)
+    - days: horizonte de búsqueda en días (por defecto 14, máximo 30)
+    - date_from: YYYY-MM-DD (opcional, por defecto hoy)
+    """
+    params = request.query_params
+    
+    try:
+        limit = min(max(int(params.get('limit', 10)), 1), 50)
+        days = min(max(int(params.get('days', 14)), 1), slot_search.MAX_HORIZON_DAYS)
+    except ValueError:
+        return Response(
+            {'error': 'limit y days deben ser números enteros'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    date_from = None
+    if params.get('date_from'):
+        try:
+            date_from = datetime.strptime(params['date_from'], '%Y-%m-%d').date()
+        except ValueError:
+            return Response(
+                {'error': 'Formato de fecha inválido. Use YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    
+    profiles = ProfessionalProfile.objects.filter(
+        is_active=True,
+        user__is_active=True,
+        user__user_type='professional'
+    ).select_related('user').only(
+        'user_id', 'session_duration', 'consultation_fee', 'city',
+        'accepts_online_sessions', 'accepts_in_person_sessions',
+        'user__id', 'user__first_name', 'user__last_name'
+    )
+    
+    if params.get('specialization'):
+        try:
+            specialization_id = int(params['specialization'])
+        except ValueError:
+            return Response(
+                {'error': 'specialization debe ser un número entero'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        profiles = profiles.filter(specializations__id=specialization_id)
+    if params.get('city'):
+        profiles = profiles.filter(city__icontains=params['city'])
+    if params.get('max_fee'):
+        try:
+            profiles = profiles.filter(consultation_fee__lte=Decimal(params['max_fee']))
+        except InvalidOperation:
+            return Response(
+                {'error': 'max_fee debe ser un número'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    modality = params.get('modality')
+    if modality == 'online':
+        profiles = profiles.filter(accepts_online_sessions=True)
+    elif modality == 'in_person':
+        profiles = profiles.filter(accepts_in_person_sessions=True)
+    
+    slots = slot_search.find_next_available(list(profiles), limit, days, date_from)
+    
+    return Response({
+        'count': len(slots),
+        'slots': [
+            {
+                'psychologist': {
+                    'id': profile.user_id,
+                    'name': profile.user.get_full_name(),
+                    'city': profile.city,
+                    'consultation_fee': profile.consultation_fee,
+                },
+                'date': slot_date.strftime('%Y-%m-%d'),
+                'start_time': start_time.strftime('%H:%M'),
+                'end_time': end_time.strftime('%H:%M'),
+            }
+            for profile, slot_date, start_time, end_time in slots
+        ]
+    })
+
+
 # en apps/appointments/views.py
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def get_psychologist_schedule(request, psychologist_id):
     """
-    Obtener el horario completo de un psicólogo para una semana
+    Obtener el horario completo de un psicólogo para una semana.
+    La respuesta se cachea por (tenant, psicólogo, week_start) y lleva ETag,
+    así que el cliente puede revalidar con If-None-Match y recibir un 304.
     """
     try: # <-- La indentación aquí está corregida
         # Buscamos el PERFIL PROFESIONAL por el ID del usuario, no por el ID del perfil
-        profile = ProfessionalProfile.objects.get(user_id=psychologist_id)
+        profile = ProfessionalProfile.objects.select_related('user').get(user_id=psychologist_id)
         psychologist = profile.user
     except ProfessionalProfile.DoesNotExist:
         return Response(
@@ -564,17 +851,61 @@ def get_psychologist_schedule(request, psychologist_id):
     else:
         week_start = datetime.now().date()
 
+    cached = schedule_cache.get_cached_schedule(psychologist.id, week_start)
+    if cached is not None:
+        payload, etag = cached
+        cache_status = 'HIT'
+    else:
+        payload = _build_week_schedule(psychologist, profile, week_start)
+        etag = schedule_cache.set_cached_schedule(psychologist.id, week_start, payload)
+        cache_status = 'MISS'
+
+    if request.headers.get('If-None-Match') == etag:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(payload)
+
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    response['X-Cache'] = cache_status
+    return response
+
+
+def _build_week_schedule(psychologist, profile, week_start):
+    """
+    Genera el horario de la semana con dos consultas: las disponibilidades
+    activas del psicólogo y sus citas activas en el rango de 7 días.
+    """
+    week_end = week_start + timedelta(days=6)
+    duration = profile.session_duration or 60
+
+    availabilities_by_weekday = {}
+    for availability in PsychologistAvailability.objects.filter(
+        psychologist=psychologist,
+        is_active=True
+    ).order_by('start_time'):
+        availabilities_by_weekday.setdefault(availability.weekday, []).append(availability)
+
+    booked_by_date = {}
+    for appointment_date, start_time, end_time in Appointment.objects.filter(
+        psychologist=psychologist,
+        appointment_date__range=(week_start, week_end),
+        status__in=['pending', 'confirmed']
+    ).values_list('appointment_date', 'start_time', 'end_time'):
+        booked_by_date.setdefault(appointment_date, []).append((start_time, end_time))
+
+    # Los horarios retenidos durante un checkout tampoco se ofrecen
+    for appointment_date, start_time, end_time in holds.active_holds(
+        psychologist.id, week_start, week_end
+    ).values_list('appointment_date', 'start_time', 'end_time'):
+        booked_by_date.setdefault(appointment_date, []).append((start_time, end_time))
+
     # Generar el horario de la semana
     schedule = []
     for i in range(7):
         current_date = week_start + timedelta(days=i)
         weekday = current_date.weekday()
-
-        availabilities = PsychologistAvailability.objects.filter(
-            psychologist=psychologist,
-            weekday=weekday,
-            is_active=True
-        )
+        booked = booked_by_date.get(current_date, [])
 
         day_schedule = {
             'date': current_date.strftime('%Y-%m-%d'),
@@ -585,7 +916,7 @@ def get_psychologist_schedule(request, psychologist_id):
             'time_slots': []
         }
 
-        for availability in availabilities:
+        for availability in availabilities_by_weekday.get(weekday, []):
             if str(current_date) in availability.blocked_dates:
                 day_schedule['blocked'] = True
                 continue
@@ -595,21 +926,14 @@ def get_psychologist_schedule(request, psychologist_id):
             current_time = datetime.combine(current_date, availability.start_time)
             end_time = datetime.combine(current_date, availability.end_time)
 
-            duration = 60
-            if hasattr(psychologist, 'professional_profile'):
-                duration = psychologist.professional_profile.session_duration
-
             while current_time + timedelta(minutes=duration) <= end_time:
                 slot_start = current_time.time()
                 slot_end = (current_time + timedelta(minutes=duration)).time()
 
-                is_booked = Appointment.objects.filter(
-                    psychologist=psychologist,
-                    appointment_date=current_date,
-                    start_time__lt=slot_end,
-                    end_time__gt=slot_start,
-                    status__in=['pending', 'confirmed']
-                ).exists()
+                is_booked = any(
+                    booked_start < slot_end and booked_end > slot_start
+                    for booked_start, booked_end in booked
+                )
 
                 day_schedule['time_slots'].append({
                     'start_time': slot_start.strftime('%H:%M'),
@@ -622,13 +946,95 @@ def get_psychologist_schedule(request, psychologist_id):
 
         schedule.append(day_schedule)
 
-    return Response({
+    return {
         'psychologist': {
             'id': psychologist.id,
             'name': psychologist.get_full_name(),
             'email': psychologist.email
         },
         'week_start': week_start.strftime('%Y-%m-%d'),
-        'week_end': (week_start + timedelta(days=6)).strftime('%Y-%m-%d'),
+        'week_end': week_end.strftime('%Y-%m-%d'),
         'schedule': schedule
-    })
\ No newline at end of file
+    }
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def schedule_cache_stats(request):
+    """Tasa de aciertos de la caché de horarios (solo staff)"""
+    if not request.user.is_staff:
+        return Response(
+            {'error': 'No tienes permisos para ver estas estadísticas'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    return Response(schedule_cache.get_stats())
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsPsychologist])
+def my_calendar_feed(request):
+    """
+    URL del feed iCalendar del psicólogo autenticado.
+    - GET: devuelve (y crea si no existe) la URL de suscripción
+    - POST: regenera el token e invalida la URL anterior
+    """
+    feed_token, created = CalendarFeedToken.objects.get_or_create(
+        psychologist=request.user,
+        defaults={'token': CalendarFeedToken.generate_token()}
+    )
+
+    if request.method == 'POST' and not created:
+        cache.delete(ical.token_cache_key(feed_token.token))
+        feed_token.token = CalendarFeedToken.generate_token()
+        feed_token.save(update_fields=['token'])
+
+    # Los calendarios externos no mandan X-Tenant-Schema: el tenant va en la URL
+    feed_path = reverse('calendar-feed', kwargs={'token': feed_token.token})
+    feed_path = f'{feed_path}?{urlencode({"tenant": request.tenant.schema_name})}'
+    return Response({
+        'token': feed_token.token,
+        'feed_url': request.build_absolute_uri(feed_path),
+    })
+
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([permissions.AllowAny])
+def calendar_feed(request, token):
+    """
+    Feed iCalendar (.ics) de las citas de un psicólogo para Google/Apple Calendar.
+    Soporta If-None-Match / If-Modified-Since: un sondeo sin cambios cuesta
+    una consulta indexada y un 304.
+    """
+    token_key = ical.token_cache_key(token)
+    psychologist_id = cache.get(token_key)
+    if psychologist_id is None:
+        psychologist_id = CalendarFeedToken.objects.filter(
+            token=token
+        ).values_list('psychologist_id', flat=True).first()
+        if psychologist_id is None:
+            return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+        cache.set(token_key, psychologist_id, ical.FEED_CACHE_TIMEOUT)
+
+    feed = ical.get_feed(psychologist_id)
+    last_modified = int(feed['last_modified'].timestamp()) if feed['last_modified'] else None
+
+    if_none_match = request.headers.get('If-None-Match')
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    not_modified = (
+        if_none_match == feed['etag']
+        if if_none_match
+        else (last_modified is not None and if_modified_since is not None and last_modified <= if_modified_since)
+    )
+
+    if not_modified:
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = HttpResponse(feed['body'], content_type='text/calendar; charset=utf-8')
+        response['Content-Disposition'] = 'inline; filename="citas.ics"'
+
+    response['ETag'] = feed['etag']
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, max-age=300'
+    return response
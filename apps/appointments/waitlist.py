@@ -0,0 +1,176 @@
+# apps/appointments/waitlist.py
+
+"""
+Motor de lista de espera.
+
+Cuando un horario se libera (cancelación, derivación o reserva vencida) se
+buscan los mejores candidatos con una sola consulta indexada y se ofrece el
+horario al primero mediante una reserva temporal corta (SlotHold) y se le
+avisa con una notificación push (cola de apps/notifications/outbox.py). Si
+el paciente paga dentro del plazo, la reserva se convierte en cita; si no,
+la oferta vence, el paciente vuelve a 'waiting' para otros horarios y el
+reaper ofrece este al siguiente candidato.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, IntegerField, Q, When
+from django.utils import timezone
+
+from apps.notifications import outbox
+from .models import WaitlistEntry
+from .holds import create_hold, SlotUnavailable
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+WAITLIST_OFFER_DURATION = timedelta(minutes=15)
+# Candidatos leídos por horario liberado
+CANDIDATE_LIMIT = 5
+
+
+def find_candidates(psychologist_id, appointment_date, start_time, end_time, limit=CANDIDATE_LIMIT):
+    """
+    Entradas en espera compatibles con el horario, en una consulta:
+    primero las que piden a este psicólogo, luego las de su especialidad,
+    y dentro de cada grupo por orden de llegada. Se salta a quien ya dejó
+    vencer la oferta de este mismo horario.
+    """
+    return WaitlistEntry.objects.filter(
+        status='waiting',
+        date_from__lte=appointment_date,
+        date_to__gte=appointment_date
+    ).exclude(
+        offer_psychologist_id=psychologist_id,
+        offer_date=appointment_date,
+        offer_start_time=start_time
+    ).filter(
+        Q(psychologist_id=psychologist_id) |
+        Q(
+            psychologist__isnull=True,
+            specialization__professionalprofile__user_id=psychologist_id
+        )
+    ).filter(
+        Q(preferred_start_time__isnull=True) |
+        Q(preferred_start_time__lte=start_time, preferred_end_time__gte=end_time)
+    ).annotate(
+        match_rank=Case(
+            When(psychologist_id=psychologist_id, then=0),
+            default=1,
+            output_field=IntegerField()
+        )
+    ).select_related('patient').order_by('match_rank', 'created_at')[:limit]
+
+
+def offer_slot(psychologist_id, appointment_date, start_time, end_time):
+    """
+    Ofrece un horario liberado al mejor candidato. Devuelve la entrada
+    ofrecida o None si no hay candidatos o el horario ya no está libre.
+    """
+    if appointment_date < timezone.localdate():
+        return None
+
+    candidates = list(find_candidates(psychologist_id, appointment_date, start_time, end_time))
+    if not candidates:
+        return None
+
+    psychologist = User.objects.select_related('professional_profile').get(id=psychologist_id)
+
+    for entry in candidates:
+        if entry.patient_id == psychologist_id:
+            continue
+        try:
+            hold = create_hold(
+                patient=entry.patient,
+                psychologist=psychologist,
+                appointment_date=appointment_date,
+                start_time=start_time,
+                duration=WAITLIST_OFFER_DURATION,
+                notes='[Agendada desde lista de espera]',
+            )
+        except SlotUnavailable:
+            return None
+
+        entry.status = 'offered'
+        entry.offer_psychologist_id = psychologist_id
+        entry.offer_date = appointment_date
+        entry.offer_start_time = start_time
+        entry.offer_expires_at = hold.expires_at
+        entry.save(update_fields=[
+            'status', 'offer_psychologist', 'offer_date',
+            'offer_start_time', 'offer_expires_at'
+        ])
+        _notify_offer(entry, psychologist, hold)
+        logger.info(
+            f"Horario {appointment_date} {start_time} ofrecido a {entry.patient.email} "
+            f"(lista de espera {entry.id}) hasta {hold.expires_at}"
+        )
+        return entry
+
+    return None
+
+
+def offer_slot_on_commit(psychologist_id, appointment_date, start_time, end_time):
+    """
+    Ofrece el horario liberado por una cancelación o derivación cuando ésta
+    ya está confirmada. Un fallo de la lista de espera no debe romper ni
+    revertir la cancelación: se registra y el horario queda libre para
+    reservarse de la forma habitual.
+    """
+    def offer():
+        try:
+            offer_slot(psychologist_id, appointment_date, start_time, end_time)
+        except Exception:
+            logger.exception(
+                f"No se pudo ofrecer el horario {appointment_date} {start_time} "
+                f"del psicólogo {psychologist_id} a la lista de espera"
+            )
+
+    transaction.on_commit(offer)
+
+
+def _notify_offer(entry, psychologist, hold):
+    """Avisa al paciente con un push encolado (se envía aunque no abra la app)."""
+    minutes = int(WAITLIST_OFFER_DURATION.total_seconds() // 60)
+    outbox.enqueue(
+        [entry.patient_id],
+        title='Se liberó un horario para ti',
+        body=(
+            f"{psychologist.get_full_name()} - {hold.appointment_date:%d/%m} a las "
+            f"{hold.start_time:%H:%M}. Reservado para ti durante {minutes} minutos."
+        ),
+        url='/waitlist',
+    )
+
+
+def offer_released_slots(released):
+    """Ofrece cada horario (psychologist_id, fecha, inicio, fin) liberado."""
+    offered = 0
+    for psychologist_id, appointment_date, start_time, end_time in released:
+        if offer_slot(psychologist_id, appointment_date, start_time, end_time):
+            offered += 1
+    return offered
+
+
+def expire_offers(now=None):
+    """
+    Devuelve a 'waiting', en un solo UPDATE, las ofertas no aprovechadas.
+    Los datos de la oferta se conservan: find_candidates() no vuelve a
+    ofrecerle ese horario y, si aun así paga por él, la conversión de la
+    reserva marca la entrada como agendada.
+    """
+    return WaitlistEntry.objects.filter(
+        status='offered',
+        offer_expires_at__lte=now or timezone.now()
+    ).update(status='waiting')
+
+
+def close_expired_entries(today=None):
+    """Las entradas cuya ventana de fechas ya pasó dejan de esperar."""
+    return WaitlistEntry.objects.filter(
+        status='waiting',
+        date_to__lt=today or timezone.localdate()
+    ).update(status='expired')
@@ -0,0 +1,24 @@
+# apps/authentication/authentication.py
+
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from . import token_cache
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication con caché por tenant (ver token_cache).
+    En un acierto de caché la autenticación no consulta la BD.
+    """
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get_token(key)
+        if token is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (token.user, token)
@@ -0,0 +1,23 @@
+# apps/authentication/signals.py
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import token_cache
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    # logout_user y change_password borran el token
+    token_cache.invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    # Desactivación, cambio de contraseña o de datos: la instantánea queda vieja
+    if not created:
+        token_cache.invalidate_user(instance.id)
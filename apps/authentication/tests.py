@@ -1,3 +1,54 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django_tenants.test.cases import TenantTestCase
+from rest_framework.authtoken.models import Token
 
-# Create your tests here.
+from . import token_cache
+
+User = get_user_model()
+
+
+class TokenCacheTests(TenantTestCase):
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Clínica de pruebas'
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='paciente@example.com', password='x',
+            first_name='Ana', last_name='Pérez', user_type='patient',
+            phone='7654321', profile_picture='profile_pictures/ana.png'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.addCleanup(token_cache.invalidate_token, self.token.key)
+
+    def test_cache_hit_issues_no_queries(self):
+        token_cache.get_token(self.token.key)
+
+        with CaptureQueriesContext(connection) as context:
+            token = token_cache.get_token(self.token.key)
+            user = token.user
+            # Lo que leen los serializers y permisos habituales
+            values = (
+                user.pk, user.email, user.get_full_name(), user.user_type, user.phone,
+                user.is_active, user.is_verified, user.date_joined, user.last_login,
+                user.profile_picture.name, token.created,
+            )
+
+        self.assertEqual(context.captured_queries, [])
+        self.assertEqual(values[1], 'paciente@example.com')
+        self.assertEqual(values[9], 'profile_pictures/ana.png')
+        self.assertEqual(user.get_deferred_fields(), {'password'})
+
+    def test_deleted_token_is_invalidated(self):
+        token_cache.get_token(self.token.key)
+        self.token.delete()
+        self.assertIsNone(token_cache.get_token(self.token.key))
+
+    def test_deactivated_user_is_invalidated(self):
+        token_cache.get_token(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+        self.assertFalse(token_cache.get_token(self.token.key).user.is_active)
@@ -0,0 +1,157 @@
+# apps/authentication/token_cache.py
+
+"""
+Caché de tokens de autenticación (REST y WebSocket).
+
+Cada token se resuelve a una instantánea: las columnas del Token y todas
+las columnas del usuario salvo la contraseña (que nunca se cachea). En cada
+acierto se reconstruyen instancias nuevas con Model.from_db, sin consultar la
+BD y sin compartir objetos entre peticiones; sólo `password` queda diferido y
+se carga si alguien la lee (check_password).
+
+Dos niveles:
+- En proceso: diccionario LRU con TTL corto (AUTH_TOKEN_CACHE_TTL; 0 lo
+  desactiva).
+- Compartido (opcional, AUTH_TOKEN_SHARED_CACHE): la caché de Django, para
+  que un token resuelto en un worker sirva a los demás.
+
+Las claves incluyen el schema del tenant, porque los tokens son por clínica.
+Las señales de signals.py invalidan al borrar el token (logout, cambio de
+contraseña) o al guardar el usuario (desactivación, contraseña). La
+invalidación borra la entrada compartida y la del worker que la ejecuta, pero
+no el nivel en proceso de los demás workers: ahí un token borrado o un usuario
+desactivado se sigue aceptando hasta AUTH_TOKEN_CACHE_TTL segundos. Ese es el
+retraso máximo asumido; con AUTH_TOKEN_CACHE_TTL=0 sólo queda el nivel
+compartido y la invalidación es inmediata en todos los workers.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.models.fields.files import FieldFile
+from django_tenants.utils import schema_context
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+LOCAL_TTL = getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 30)
+SHARED_TTL = getattr(settings, 'AUTH_TOKEN_SHARED_CACHE_TTL', 300)
+USE_SHARED_CACHE = getattr(settings, 'AUTH_TOKEN_SHARED_CACHE', False)
+LOCAL_MAX_ENTRIES = 5000
+
+# Columnas del usuario que nunca se cachean (tampoco en Redis)
+USER_EXCLUDED_FIELDS = {'password'}
+
+# from_db espera los valores en el orden de concrete_fields
+_USER_FIELDS = [
+    field.attname for field in User._meta.concrete_fields
+    if field.attname not in USER_EXCLUDED_FIELDS
+]
+_TOKEN_FIELDS = [field.attname for field in Token._meta.concrete_fields]
+
+_local = OrderedDict()
+_lock = threading.Lock()
+
+
+def _tenant():
+    return getattr(connection, 'schema_name', 'public')
+
+
+def _key(token_key, schema_name=None):
+    return f'auth_token:{schema_name or _tenant()}:{token_key}'
+
+
+def _local_get(key):
+    if LOCAL_TTL <= 0:
+        return None
+    with _lock:
+        entry = _local.get(key)
+        if entry is None:
+            return None
+        expires_at, snapshot = entry
+        if expires_at < time.monotonic():
+            del _local[key]
+            return None
+        _local.move_to_end(key)
+        return snapshot
+
+
+def _local_set(key, snapshot):
+    if LOCAL_TTL <= 0:
+        return
+    with _lock:
+        _local[key] = (time.monotonic() + LOCAL_TTL, snapshot)
+        _local.move_to_end(key)
+        while len(_local) > LOCAL_MAX_ENTRIES:
+            _local.popitem(last=False)
+
+
+def _db_value(value):
+    # Las imágenes se guardan como el nombre del fichero, igual que en la BD
+    return value.name if isinstance(value, FieldFile) else value
+
+
+def _snapshot(token):
+    return (
+        tuple(getattr(token, name) for name in _TOKEN_FIELDS),
+        tuple(_db_value(getattr(token.user, name)) for name in _USER_FIELDS),
+    )
+
+
+def _restore(snapshot):
+    token_values, user_values = snapshot
+    db = connection.alias
+    user = User.from_db(db, _USER_FIELDS, user_values)
+    token = Token.from_db(db, _TOKEN_FIELDS, token_values)
+    token.user = user
+    return token
+
+
+def get_token(token_key, schema_name=None):
+    """
+    Devuelve el Token (con .user cargado) o None si no existe.
+    En un acierto de caché no hace ninguna consulta. schema_name permite
+    resolverlo fuera de una petición HTTP (p. ej. en un WebSocket).
+    """
+    schema_name = schema_name or _tenant()
+    key = _key(token_key, schema_name)
+
+    snapshot = _local_get(key)
+    if snapshot is None and USE_SHARED_CACHE:
+        snapshot = cache.get(key)
+        if snapshot is not None:
+            _local_set(key, snapshot)
+
+    if snapshot is None:
+        try:
+            with schema_context(schema_name):
+                token = Token.objects.select_related('user').defer(
+                    *(f'user__{name}' for name in USER_EXCLUDED_FIELDS)
+                ).get(key=token_key)
+        except Token.DoesNotExist:
+            return None
+        snapshot = _snapshot(token)
+        _local_set(key, snapshot)
+        if USE_SHARED_CACHE:
+            cache.set(key, snapshot, SHARED_TTL)
+
+    return _restore(snapshot)
+
+
+def invalidate_token(token_key, schema_name=None):
+    key = _key(token_key, schema_name)
+    with _lock:
+        _local.pop(key, None)
+    if USE_SHARED_CACHE:
+        cache.delete(key)
+
+
+def invalidate_user(user_id):
+    """Invalida todos los tokens de un usuario en el tenant actual."""
+    for token_key in Token.objects.filter(user_id=user_id).values_list('key', flat=True):
+        invalidate_token(token_key)
@@ -0,0 +1,96 @@
+# apps/backups/direct_uploads.py
+
+"""
+Subidas directas a S3 mediante POST prefirmado.
+
+1. create_upload(): genera una clave única dentro de la carpeta del tenant y
+   un POST prefirmado limitado a esa clave, ese content type y ese tamaño.
+   Devuelve además un upload_token firmado que liga la clave al usuario.
+2. El cliente sube el archivo directamente a S3 (el worker no lo toca).
+3. confirm_upload(): valida el upload_token y comprueba con un HEAD que el
+   objeto existe; la vista que confirma registra entonces los metadatos.
+"""
+
+import os
+import uuid
+
+from django.core import signing
+from django.db import connection
+from django.utils import timezone
+
+from .s3_storage import S3BackupStorage
+
+UPLOAD_URL_EXPIRATION = 15 * 60
+# El token de confirmación vive algo más que la firma de subida
+UPLOAD_TOKEN_MAX_AGE = UPLOAD_URL_EXPIRATION + 15 * 60
+UPLOAD_TOKEN_SALT = 'direct-upload'
+
+
+class UploadError(Exception):
+    """Subida no válida, vencida o todavía no completada."""
+
+
+def _tenant():
+    return getattr(connection, 'schema_name', 'public')
+
+
+def build_key(category, filename):
+    """media/<tenant>/<categoría>/AAAA/MM/DD/<uuid><ext>"""
+    extension = os.path.splitext(filename)[1].lower()[:10]
+    return f"media/{_tenant()}/{category}/{timezone.now():%Y/%m/%d}/{uuid.uuid4().hex}{extension}"
+
+
+def create_upload(user_id, category, filename, content_type, size, max_size, **extra):
+    """
+    Prepara una subida directa. `extra` se firma junto con la clave (p. ej.
+    el paciente o la cita) para que la confirmación no pueda cambiarlo.
+    """
+    if size <= 0 or size > max_size:
+        raise UploadError(f'El archivo debe pesar entre 1 byte y {max_size // (1024 * 1024)} MB')
+
+    s3_key = build_key(category, filename)
+    presigned = S3BackupStorage().generate_presigned_upload(
+        s3_key, content_type, max_size, expiration=UPLOAD_URL_EXPIRATION
+    )
+    if presigned is None:
+        raise UploadError('No se pudo preparar la subida')
+
+    upload_token = signing.dumps({
+        'key': s3_key,
+        'user': user_id,
+        'tenant': _tenant(),
+        'category': category,
+        'filename': os.path.basename(filename)[:255],
+        'content_type': content_type,
+        **extra,
+    }, salt=UPLOAD_TOKEN_SALT)
+
+    return {
+        'upload_url': presigned['url'],
+        'fields': presigned['fields'],
+        'upload_token': upload_token,
+        'expires_in': UPLOAD_URL_EXPIRATION,
+    }
+
+
+def confirm_upload(upload_token, user_id, category):
+    """
+    Valida el token y que el objeto exista en S3. Devuelve los datos
+    firmados más 'size'. Lanza UploadError si algo no cuadra.
+    """
+    try:
+        data = signing.loads(upload_token, salt=UPLOAD_TOKEN_SALT, max_age=UPLOAD_TOKEN_MAX_AGE)
+    except signing.SignatureExpired:
+        raise UploadError('La subida ha vencido, vuelve a intentarlo')
+    except signing.BadSignature:
+        raise UploadError('upload_token inválido')
+
+    if data['user'] != user_id or data['tenant'] != _tenant() or data['category'] != category:
+        raise UploadError('upload_token inválido')
+
+    metadata = S3BackupStorage().head_file(data['key'])
+    if metadata is None:
+        raise UploadError('El archivo todavía no se ha subido')
+
+    data['size'] = metadata['size']
+    return data
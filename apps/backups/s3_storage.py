@@ -20,7 +20,8 @@ class S3BackupStorage:
                 's3',
                 aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
                 aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                region_name=self.region
+                region_name=self.region,
+                endpoint_url=getattr(settings, 'AWS_S3_ENDPOINT_URL', None)
             )
             logger.info(f"✅ Cliente S3 inicializado correctamente para bucket: {self.bucket_name}")
         except NoCredentialsError:
@@ -256,3 +257,63 @@ class S3BackupStorage:
         except Exception as e:
             logger.error(f"Error inesperado al generar URL: {e}")
             return None
+
+    def generate_presigned_upload(self, s3_key, content_type, max_size, expiration=900):
+        """
+        Genera un POST prefirmado para que el cliente suba el archivo
+        directamente a S3, sin pasar por el worker de Django.
+        
+        Args:
+            s3_key: Ruta exacta donde debe quedar el archivo
+            content_type: MIME type que el cliente debe enviar
+            max_size: Tamaño máximo permitido en bytes
+            expiration: Validez de la firma en segundos (por defecto 15 minutos)
+        
+        Returns:
+            dict: {'url': ..., 'fields': {...}} o None si falla
+        """
+        try:
+            presigned = self.s3_client.generate_presigned_post(
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                Fields={
+                    'Content-Type': content_type,
+                    'x-amz-server-side-encryption': 'AES256',
+                },
+                Conditions=[
+                    {'Content-Type': content_type},
+                    {'x-amz-server-side-encryption': 'AES256'},
+                    ['content-length-range', 1, max_size],
+                ],
+                ExpiresIn=expiration
+            )
+            logger.info(f"URL de subida prefirmada generada para {s3_key}")
+            return presigned
+        except ClientError as e:
+            logger.error(f"Error al generar subida prefirmada: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Error inesperado al generar subida prefirmada: {e}")
+            return None
+    
+    def head_file(self, s3_key):
+        """
+        Obtiene los metadatos de un archivo sin descargarlo
+        
+        Args:
+            s3_key: Ruta del archivo en S3
+        
+        Returns:
+            dict: {'size': ..., 'content_type': ...} o None si no existe
+        """
+        try:
+            response = self.s3_client.head_object(
+                Bucket=self.bucket_name,
+                Key=s3_key
+            )
+            return {
+                'size': response['ContentLength'],
+                'content_type': response.get('ContentType', 'application/octet-stream'),
+            }
+        except ClientError:
+            return None
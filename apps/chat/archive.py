@@ -0,0 +1,193 @@
+# apps/chat/archive.py
+
+"""
+Archivado de conversaciones antiguas del chat.
+
+archive_appointment() serializa los mensajes de una cita en un JSON
+comprimido con gzip, lo sube a S3 (chat_archive/<tenant>/), guarda una fila
+índice ArchivedConversation y borra los mensajes originales por lotes.
+Si la cita ya tenía archivo (llegaron mensajes después), se fusionan y se
+sube un blob nuevo; sólo se añaden los mensajes posteriores a
+last_message_id, así que repetir una pasada interrumpida no duplica nada.
+
+archived_messages_after/before() leen el blob de forma transparente para
+las vistas.
+Los blobs se cachean en un LRU por proceso con la storage_key como clave:
+cada archivado genera una clave nueva, así que nunca se sirve un blob viejo.
+"""
+
+import gzip
+import json
+import logging
+from datetime import timedelta
+from functools import lru_cache
+from types import SimpleNamespace
+
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from apps.appointments.models import Appointment
+from apps.backups.s3_storage import S3BackupStorage
+from .attachments import attachment_payload
+from .models import ArchivedConversation, ChatMessage
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = 180
+DELETE_BATCH_SIZE = 1000
+ARCHIVABLE_STATUSES = ('completed', 'no_show', 'cancelled')
+ARCHIVE_CACHE_SIZE = 128
+
+MESSAGE_COLUMNS = (
+    'id', 'sender_id', 'sender__username', 'message', 'timestamp',
+    'attachment_key', 'attachment_name', 'attachment_content_type', 'attachment_size',
+)
+
+
+def _tenant():
+    return getattr(connection, 'schema_name', 'public')
+
+
+def archivable_appointment_ids(days=ARCHIVE_AFTER_DAYS):
+    """Citas terminadas hace más de `days` días que todavía tienen mensajes."""
+    cutoff = timezone.localdate() - timedelta(days=days)
+    return list(
+        ChatMessage.objects.filter(
+            appointment_id__in=Appointment.objects.filter(
+                status__in=ARCHIVABLE_STATUSES,
+                appointment_date__lt=cutoff
+            ).values('id')
+        ).order_by().values_list('appointment_id', flat=True).distinct()
+    )
+
+
+def _serialize(row):
+    return {
+        'id': row['id'],
+        'sender': row['sender_id'],
+        'sender_name': row['sender__username'],
+        'message': row['message'],
+        'timestamp': row['timestamp'].isoformat(),
+        'attachment_key': row['attachment_key'],
+        'attachment_name': row['attachment_name'],
+        'attachment_content_type': row['attachment_content_type'],
+        'attachment_size': row['attachment_size'],
+    }
+
+
+def archive_appointment(appointment_id, batch_size=DELETE_BATCH_SIZE):
+    """
+    Archiva los mensajes de una cita. Devuelve el número de mensajes
+    movidos al blob en esta pasada (0 si no había nada nuevo).
+    """
+    existing = ArchivedConversation.objects.filter(appointment_id=appointment_id).first()
+    pending = ChatMessage.objects.filter(appointment_id=appointment_id)
+    if existing:
+        # Los mensajes hasta last_message_id ya están en el blob: si una pasada
+        # anterior se cortó antes de borrarlos, no se vuelven a añadir
+        pending = pending.filter(id__gt=existing.last_message_id)
+
+    rows = [
+        _serialize(row)
+        for row in pending.order_by('id').values(*MESSAGE_COLUMNS).iterator(chunk_size=2000)
+    ]
+    if not rows:
+        if existing:
+            _delete_archived(appointment_id, existing.last_message_id, batch_size)
+        return 0
+
+    messages = (list(_load_blob(existing.storage_key)) if existing else []) + rows
+
+    blob = gzip.compress(
+        json.dumps(messages, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    )
+    storage = S3BackupStorage()
+    result = storage.upload_file(
+        blob,
+        f"{appointment_id}-{timezone.now():%Y%m%d%H%M%S}.json.gz",
+        folder=f"chat_archive/{_tenant()}",
+        content_type='application/gzip'
+    )
+    if not result['success']:
+        raise RuntimeError(result['error'])
+
+    last_archived_id = rows[-1]['id']
+    ArchivedConversation.objects.update_or_create(
+        appointment_id=appointment_id,
+        defaults={
+            'storage_key': result['s3_key'],
+            'message_count': len(messages),
+            'first_message_id': messages[0]['id'],
+            'last_message_id': last_archived_id,
+            'first_timestamp': messages[0]['timestamp'],
+            'last_timestamp': messages[-1]['timestamp'],
+            'compressed_size': len(blob),
+        }
+    )
+
+    _delete_archived(appointment_id, last_archived_id, batch_size)
+
+    if existing and existing.storage_key != result['s3_key']:
+        storage.delete_backup(existing.storage_key)
+
+    logger.info(
+        f"Chat de la cita {appointment_id} archivado: {len(rows)} mensajes nuevos, "
+        f"{len(messages)} en total, {len(blob)} bytes"
+    )
+    return len(rows)
+
+
+def _delete_archived(appointment_id, last_archived_id, batch_size):
+    """Borra por lotes lo que ya quedó en el blob (los mensajes nuevos siguen vivos)."""
+    while True:
+        batch = list(
+            ChatMessage.objects.filter(
+                appointment_id=appointment_id,
+                id__lte=last_archived_id
+            ).values_list('id', flat=True)[:batch_size]
+        )
+        if not batch:
+            break
+        ChatMessage.objects.filter(id__in=batch).delete()
+
+
+@lru_cache(maxsize=ARCHIVE_CACHE_SIZE)
+def _load_blob(storage_key):
+    content = S3BackupStorage().download_file(storage_key)
+    return tuple(json.loads(gzip.decompress(content)))
+
+
+def _to_payload(archive, message):
+    """Mismo formato que ChatMessageSerializer."""
+    return {
+        'id': message['id'],
+        'appointment_id': archive.appointment_id,
+        'sender': message['sender'],
+        'sender_name': message['sender_name'],
+        'message': message['message'],
+        'timestamp': parse_datetime(message['timestamp']),
+        'attachment': attachment_payload(SimpleNamespace(**message)),
+    }
+
+
+def archived_messages_after(archive, after_id):
+    """Mensajes archivados con id > after_id, del más antiguo al más nuevo."""
+    return [
+        _to_payload(archive, message)
+        for message in _load_blob(archive.storage_key)
+        if message['id'] > after_id
+    ]
+
+
+def archived_messages_before(archive, before_id, limit):
+    """
+    Hasta `limit` mensajes archivados con id < before_id (None = sin límite),
+    del más antiguo al más nuevo, y si quedan más anteriores.
+    """
+    older = [
+        message for message in _load_blob(archive.storage_key)
+        if before_id is None or message['id'] < before_id
+    ]
+    page = older[-limit:] if limit else []
+    return [_to_payload(archive, message) for message in page], len(older) > len(page)
@@ -0,0 +1,40 @@
+# apps/chat/attachments.py
+
+"""
+Adjuntos del chat. Los archivos se suben directamente a S3 con un POST
+prefirmado (apps.backups.direct_uploads); aquí sólo se guarda su clave y se
+generan URLs de descarga prefirmadas, sin pasar el archivo por Django.
+"""
+
+from apps.backups.s3_storage import S3BackupStorage
+
+MAX_ATTACHMENT_SIZE = 10 * 1024 * 1024
+ATTACHMENT_CONTENT_TYPES = {
+    'application/pdf',
+    'image/png',
+    'image/jpeg',
+    'image/gif',
+    'image/webp',
+}
+DOWNLOAD_URL_EXPIRATION = 60 * 60
+
+_storage = None
+
+
+def _get_storage():
+    # Un solo cliente S3 por proceso: crearlo por mensaje sería caro
+    global _storage
+    if _storage is None:
+        _storage = S3BackupStorage()
+    return _storage
+
+
+def attachment_payload(message):
+    if not message.attachment_key:
+        return None
+    return {
+        'name': message.attachment_name,
+        'content_type': message.attachment_content_type,
+        'size': message.attachment_size,
+        'url': _get_storage().get_backup_url(message.attachment_key, expiration=DOWNLOAD_URL_EXPIRATION),
+    }
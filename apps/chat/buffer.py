@@ -0,0 +1,110 @@
+# apps/chat/buffer.py
+
+"""
+Buffer de escritura diferida (write-behind) para los mensajes del chat.
+
+El consumidor difunde cada mensaje en cuanto llega, sin esperar a la BD, y
+lo encola aquí. El buffer agrupa los mensajes por sala (tenant, cita) y los
+guarda con un único bulk_create cuando la sala acumula FLUSH_SIZE mensajes
+o pasa FLUSH_INTERVAL desde el primero pendiente. Tras guardar, envía al
+grupo de la sala un evento 'chat.stored' con el id definitivo de cada
+mensaje, así los clientes WebSocket y los de polling ven el mismo historial.
+Los guardados de una misma sala se serializan para que los ids respeten el
+orden de difusión (el polling con ?last_id= no puede saltarse mensajes).
+"""
+
+import asyncio
+import logging
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django_tenants.utils import schema_context
+
+from .models import ChatMessage
+from .notifier import notify_new_messages
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SIZE = 50
+FLUSH_INTERVAL = 0.25  # segundos
+
+
+@database_sync_to_async
+def _bulk_save(schema_name, rows):
+    with schema_context(schema_name):
+        return ChatMessage.objects.bulk_create(rows)
+
+
+class MessageWriteBuffer:
+    """Un buffer por proceso, compartido por todos los consumidores del event loop."""
+
+    def __init__(self):
+        self._rooms = {}
+        self._timers = {}
+        self._locks = {}
+
+    def add(self, schema_name, room_group_name, appointment_id, sender_id, message, client_id):
+        room = (schema_name, room_group_name)
+        pending = self._rooms.setdefault(room, [])
+        pending.append((
+            client_id,
+            ChatMessage(appointment_id=appointment_id, sender_id=sender_id, message=message)
+        ))
+
+        if len(pending) >= FLUSH_SIZE:
+            self._schedule(room, delay=0)
+        elif room not in self._timers:
+            self._schedule(room, delay=FLUSH_INTERVAL)
+
+    async def flush_room(self, schema_name, room_group_name):
+        """Guarda de inmediato lo pendiente de una sala (p. ej. al desconectarse)."""
+        await self._flush((schema_name, room_group_name))
+
+    def _schedule(self, room, delay):
+        timer = self._timers.pop(room, None)
+        if timer:
+            timer.cancel()
+        self._timers[room] = asyncio.ensure_future(self._flush_later(room, delay))
+
+    async def _flush_later(self, room, delay):
+        if delay:
+            await asyncio.sleep(delay)
+        self._timers.pop(room, None)
+        await self._flush(room)
+
+    async def _flush(self, room):
+        lock = self._locks.setdefault(room, asyncio.Lock())
+        async with lock:
+            pending = self._rooms.pop(room, None)
+            if not pending:
+                return
+
+            schema_name, room_group_name = room
+            channel_layer = get_channel_layer()
+
+            try:
+                saved = await _bulk_save(schema_name, [row for _, row in pending])
+            except Exception as e:
+                logger.error(f'Error guardando {len(pending)} mensajes de {room_group_name}: {e}')
+                await channel_layer.group_send(room_group_name, {
+                    'type': 'chat.failed',
+                    'client_ids': [client_id for client_id, _ in pending],
+                })
+                return
+
+            await channel_layer.group_send(room_group_name, {
+                'type': 'chat.stored',
+                'messages': [
+                    {
+                        'client_id': client_id,
+                        'id': message.id,
+                        'timestamp': message.timestamp.isoformat(),
+                    }
+                    for (client_id, _), message in zip(pending, saved)
+                ],
+            })
+            # bulk_create no dispara señales: avisamos al long-polling / SSE aquí
+            await notify_new_messages(schema_name, saved[-1].appointment_id, saved[-1].id)
+
+
+message_buffer = MessageWriteBuffer()
@@ -1,16 +1,53 @@
 # apps/chat/consumers.py
 import json
+import uuid
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.db.models import Q
+from django_tenants.utils import schema_context
+
+from apps.appointments.models import Appointment
+from .buffer import message_buffer
+from .presence import presence_tracker, typing_throttle, HEARTBEAT_INTERVAL
+
+
+@database_sync_to_async
+def is_participant(schema_name, user, appointment_id):
+    # Misma comprobación que views._is_participant, en el schema del tenant
+    with schema_context(schema_name):
+        return Appointment.objects.filter(
+            Q(patient=user) | Q(psychologist=user),
+            id=appointment_id
+        ).exists()
+
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        self.appointment_id = self.scope['url_route']['kwargs']['appointment_id']
-        self.room_group_name = f'chat_{self.appointment_id}'
         self.user = self.scope.get('user')
+        tenant = self.scope.get('tenant')
 
-        if self.user.is_anonymous:
+        try:
+            self.appointment_id = int(self.scope['url_route']['kwargs']['appointment_id'])
+        except ValueError:
+            self.appointment_id = None
+
+        # Sin tenant (dominio o ?tenant=) no hay citas: se rechaza la conexión
+        if (
+            self.user is None or self.user.is_anonymous
+            or tenant is None or tenant.schema_name == 'public'
+            or self.appointment_id is None
+        ):
+            await self.close()
+            return
+
+        # Sólo el paciente y el psicólogo de la cita pueden entrar en la sala
+        if not await is_participant(tenant.schema_name, self.user, self.appointment_id):
             await self.close()
         else:
+            self.schema_name = tenant.schema_name
+            # El channel layer es compartido por todos los tenants
+            self.room_group_name = f'chat_{self.schema_name}_{self.appointment_id}'
+
             # Unirse al grupo de la sala
             await self.channel_layer.group_add(
                 self.room_group_name,
@@ -18,7 +55,31 @@ class ChatConsumer(AsyncWebsocketConsumer):
             )
             await self.accept()
 
+            # Presencia: sólo se avisa a la sala cuando el usuario entra
+            if await presence_tracker.connect(
+                self.schema_name, self.appointment_id, self.user.id, self.channel_name
+            ):
+                await self._broadcast_presence(True)
+            await self.send(text_data=json.dumps({
+                'type': 'hello',
+                'heartbeat_interval': HEARTBEAT_INTERVAL
+            }))
+
     async def disconnect(self, close_code):
+        # Conexión rechazada en connect(): no llegó a unirse a la sala
+        if not hasattr(self, 'room_group_name'):
+            return
+
+        if not self.user.is_anonymous:
+            typing_throttle.forget(self.room_group_name, self.user.id)
+            if await presence_tracker.disconnect(
+                self.schema_name, self.appointment_id, self.user.id, self.channel_name
+            ):
+                await self._broadcast_presence(False)
+
+        # Guardar lo pendiente de la sala antes de salir
+        await message_buffer.flush_room(self.schema_name, self.room_group_name)
+
         # Salir del grupo de la sala
         await self.channel_layer.group_discard(
             self.room_group_name,
@@ -27,20 +88,57 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     # Recibir mensaje desde WebSocket
     async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message = text_data_json['message']
+        # Los frames mal formados se ignoran sin cerrar la conexión
+        try:
+            text_data_json = json.loads(text_data or '')
+        except ValueError:
+            return
+        if not isinstance(text_data_json, dict):
+            return
+
+        # Mensajes de control: {"type": "heartbeat"} y {"type": "typing", "is_typing": true}
+        message_type = text_data_json.get('type')
+        if message_type == 'heartbeat':
+            await presence_tracker.heartbeat(self.schema_name, self.appointment_id, self.user.id)
+            return
+        if message_type == 'typing':
+            await typing_throttle.typing(
+                self.room_group_name,
+                self.user.id,
+                bool(text_data_json.get('is_typing', True)),
+                self._broadcast_typing
+            )
+            return
+
+        message = text_data_json.get('message')
+        if not message or not isinstance(message, str):
+            return
+        # El cliente puede mandar su propio id para reconocer la confirmación
+        client_id = str(text_data_json.get('client_id') or uuid.uuid4())
         sender_name = self.user.first_name if self.user.first_name else self.user.username
 
-        # Enviar mensaje al grupo de la sala
+        # Enviar mensaje al grupo de la sala (sin esperar a la BD)
         await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'chat_message',
                 'message': message,
-                'sender': sender_name
+                'sender': sender_name,
+                'sender_id': self.user.id,
+                'client_id': client_id
             }
         )
 
+        # Se guarda en segundo plano; el id llega luego con 'chat_stored'
+        message_buffer.add(
+            self.schema_name,
+            self.room_group_name,
+            self.appointment_id,
+            self.user.id,
+            message,
+            client_id
+        )
+
     # Recibir mensaje desde el grupo de la sala
     async def chat_message(self, event):
         message = event['message']
@@ -49,5 +147,51 @@ class ChatConsumer(AsyncWebsocketConsumer):
         # Enviar mensaje al WebSocket
         await self.send(text_data=json.dumps({
             'message': message,
-            'sender': sender
-        }))
\ No newline at end of file
+            'sender': sender,
+            'sender_id': event['sender_id'],
+            'client_id': event['client_id']
+        }))
+
+    # Confirmación de guardado: id definitivo de cada mensaje
+    async def chat_stored(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'stored',
+            'messages': event['messages']
+        }))
+
+    async def chat_failed(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'failed',
+            'client_ids': event['client_ids']
+        }))
+
+    async def _broadcast_presence(self, online):
+        await self.channel_layer.group_send(self.room_group_name, {
+            'type': 'chat_presence',
+            'user_id': self.user.id,
+            'online': online
+        })
+
+    async def _broadcast_typing(self, is_typing):
+        await self.channel_layer.group_send(self.room_group_name, {
+            'type': 'chat_typing',
+            'user_id': self.user.id,
+            'is_typing': is_typing
+        })
+
+    async def chat_presence(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'presence',
+            'user_id': event['user_id'],
+            'online': event['online']
+        }))
+
+    async def chat_typing(self, event):
+        # No se devuelve el indicador a quien escribe
+        if event['user_id'] == self.user.id:
+            return
+        await self.send(text_data=json.dumps({
+            'type': 'typing',
+            'user_id': event['user_id'],
+            'is_typing': event['is_typing']
+        }))
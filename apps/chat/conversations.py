@@ -0,0 +1,141 @@
+# apps/chat/conversations.py
+
+"""
+Lista de conversaciones ("mis chats") y cursores de lectura.
+
+list_conversations() resuelve todo en una consulta: por cada cita del
+usuario con mensajes, un LATERAL toma el último mensaje por el índice
+(appointment_id, id) y otro cuenta sólo los mensajes posteriores al cursor
+de lectura (ChatReadCursor), que es un rango corto del mismo índice.
+Las conversaciones archivadas (ArchivedConversation) ya no tienen filas en
+la tabla de mensajes: siguen en la lista con el id y la fecha del último
+mensaje del índice del archivo, sin texto ni remitente.
+mark_read() avanza el cursor con un upsert que nunca retrocede.
+"""
+
+from django.db import connection
+
+from apps.appointments.models import Appointment
+from apps.users.models import CustomUser
+from .models import ArchivedConversation, ChatMessage, ChatReadCursor
+
+CONVERSATIONS_SQL = """
+SELECT
+    ap.id,
+    ap.appointment_date,
+    ap.start_time,
+    ap.status,
+    other.id,
+    other.first_name,
+    other.last_name,
+    other.user_type,
+    COALESCE(last_message.id, archived.last_message_id) AS last_id,
+    last_message.sender_id,
+    last_message.message,
+    COALESCE(last_message.timestamp, archived.last_timestamp),
+    unread.total
+FROM {appointment} AS ap
+JOIN {users} AS other
+    ON other.id = CASE WHEN ap.patient_id = %(user_id)s THEN ap.psychologist_id ELSE ap.patient_id END
+LEFT JOIN LATERAL (
+    SELECT msg.id, msg.sender_id, msg.message, msg.timestamp
+    FROM {message} AS msg
+    WHERE msg.appointment_id = ap.id
+    ORDER BY msg.id DESC
+    LIMIT 1
+) AS last_message ON TRUE
+LEFT JOIN {archived} AS archived
+    ON archived.appointment_id = ap.id
+LEFT JOIN {cursor} AS rc
+    ON rc.appointment_id = ap.id AND rc.user_id = %(user_id)s
+CROSS JOIN LATERAL (
+    SELECT COUNT(*) AS total
+    FROM {message} AS msg
+    WHERE msg.appointment_id = ap.id
+      AND msg.id > COALESCE(rc.last_read_id, 0)
+      AND msg.sender_id <> %(user_id)s
+) AS unread
+WHERE (ap.patient_id = %(user_id)s OR ap.psychologist_id = %(user_id)s)
+  AND (last_message.id IS NOT NULL OR archived.id IS NOT NULL)
+ORDER BY last_id DESC
+LIMIT %(limit)s OFFSET %(offset)s
+"""
+
+MARK_READ_SQL = """
+INSERT INTO {cursor} (appointment_id, user_id, last_read_id, updated_at)
+VALUES (
+    %(appointment_id)s,
+    %(user_id)s,
+    COALESCE(
+        %(last_read_id)s,
+        (SELECT MAX(id) FROM {message} WHERE appointment_id = %(appointment_id)s),
+        (SELECT last_message_id FROM {archived} WHERE appointment_id = %(appointment_id)s),
+        0
+    ),
+    NOW()
+)
+ON CONFLICT (appointment_id, user_id) DO UPDATE
+SET last_read_id = GREATEST({cursor}.last_read_id, EXCLUDED.last_read_id),
+    updated_at = EXCLUDED.updated_at
+RETURNING last_read_id
+"""
+
+
+def _tables():
+    quote = connection.ops.quote_name
+    return {
+        'appointment': quote(Appointment._meta.db_table),
+        'users': quote(CustomUser._meta.db_table),
+        'message': quote(ChatMessage._meta.db_table),
+        'cursor': quote(ChatReadCursor._meta.db_table),
+        'archived': quote(ArchivedConversation._meta.db_table),
+    }
+
+
+def list_conversations(user_id, limit=50, offset=0):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            CONVERSATIONS_SQL.format(**_tables()),
+            {'user_id': user_id, 'limit': limit, 'offset': offset}
+        )
+        rows = cursor.fetchall()
+
+    return [
+        {
+            'appointment_id': appointment_id,
+            'appointment_date': appointment_date,
+            'start_time': start_time,
+            'appointment_status': appointment_status,
+            'other_user': {
+                'id': other_id,
+                'name': f'{first_name} {last_name}'.strip(),
+                'user_type': user_type,
+            },
+            'last_message': {
+                'id': message_id,
+                'sender': sender_id,
+                'message': message,
+                'timestamp': timestamp,
+            },
+            'unread_count': unread,
+        }
+        for (
+            appointment_id, appointment_date, start_time, appointment_status,
+            other_id, first_name, last_name, user_type,
+            message_id, sender_id, message, timestamp, unread
+        ) in rows
+    ]
+
+
+def mark_read(appointment_id, user_id, last_read_id=None):
+    """
+    Avanza el cursor de lectura (por defecto hasta el último mensaje).
+    Devuelve el last_read_id resultante.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(MARK_READ_SQL.format(**_tables()), {
+            'appointment_id': appointment_id,
+            'user_id': user_id,
+            'last_read_id': last_read_id,
+        })
+        return cursor.fetchone()[0]
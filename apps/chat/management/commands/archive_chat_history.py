@@ -0,0 +1,78 @@
+# apps/chat/management/commands/archive_chat_history.py
+
+"""
+Comando para archivar el chat de las citas terminadas hace tiempo.
+Ejecutar con: python manage.py archive_chat_history [--days 180] [--batch-size 1000]
+
+Por cada tenant, los mensajes de cada cita terminada hace más de --days días
+se mueven a un blob gzip en S3 (ver apps/chat/archive.py) y se borran de la
+tabla por lotes. Es idempotente: una cita ya archivada sólo vuelve a
+procesarse si recibió mensajes nuevos.
+"""
+
+from django.core.management.base import BaseCommand
+from django_tenants.utils import schema_context, get_tenant_model
+
+from apps.chat.archive import (
+    ARCHIVE_AFTER_DAYS,
+    DELETE_BATCH_SIZE,
+    archivable_appointment_ids,
+    archive_appointment,
+)
+
+
+class Command(BaseCommand):
+    help = 'Archiva en S3 el chat de las citas terminadas hace más de N días'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=ARCHIVE_AFTER_DAYS,
+            help=f'Antigüedad mínima de la cita en días (por defecto {ARCHIVE_AFTER_DAYS})'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DELETE_BATCH_SIZE,
+            help=f'Mensajes borrados por lote (por defecto {DELETE_BATCH_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        Tenant = get_tenant_model()
+        tenants = Tenant.objects.exclude(schema_name='public')
+
+        total_conversations = 0
+        total_messages = 0
+        errors = 0
+
+        for tenant in tenants:
+            with schema_context(tenant.schema_name):
+                conversations = 0
+                messages = 0
+                for appointment_id in archivable_appointment_ids(options['days']):
+                    try:
+                        archived = archive_appointment(appointment_id, options['batch_size'])
+                    except Exception as e:
+                        errors += 1
+                        self.stdout.write(
+                            self.style.ERROR(f'❌ {tenant.schema_name}, cita {appointment_id}: {e}')
+                        )
+                        continue
+                    if archived:
+                        conversations += 1
+                        messages += archived
+
+                if conversations:
+                    self.stdout.write(
+                        f'🏥 {tenant.schema_name}: {conversations} conversaciones, {messages} mensajes archivados'
+                    )
+                total_conversations += conversations
+                total_messages += messages
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'📊 Total: {total_conversations} conversaciones, {total_messages} mensajes '
+                f'archivados ({errors} con errores)'
+            )
+        )
@@ -0,0 +1,84 @@
+"""
+Comando para medir el channel layer configurado (CHANNEL_LAYER_BACKEND).
+Ejecutar con: python manage.py benchmark_channel_layer --rooms 10 --receivers 2 --messages 500
+
+Cada sala tiene varios receptores unidos a su grupo; se envían N mensajes
+por sala con group_send y se comprueba que cada receptor los reciba todos
+(fan-out). Informa mensajes por segundo por sala.
+"""
+
+import asyncio
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Mide el fan-out y el throughput del channel layer configurado'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=10, help='Número de salas (grupos)')
+        parser.add_argument('--receivers', type=int, default=2, help='Receptores por sala')
+        parser.add_argument('--messages', type=int, default=500, help='Mensajes por sala')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Tiempo máximo en segundos')
+
+    def handle(self, *args, **options):
+        backend = settings.CHANNEL_LAYERS['default']['BACKEND']
+        self.stdout.write(f'🔌 Channel layer: {backend}')
+
+        results = async_to_sync(self._run)(
+            options['rooms'], options['receivers'], options['messages'], options['timeout']
+        )
+
+        expected = options['messages'] * options['receivers']
+        failed = [room for room, (received, _) in results.items() if received != expected]
+        for room, (received, elapsed) in sorted(results.items()):
+            rate = options['messages'] / elapsed if elapsed else 0
+            self.stdout.write(f'   {room}: {received}/{expected} entregas, {rate:,.0f} msg/s')
+
+        total_elapsed = max(elapsed for _, elapsed in results.values())
+        total_rate = options['rooms'] * options['messages'] / total_elapsed if total_elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(f'📊 Total: {total_rate:,.0f} msg/s en {options["rooms"]} salas')
+        )
+
+        if failed:
+            raise CommandError(f'Fan-out incompleto en {len(failed)} salas: {", ".join(failed)}')
+
+    async def _run(self, rooms, receivers, messages, timeout):
+        channel_layer = get_channel_layer()
+        groups = [f'benchmark_room_{index}' for index in range(rooms)]
+
+        channels = {}
+        for group in groups:
+            channels[group] = [await channel_layer.new_channel() for _ in range(receivers)]
+            for channel in channels[group]:
+                await channel_layer.group_add(group, channel)
+
+        async def receive_all(channel):
+            received = 0
+            while received < messages:
+                await channel_layer.receive(channel)
+                received += 1
+            return received
+
+        async def run_room(group):
+            start = time.perf_counter()
+            receiving = [asyncio.ensure_future(receive_all(channel)) for channel in channels[group]]
+            for sequence in range(messages):
+                await channel_layer.group_send(group, {'type': 'benchmark.message', 'sequence': sequence})
+            done, pending = await asyncio.wait(receiving, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            received = sum(task.result() for task in done)
+            return group, (received, time.perf_counter() - start)
+
+        try:
+            return dict(await asyncio.gather(*(run_room(group) for group in groups)))
+        finally:
+            for group in groups:
+                for channel in channels[group]:
+                    await channel_layer.group_discard(group, channel)
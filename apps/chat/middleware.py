@@ -2,22 +2,17 @@
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth import get_user_model
-from rest_framework.authtoken.models import Token
+from apps.authentication import token_cache
 from urllib.parse import parse_qs
 User = get_user_model()
 
 @database_sync_to_async  # <--- ¡UNA SOLA VEZ!
-def get_user(token_key):
-    try:
-        token = Token.objects.get(key=token_key)
-        # --- 3. CAMBIO ---
-        # En lugar de devolver token.user (que puede ser perezoso),
-        # buscamos al usuario completo por su ID para asegurar que funcione.
-        user = User.objects.get(id=token.user_id)
-        return user
-        # --------------------
-    except (Token.DoesNotExist, User.DoesNotExist):
+def get_user(token_key, schema_name=None):
+    # Misma caché que la autenticación REST: sin consultas en un acierto
+    token = token_cache.get_token(token_key, schema_name)
+    if token is None or not token.user.is_active:
         return AnonymousUser()
+    return token.user
         
 
 class TokenAuthMiddleware:
@@ -34,7 +29,8 @@ class TokenAuthMiddleware:
         token_key = query_params.get("token", [None])[0]
 
         if token_key:
-            scope['user'] = await get_user(token_key)
+            tenant = scope.get('tenant')
+            scope['user'] = await get_user(token_key, tenant.schema_name if tenant else None)
         else:
             scope['user'] = AnonymousUser()
         
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-19 10:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY no puede ejecutarse dentro de una transacción
+    atomic = False
+
+    dependencies = [
+        ('chat', '0001_initial'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='chatmessage',
+            index=models.Index(fields=['appointment_id', 'id'], name='chat_appt_id_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-19 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_chatmessage_attachment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedConversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appointment_id', models.IntegerField(unique=True)),
+                ('storage_key', models.CharField(max_length=255)),
+                ('message_count', models.PositiveIntegerField()),
+                ('first_message_id', models.BigIntegerField()),
+                ('last_message_id', models.BigIntegerField()),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('compressed_size', models.PositiveIntegerField()),
+                ('archived_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
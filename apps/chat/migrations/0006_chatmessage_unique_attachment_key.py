@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-19 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_archivedconversation'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='chatmessage',
+            constraint=models.UniqueConstraint(condition=models.Q(('attachment_key', ''), _negated=True), fields=('attachment_key',), name='chat_unique_attachment_key'),
+        ),
+    ]
@@ -7,9 +7,64 @@ class ChatMessage(models.Model):
     sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)  # ← Cambiar aquí
     message = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
+
+    # Adjunto subido directamente a S3 (ver apps.backups.direct_uploads)
+    attachment_key = models.CharField(max_length=255, blank=True)
+    attachment_name = models.CharField(max_length=255, blank=True)
+    attachment_content_type = models.CharField(max_length=100, blank=True)
+    attachment_size = models.PositiveIntegerField(null=True, blank=True)
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Polling por cita: WHERE appointment_id = X AND id > last_id
+            models.Index(fields=['appointment_id', 'id'], name='chat_appt_id_idx'),
+        ]
+        constraints = [
+            # Un upload_token repetido no puede crear otro mensaje con el mismo adjunto
+            models.UniqueConstraint(
+                fields=['attachment_key'],
+                condition=~models.Q(attachment_key=''),
+                name='chat_unique_attachment_key'
+            ),
+        ]
     
     def __str__(self):
-        return f"{self.sender.username}: {self.message[:50]}"
\ No newline at end of file
+        return f"{self.sender.username}: {self.message[:50]}"
+
+class ChatReadCursor(models.Model):
+    """
+    Último mensaje leído por un usuario en el chat de una cita.
+    Los no leídos son los mensajes con id > last_read_id.
+    """
+    appointment_id = models.IntegerField()
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='chat_read_cursors')
+    last_read_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['appointment_id', 'user'], name='chat_read_cursor_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} leyó la cita {self.appointment_id} hasta {self.last_read_id}"
+
+
+class ArchivedConversation(models.Model):
+    """
+    Índice de una conversación archivada: los mensajes de la cita están en
+    un blob JSON comprimido en S3 y ya no en chat_chatmessage.
+    """
+    appointment_id = models.IntegerField(unique=True)
+    storage_key = models.CharField(max_length=255)
+    message_count = models.PositiveIntegerField()
+    first_message_id = models.BigIntegerField()
+    last_message_id = models.BigIntegerField()
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    compressed_size = models.PositiveIntegerField()
+    archived_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Chat de la cita {self.appointment_id} archivado ({self.message_count} mensajes)"
@@ -0,0 +1,73 @@
+# apps/chat/notifier.py
+
+"""
+Aviso de mensajes nuevos para el long-polling y el stream SSE del chat.
+
+Se apoya en el channel layer (Redis entre procesos, memoria en un solo
+proceso): quien guarda mensajes publica un evento pequeño en el grupo
+chat_notify_<tenant>_<cita>, y cada petición en espera escucha en su propio
+canal. Así la espera no consulta la BD en bucle: sólo se vuelve a leer
+cuando llega un aviso.
+"""
+
+import asyncio
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+
+def notify_group(schema_name, appointment_id):
+    return f'chat_notify_{schema_name}_{appointment_id}'
+
+
+async def notify_new_messages(schema_name, appointment_id, last_id):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        await channel_layer.group_send(
+            notify_group(schema_name, appointment_id),
+            {'type': 'chat.new', 'last_id': last_id}
+        )
+    except Exception as e:
+        logger.warning(f'No se pudo avisar de mensajes nuevos en la cita {appointment_id}: {e}')
+
+
+def notify_on_commit(appointment_id, last_id):
+    """Versión síncrona para vistas y señales: avisa cuando la transacción confirma."""
+    schema_name = getattr(connection, 'schema_name', 'public')
+    transaction.on_commit(
+        lambda: async_to_sync(notify_new_messages)(schema_name, appointment_id, last_id)
+    )
+
+
+class MessageWaiter:
+    """
+    Suscripción a los avisos de una cita. Debe abrirse ANTES de consultar
+    la BD, para no perder un aviso que llegue entre la consulta y la espera.
+    """
+
+    def __init__(self, schema_name, appointment_id):
+        self.group = notify_group(schema_name, appointment_id)
+        self.channel_layer = get_channel_layer()
+        self.channel = None
+
+    async def __aenter__(self):
+        self.channel = await self.channel_layer.new_channel()
+        await self.channel_layer.group_add(self.group, self.channel)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.channel_layer.group_discard(self.group, self.channel)
+
+    async def wait(self, timeout):
+        """True si llegó un aviso antes de `timeout` segundos."""
+        try:
+            await asyncio.wait_for(self.channel_layer.receive(self.channel), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
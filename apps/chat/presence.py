@@ -0,0 +1,173 @@
+# apps/chat/presence.py
+
+"""
+Presencia ("en línea") e indicadores de escritura del chat.
+
+Presencia:
+- Cada worker guarda en memoria las conexiones abiertas por
+  (tenant, cita, usuario) y la última vez que se escribió en la caché.
+- La caché compartida tiene una clave por (tenant, cita, usuario) con TTL
+  PRESENCE_TTL; los heartbeats del cliente la renuevan como mucho una vez
+  cada REFRESH_INTERVAL, aunque el usuario tenga varias pestañas abiertas.
+- Un contador compartido (mismo TTL) cuenta los workers con conexiones del
+  usuario: la clave de presencia sólo se borra cuando el último worker se
+  desconecta, no cuando lo hace uno de ellos.
+- Si un cliente o un worker muere sin cerrar, las claves vencen solas.
+- get_presence() resuelve varias citas con un solo get_many.
+
+Escritura:
+- TypingThrottle deja pasar como máximo un evento por usuario, sala y
+  segundo; los que llegan dentro de la ventana se agrupan en uno final.
+"""
+
+import asyncio
+import time
+
+from django.core.cache import cache
+from django.utils import timezone
+
+PRESENCE_TTL = 60
+HEARTBEAT_INTERVAL = 20
+REFRESH_INTERVAL = HEARTBEAT_INTERVAL
+TYPING_INTERVAL = 1.0
+
+
+def presence_key(schema_name, appointment_id, user_id):
+    return f'chat_presence:{schema_name}:{appointment_id}:{user_id}'
+
+
+def workers_key(schema_name, appointment_id, user_id):
+    return f'chat_presence_workers:{schema_name}:{appointment_id}:{user_id}'
+
+
+class PresenceTracker:
+    """Mapa en memoria del worker: {(tenant, cita, usuario): {'channels', 'written_at'}}"""
+
+    def __init__(self):
+        self._entries = {}
+
+    async def connect(self, schema_name, appointment_id, user_id, channel_name):
+        """
+        Registra la conexión. Devuelve True si el usuario acaba de entrar
+        (no tenía conexiones en ningún worker).
+        """
+        entry_key = (schema_name, appointment_id, user_id)
+        entry = self._entries.setdefault(entry_key, {'channels': set(), 'written_at': 0})
+        first = not entry['channels']
+        entry['channels'].add(channel_name)
+        if not first:
+            return False
+        workers = await _incr(workers_key(*entry_key), 1)
+        await self._write(entry_key, entry)
+        return workers == 1
+
+    async def heartbeat(self, schema_name, appointment_id, user_id):
+        entry_key = (schema_name, appointment_id, user_id)
+        entry = self._entries.get(entry_key)
+        if entry and time.monotonic() - entry['written_at'] >= REFRESH_INTERVAL:
+            await self._write(entry_key, entry)
+
+    async def disconnect(self, schema_name, appointment_id, user_id, channel_name):
+        """
+        Quita la conexión. Devuelve True si era la última del usuario en
+        todos los workers; si sigue conectado en otro, la presencia se queda.
+        """
+        entry_key = (schema_name, appointment_id, user_id)
+        entry = self._entries.get(entry_key)
+        if entry is None:
+            return False
+        entry['channels'].discard(channel_name)
+        if entry['channels']:
+            return False
+        del self._entries[entry_key]
+        if await _incr(workers_key(*entry_key), -1) > 0:
+            return False
+        await cache.adelete_many([presence_key(*entry_key), workers_key(*entry_key)])
+        return True
+
+    async def _write(self, entry_key, entry):
+        entry['written_at'] = time.monotonic()
+        await cache.aset(presence_key(*entry_key), timezone.now().isoformat(), PRESENCE_TTL)
+        await cache.atouch(workers_key(*entry_key), PRESENCE_TTL)
+
+
+async def _incr(key, delta):
+    """Suma delta al contador (lo crea con TTL si no existe). Devuelve el valor."""
+    try:
+        return await cache.aincr(key, delta)
+    except ValueError:
+        if delta < 0:
+            # El contador venció: no quedan otros workers registrados
+            return 0
+        await cache.aadd(key, 0, PRESENCE_TTL)
+        return await cache.aincr(key, delta)
+
+
+def get_presence(schema_name, participants):
+    """
+    participants: [(appointment_id, [user_id, ...]), ...]
+    Devuelve {appointment_id: {user_id: last_seen o None}} con un solo get_many.
+    """
+    keys = {
+        presence_key(schema_name, appointment_id, user_id): (appointment_id, user_id)
+        for appointment_id, user_ids in participants
+        for user_id in user_ids
+    }
+    found = cache.get_many(list(keys))
+
+    result = {appointment_id: {} for appointment_id, _ in participants}
+    for key, (appointment_id, user_id) in keys.items():
+        result[appointment_id][user_id] = found.get(key)
+    return result
+
+
+class TypingThrottle:
+    """
+    Limita los eventos de escritura a uno por (sala, usuario) cada
+    TYPING_INTERVAL. send(is_typing) es la corrutina que difunde el evento.
+    """
+
+    def __init__(self):
+        self._last_sent = {}
+        self._pending = {}
+
+    async def typing(self, room, user_id, is_typing, send):
+        throttle_key = (room, user_id)
+        elapsed = time.monotonic() - self._last_sent.get(throttle_key, 0)
+
+        if not is_typing:
+            # "Dejó de escribir" sale al momento y anula el evento pendiente
+            pending = self._pending.pop(throttle_key, None)
+            if pending:
+                pending.cancel()
+            self._last_sent[throttle_key] = time.monotonic()
+            await send(False)
+            return
+
+        if throttle_key in self._pending:
+            return
+        if elapsed >= TYPING_INTERVAL:
+            self._last_sent[throttle_key] = time.monotonic()
+            await send(True)
+            return
+
+        self._pending[throttle_key] = asyncio.ensure_future(
+            self._send_later(throttle_key, TYPING_INTERVAL - elapsed, send)
+        )
+
+    async def _send_later(self, throttle_key, delay, send):
+        await asyncio.sleep(delay)
+        self._pending.pop(throttle_key, None)
+        self._last_sent[throttle_key] = time.monotonic()
+        await send(True)
+
+    def forget(self, room, user_id):
+        throttle_key = (room, user_id)
+        pending = self._pending.pop(throttle_key, None)
+        if pending:
+            pending.cancel()
+        self._last_sent.pop(throttle_key, None)
+
+
+presence_tracker = PresenceTracker()
+typing_throttle = TypingThrottle()
@@ -1,11 +1,16 @@
 # apps/chat/serializers.py
 from rest_framework import serializers
 from .models import ChatMessage
+from .attachments import attachment_payload
 
 class ChatMessageSerializer(serializers.ModelSerializer):
     sender_name = serializers.CharField(source='sender.username', read_only=True)
+    attachment = serializers.SerializerMethodField()
     
     class Meta:
         model = ChatMessage
-        fields = ['id', 'appointment_id', 'sender', 'sender_name', 'message', 'timestamp']
-        read_only_fields = ['sender', 'timestamp', 'appointment_id']
\ No newline at end of file
+        fields = ['id', 'appointment_id', 'sender', 'sender_name', 'message', 'timestamp', 'attachment']
+        read_only_fields = ['sender', 'timestamp', 'appointment_id']
+
+    def get_attachment(self, obj):
+        return attachment_payload(obj)
\ No newline at end of file
@@ -0,0 +1,13 @@
+# apps/chat/signals.py
+
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import ChatMessage
+from .notifier import notify_on_commit
+
+
+@receiver(post_save, sender=ChatMessage)
+def chat_message_created(sender, instance, created, **kwargs):
+    if created:
+        notify_on_commit(instance.appointment_id, instance.id)
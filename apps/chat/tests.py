@@ -1,3 +1,312 @@
-from django.test import TestCase
+import asyncio
+import multiprocessing
+import threading
+import uuid
+from datetime import time, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
 
-# Create your tests here.
+import boto3
+from asgiref.sync import async_to_sync
+from channels_redis.core import RedisChannelLayer
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from django_tenants.test.cases import TenantTestCase
+from fakeredis import TcpFakeServer
+from moto import mock_aws
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.appointments.models import Appointment
+from apps.backups import direct_uploads
+
+from . import archive, attachments
+from .consumers import ChatConsumer
+from .models import ArchivedConversation, ChatMessage
+from .views import attachment_confirm_view, attachment_presign_view
+
+User = get_user_model()
+
+RECEIVER_PROCESSES = 3
+MESSAGES = 50
+TIMEOUT = 10
+
+
+def _receive_in_process(redis_url, prefix, group, ready, results):
+    """Proceso receptor: su propio layer y event loop, como otro worker ASGI."""
+
+    async def receive():
+        layer = RedisChannelLayer(hosts=[redis_url], prefix=prefix)
+        channel = await layer.new_channel()
+        await layer.group_add(group, channel)
+        ready.set()
+        sequences = []
+        try:
+            while len(sequences) < MESSAGES:
+                message = await asyncio.wait_for(layer.receive(channel), TIMEOUT)
+                sequences.append(message['sequence'])
+        finally:
+            await layer.group_discard(group, channel)
+            await layer.close_pools()
+        return sequences
+
+    try:
+        results.put(asyncio.run(receive()))
+    except Exception as e:
+        results.put(repr(e))
+
+
+class ChatConsumerReceiveTests(SimpleTestCase):
+    """Los frames mal formados se descartan sin romper la conexión."""
+
+    def setUp(self):
+        self.consumer = ChatConsumer()
+        self.consumer.user = SimpleNamespace(id=1, first_name='Ana', username='ana')
+        self.consumer.room_group_name = 'chat_test_1'
+        self.consumer.channel_layer = AsyncMock()
+
+    def test_malformed_frames_are_ignored(self):
+        for frame in ['no es json', '[1, 2]', '{}', '{"message": ""}', '{"message": 42}', None]:
+            with self.subTest(frame=frame):
+                async_to_sync(self.consumer.receive)(text_data=frame)
+        self.consumer.channel_layer.group_send.assert_not_called()
+
+
+class RedisChannelLayerFanOutTests(SimpleTestCase):
+    """
+    group_send desde un proceso llega a los consumidores de la sala en los
+    demás procesos, en orden. Es lo que el layer en memoria no puede hacer.
+    Usa REDIS_URL si está configurado y, si no, un servidor fakeredis por TCP
+    (con Lua, que channels_redis necesita) en un hilo de este proceso.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.redis_url = settings.REDIS_URL
+        if not cls.redis_url:
+            server = TcpFakeServer(('127.0.0.1', 0))
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            cls.addClassCleanup(server.server_close)
+            cls.addClassCleanup(server.shutdown)
+            host, port = server.server_address
+            cls.redis_url = f'redis://{host}:{port}'
+
+    def test_group_send_reaches_every_process(self):
+        # Prefijo propio para no cruzarse con otros tests ni con producción
+        prefix = f'test_{uuid.uuid4().hex[:8]}'
+        group = 'chat_test_1'
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        receivers = []
+        for _ in range(RECEIVER_PROCESSES):
+            ready = context.Event()
+            process = context.Process(
+                target=_receive_in_process,
+                args=(self.redis_url, prefix, group, ready, results)
+            )
+            process.start()
+            receivers.append((process, ready))
+
+        try:
+            for _, ready in receivers:
+                self.assertTrue(ready.wait(TIMEOUT), 'Un receptor no llegó a unirse al grupo')
+
+            async def send():
+                layer = RedisChannelLayer(hosts=[self.redis_url], prefix=prefix)
+                for sequence in range(MESSAGES):
+                    await layer.group_send(group, {'type': 'chat.message', 'sequence': sequence})
+                await layer.close_pools()
+
+            asyncio.run(send())
+
+            received = [results.get(timeout=TIMEOUT * 2) for _ in receivers]
+        finally:
+            for process, _ in receivers:
+                process.join(TIMEOUT)
+                if process.is_alive():
+                    process.terminate()
+
+        for sequences in received:
+            self.assertEqual(sequences, list(range(MESSAGES)))
+
+S3_TEST_SETTINGS = {
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+    'AWS_STORAGE_BUCKET_NAME': 'test-bucket',
+    'AWS_S3_REGION_NAME': 'us-east-1',
+    'AWS_S3_ENDPOINT_URL': None,
+}
+
+
+class AttachmentUploadTests(TenantTestCase):
+    """Presign y confirmación de adjuntos contra un S3 simulado con moto."""
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Clínica de pruebas'
+
+    def setUp(self):
+        # TenantTestCase no aplica @override_settings de clase (no llama a super().setUpClass)
+        s3_settings = override_settings(**S3_TEST_SETTINGS)
+        s3_settings.enable()
+        self.addCleanup(s3_settings.disable)
+        mock = mock_aws()
+        mock.start()
+        self.addCleanup(mock.stop)
+        self.s3 = boto3.client('s3', region_name='us-east-1')
+        self.s3.create_bucket(Bucket='test-bucket')
+        # El cliente S3 de los adjuntos se crea una vez por proceso
+        patcher = patch.object(attachments, '_storage', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.factory = APIRequestFactory()
+        self.patient = User.objects.create_user(
+            email='paciente@example.com', password='x',
+            first_name='Ana', last_name='Pérez', user_type='patient'
+        )
+        self.psychologist = User.objects.create_user(
+            email='psicologo@example.com', password='x',
+            first_name='Luis', last_name='Gómez', user_type='professional'
+        )
+        self.stranger = User.objects.create_user(
+            email='otro@example.com', password='x',
+            first_name='Eva', last_name='Ríos', user_type='patient'
+        )
+        self.appointment = Appointment.objects.create(
+            patient=self.patient,
+            psychologist=self.psychologist,
+            appointment_date=timezone.localdate() + timedelta(days=1),
+            start_time=time(10, 0),
+            end_time=time(11, 0),
+            consultation_fee=50,
+        )
+
+    def _post(self, view, user, data):
+        request = self.factory.post('/api/chat/', data, format='json')
+        force_authenticate(request, user=user)
+        return view(request, appointment_id=self.appointment.id)
+
+    def _presign(self, user=None):
+        response = self._post(attachment_presign_view, user or self.patient, {
+            'filename': 'informe.pdf', 'content_type': 'application/pdf', 'size': 4,
+        })
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data
+
+    def _upload(self, presigned):
+        # El cliente sube directo a S3: aquí basta con dejar el objeto en el bucket
+        self.s3.put_object(Bucket='test-bucket', Key=presigned['fields']['key'], Body=b'%PDF')
+
+    def _confirm(self, upload_token, user=None):
+        return self._post(attachment_confirm_view, user or self.patient, {
+            'upload_token': upload_token, 'message': 'Adjunto',
+        })
+
+    def test_presign_is_limited_to_the_tenant_folder(self):
+        presigned = self._presign()
+        self.assertTrue(presigned['fields']['key'].startswith(f'media/{self.tenant.schema_name}/chat_attachments/'))
+        self.assertEqual(presigned['fields']['Content-Type'], 'application/pdf')
+
+    def test_presign_requires_participant(self):
+        response = self._post(attachment_presign_view, self.stranger, {
+            'filename': 'informe.pdf', 'content_type': 'application/pdf', 'size': 4,
+        })
+        self.assertEqual(response.status_code, 403)
+
+    def test_confirm_creates_the_message_once(self):
+        presigned = self._presign()
+        self._upload(presigned)
+
+        response = self._confirm(presigned['upload_token'])
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['attachment']['size'], 4)
+        self.assertEqual(response.data['attachment']['name'], 'informe.pdf')
+
+        # Reenviar el mismo token devuelve el mismo mensaje
+        again = self._confirm(presigned['upload_token'])
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.data['id'], response.data['id'])
+        self.assertEqual(ChatMessage.objects.filter(appointment_id=self.appointment.id).count(), 1)
+
+    def test_confirm_rejects_token_of_another_user(self):
+        presigned = self._presign()
+        self._upload(presigned)
+        response = self._confirm(presigned['upload_token'], user=self.psychologist)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ChatMessage.objects.exists())
+
+    def test_confirm_rejects_token_of_another_tenant(self):
+        with patch.object(direct_uploads, '_tenant', return_value='otra_clinica'):
+            presigned = self._presign()
+        self._upload(presigned)
+        response = self._confirm(presigned['upload_token'])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ChatMessage.objects.exists())
+
+    def test_confirm_before_upload(self):
+        presigned = self._presign()
+        response = self._confirm(presigned['upload_token'])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('todavía no se ha subido', response.data['error'])
+        self.assertFalse(ChatMessage.objects.exists())
+
+
+class ArchiveAppointmentTests(TenantTestCase):
+    """Archivado de chats contra un S3 simulado con moto."""
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Clínica de pruebas'
+
+    def setUp(self):
+        s3_settings = override_settings(**S3_TEST_SETTINGS)
+        s3_settings.enable()
+        self.addCleanup(s3_settings.disable)
+        mock = mock_aws()
+        mock.start()
+        self.addCleanup(mock.stop)
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='test-bucket')
+        self.addCleanup(archive._load_blob.cache_clear)
+
+        self.patient = User.objects.create_user(
+            email='paciente@example.com', password='x',
+            first_name='Ana', last_name='Pérez', user_type='patient'
+        )
+        self.appointment_id = 1
+        for number in range(5):
+            self._message(f'Mensaje {number}')
+
+    def _message(self, text):
+        return ChatMessage.objects.create(appointment_id=self.appointment_id, sender=self.patient, message=text)
+
+    def _archived_ids(self):
+        archived = ArchivedConversation.objects.get(appointment_id=self.appointment_id)
+        archive._load_blob.cache_clear()
+        return [message['id'] for message in archive._load_blob(archived.storage_key)], archived
+
+    def test_interrupted_pass_is_not_duplicated(self):
+        # La primera pasada sube el blob pero se corta antes de borrar los mensajes
+        with patch.object(archive, '_delete_archived'):
+            self.assertEqual(archive.archive_appointment(self.appointment_id), 5)
+        self.assertEqual(ChatMessage.objects.count(), 5)
+
+        # Al repetirla sólo quedan restos por borrar
+        self.assertEqual(archive.archive_appointment(self.appointment_id), 0)
+        self.assertFalse(ChatMessage.objects.exists())
+        ids, archived = self._archived_ids()
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(archived.message_count, 5)
+
+    def test_later_messages_are_merged(self):
+        archive.archive_appointment(self.appointment_id)
+        self._message('Uno más')
+        self.assertEqual(archive.archive_appointment(self.appointment_id), 1)
+
+        ids, archived = self._archived_ids()
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertEqual(archived.message_count, 6)
+        self.assertEqual(archived.last_message_id, ids[-1])
+        self.assertFalse(ChatMessage.objects.exists())
@@ -1,8 +1,17 @@
 # apps/chat/urls.py
 from django.urls import path
-from .views import chat_messages_view
+from .views import (
+    chat_messages_entry, chat_messages_stream, conversations_view, mark_read_view,
+    attachment_presign_view, attachment_confirm_view, presence_view,
+)
 
 urlpatterns = [
     # path('chat/<int:appointment_id>/messages/', chat_messages_view, name='chat-messages'),
-    path('<int:appointment_id>/messages/', chat_messages_view, name='chat-messages'),
-]
\ No newline at end of file
+    path('<int:appointment_id>/messages/', chat_messages_entry, name='chat-messages'),
+    path('<int:appointment_id>/messages/stream/', chat_messages_stream, name='chat-messages-stream'),
+    path('<int:appointment_id>/read/', mark_read_view, name='chat-mark-read'),
+    path('<int:appointment_id>/attachments/presign/', attachment_presign_view, name='chat-attachment-presign'),
+    path('<int:appointment_id>/attachments/confirm/', attachment_confirm_view, name='chat-attachment-confirm'),
+    path('conversations/', conversations_view, name='chat-conversations'),
+    path('presence/', presence_view, name='chat-presence'),
+]
@@ -1,10 +1,45 @@
 # apps/chat/views.py
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django_tenants.utils import schema_context
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from .models import ChatMessage
+from django.conf import settings
+from .models import ArchivedConversation, ChatMessage
 from .serializers import ChatMessageSerializer
+from .notifier import MessageWaiter
+from . import archive, conversations, presence
+from .attachments import ATTACHMENT_CONTENT_TYPES, MAX_ATTACHMENT_SIZE
+from apps.backups import direct_uploads
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from apps.appointments.models import Appointment
+
+# Espera máxima del long-polling (?wait=)
+MAX_WAIT_SECONDS = 25
+# Un stream SSE se cierra tras este tiempo; el cliente reconecta con Last-Event-ID
+SSE_MAX_DURATION = 5 * 60
+SSE_HEARTBEAT_SECONDS = 15
+# Mensajes leídos por consulta en long-polling y SSE
+MAX_BATCH = 100
+# La espera necesita un servidor ASGI y un channel layer compartido (Redis):
+# con el layer en memoria los avisos no cruzan hilos ni event loops, y bajo
+# WSGI cada espera ocupa un worker síncrono entero
+HTTP_WAIT_ENABLED = settings.CHANNEL_LAYER_BACKEND == 'redis'
+MAX_CONVERSATIONS = 200
+# Historial hacia atrás (?before_id=&limit=)
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
@@ -12,22 +47,60 @@ def chat_messages_view(request, appointment_id):
     """
     Endpoint para Chat Simulado (HTTP Polling).
     """
+    if not _is_participant(request.user, appointment_id):
+        return Response({'error': 'No participas en esta cita'}, status=status.HTTP_403_FORBIDDEN)
+
     if request.method == 'GET':
-        # 1. Obtener mensajes de la cita
-        queryset = ChatMessage.objects.filter(appointment_id=appointment_id)
+        # 1. Obtener mensajes de la cita (sender_name sale del JOIN, sin consultas por mensaje)
+        queryset = ChatMessage.objects.filter(
+            appointment_id=appointment_id
+        ).select_related('sender').only(
+            'id', 'appointment_id', 'sender', 'message', 'timestamp', 'sender__username',
+            'attachment_key', 'attachment_name', 'attachment_content_type', 'attachment_size'
+        )
         
         # 2. LÓGICA DE POLING: Filtrar solo los nuevos
         # El frontend enviará ?last_id=50 para pedir solo los que llegaron después
         last_id = request.query_params.get('last_id')
         
+        # Conversación archivada: los mensajes antiguos están en un blob de S3
+        archived = ArchivedConversation.objects.filter(appointment_id=appointment_id).first()
+
         if last_id:
-            queryset = queryset.filter(id__gt=last_id)
-        
-        # Ordenar por antigüedad (los más viejos primero para mantener el hilo)
-        queryset = queryset.order_by('timestamp')
-        
-        serializer = ChatMessageSerializer(queryset, many=True)
-        return Response(serializer.data)
+            # Ordenar por id (índice appointment_id, id) para mantener el hilo
+            queryset = queryset.filter(id__gt=last_id).order_by('id')
+            serializer = ChatMessageSerializer(queryset, many=True)
+            data = serializer.data
+            if archived and int(last_id) < archived.last_message_id:
+                data = archive.archived_messages_after(archived, int(last_id)) + list(data)
+            return Response(data)
+
+        # 3. HISTORIAL HACIA ATRÁS: la página más reciente primero y, al hacer
+        # scroll, ?before_id=<id más antiguo recibido> para la anterior
+        try:
+            limit = min(max(int(request.query_params.get('limit', HISTORY_PAGE_SIZE)), 1), MAX_HISTORY_PAGE_SIZE)
+            before_id = request.query_params.get('before_id')
+            if before_id:
+                queryset = queryset.filter(id__lt=int(before_id))
+        except ValueError:
+            return Response({'error': 'before_id y limit deben ser enteros'}, status=status.HTTP_400_BAD_REQUEST)
+
+        page = list(queryset.order_by('-id')[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit][::-1]
+        data = list(ChatMessageSerializer(page, many=True).data)
+
+        if archived and not has_more:
+            # La página se completa con los mensajes archivados anteriores
+            boundary = page[0].id if page else (int(before_id) if before_id else None)
+            older, has_more = archive.archived_messages_before(archived, boundary, limit - len(page))
+            data = older + data
+
+        response = Response(data)
+        response['X-Has-More'] = 'true' if has_more else 'false'
+        if has_more:
+            response['X-Next-Before-Id'] = str(data[0]['id'])
+        return response
     
     elif request.method == 'POST':
         # Guardar mensaje nuevo (Esto no cambia)
@@ -38,4 +111,299 @@ def chat_messages_view(request, appointment_id):
                 appointment_id=appointment_id
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def conversations_view(request):
+    """
+    Chats del usuario (una entrada por cita con mensajes), con el último
+    mensaje y los no leídos. ?limit= (máx. 200) y ?offset= para paginar.
+    """
+    try:
+        limit = min(max(int(request.query_params.get('limit', 50)), 1), MAX_CONVERSATIONS)
+        offset = max(int(request.query_params.get('offset', 0)), 0)
+    except ValueError:
+        return Response({'error': 'limit y offset deben ser enteros'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(conversations.list_conversations(request.user.id, limit, offset))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def presence_view(request):
+    """
+    Presencia de los participantes de varias citas en una llamada:
+    ?appointments=1,2,3 (máx. 200). Sólo se incluyen citas del usuario.
+    """
+    try:
+        appointment_ids = {
+            int(value) for value in request.query_params.get('appointments', '').split(',') if value
+        }
+    except ValueError:
+        return Response({'error': 'appointments debe ser una lista de ids separados por comas'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(appointment_ids) > MAX_CONVERSATIONS:
+        return Response({'error': f'Máximo {MAX_CONVERSATIONS} citas por consulta'}, status=status.HTTP_400_BAD_REQUEST)
+
+    participants = [
+        (appointment_id, [patient_id, psychologist_id])
+        for appointment_id, patient_id, psychologist_id in Appointment.objects.filter(
+            Q(patient=request.user) | Q(psychologist=request.user),
+            id__in=appointment_ids
+        ).values_list('id', 'patient_id', 'psychologist_id')
+    ]
+    found = presence.get_presence(request.tenant.schema_name, participants)
+
+    return Response([
+        {
+            'appointment_id': appointment_id,
+            'participants': [
+                {'user_id': user_id, 'online': last_seen is not None, 'last_seen': last_seen}
+                for user_id, last_seen in users.items()
+            ],
+        }
+        for appointment_id, users in found.items()
+    ])
+
+
+def _is_participant(user, appointment_id):
+    return Appointment.objects.filter(
+        Q(patient=user) | Q(psychologist=user),
+        id=appointment_id
+    ).exists()
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def mark_read_view(request, appointment_id):
+    """
+    Marca como leídos los mensajes de la cita hasta last_read_id
+    (por defecto, hasta el último). El cursor nunca retrocede.
+    """
+    if not _is_participant(request.user, appointment_id):
+        return Response({'error': 'No participas en esta cita'}, status=status.HTTP_403_FORBIDDEN)
+
+    last_read_id = request.data.get('last_read_id')
+    if last_read_id is not None:
+        try:
+            last_read_id = int(last_read_id)
+        except (TypeError, ValueError):
+            return Response({'error': 'last_read_id debe ser un entero'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'appointment_id': appointment_id,
+        'last_read_id': conversations.mark_read(appointment_id, request.user.id, last_read_id),
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def attachment_presign_view(request, appointment_id):
+    """
+    Paso 1 de un adjunto: POST prefirmado para subir el archivo directo a S3.
+    Body: {"filename": "...", "content_type": "...", "size": bytes}
+    """
+    if not _is_participant(request.user, appointment_id):
+        return Response({'error': 'No participas en esta cita'}, status=status.HTTP_403_FORBIDDEN)
+
+    content_type = request.data.get('content_type') or ''
+    if content_type not in ATTACHMENT_CONTENT_TYPES:
+        return Response(
+            {'error': f"Tipo de archivo no permitido. Permitidos: {', '.join(sorted(ATTACHMENT_CONTENT_TYPES))}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        upload = direct_uploads.create_upload(
+            request.user.id,
+            'chat_attachments',
+            request.data.get('filename') or '',
+            content_type,
+            int(request.data.get('size') or 0),
+            MAX_ATTACHMENT_SIZE,
+            appointment=appointment_id
+        )
+    except ValueError:
+        return Response({'error': 'size debe ser un entero'}, status=status.HTTP_400_BAD_REQUEST)
+    except direct_uploads.UploadError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(upload, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def attachment_confirm_view(request, appointment_id):
+    """
+    Paso 2 de un adjunto: tras subirlo a S3, crea el mensaje que lo contiene.
+    Body: {"upload_token": "...", "message": "texto opcional"}
+    """
+    try:
+        upload = direct_uploads.confirm_upload(
+            request.data.get('upload_token') or '',
+            request.user.id,
+            'chat_attachments'
+        )
+    except direct_uploads.UploadError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if upload['appointment'] != appointment_id:
+        return Response({'error': 'upload_token inválido'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Confirmación idempotente: reenviar el mismo upload_token devuelve el
+    # mensaje ya creado (la clave del adjunto es única)
+    existing = ChatMessage.objects.filter(attachment_key=upload['key']).first()
+    if existing:
+        return Response(ChatMessageSerializer(existing).data)
+
+    try:
+        with transaction.atomic():
+            message = ChatMessage.objects.create(
+                appointment_id=appointment_id,
+                sender=request.user,
+                message=request.data.get('message') or '',
+                attachment_key=upload['key'],
+                attachment_name=upload['filename'],
+                attachment_content_type=upload['content_type'],
+                attachment_size=upload['size'],
+            )
+    except IntegrityError:
+        # Otra confirmación del mismo token ganó la carrera
+        existing = ChatMessage.objects.get(attachment_key=upload['key'])
+        return Response(ChatMessageSerializer(existing).data)
+    return Response(ChatMessageSerializer(message).data, status=status.HTTP_201_CREATED)
+
+
+@sync_to_async
+def _authenticate(request):
+    """
+    Autentica con las clases de DRF. EventSource no permite cabeceras, así
+    que también se acepta ?token=.
+    """
+    token_key = request.GET.get('token')
+    if token_key and 'HTTP_AUTHORIZATION' not in request.META:
+        request.META['HTTP_AUTHORIZATION'] = f'Token {token_key}'
+
+    drf_request = Request(
+        request,
+        authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    )
+    try:
+        user = drf_request.user
+    except exceptions.APIException:
+        return None
+    return user if user and user.is_authenticated else None
+
+
+@sync_to_async
+def _check_participant(schema_name, user, appointment_id):
+    with schema_context(schema_name):
+        return _is_participant(user, appointment_id)
+
+
+@sync_to_async
+def _fetch_new_messages(schema_name, appointment_id, last_id):
+    with schema_context(schema_name):
+        # Los mensajes archivados (más antiguos que los vivos) van primero
+        messages = []
+        archived = ArchivedConversation.objects.filter(appointment_id=appointment_id).first()
+        if archived and last_id < archived.last_message_id:
+            messages = archive.archived_messages_after(archived, last_id)[:MAX_BATCH]
+            if len(messages) == MAX_BATCH:
+                return messages
+            last_id = messages[-1]['id'] if messages else last_id
+
+        queryset = ChatMessage.objects.filter(
+            appointment_id=appointment_id,
+            id__gt=last_id
+        ).select_related('sender').order_by('id')[:MAX_BATCH - len(messages)]
+        return messages + list(ChatMessageSerializer(queryset, many=True).data)
+
+
+def _parse_last_id(value):
+    try:
+        return max(int(value or 0), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+async def _long_poll(request, schema_name, appointment_id):
+    try:
+        wait = min(max(float(request.GET['wait']), 0), MAX_WAIT_SECONDS)
+    except ValueError:
+        return JsonResponse({'error': 'wait debe ser un número de segundos'}, status=400)
+    last_id = _parse_last_id(request.GET.get('last_id'))
+
+    async with MessageWaiter(schema_name, appointment_id) as waiter:
+        messages = await _fetch_new_messages(schema_name, appointment_id, last_id)
+        if not messages and await waiter.wait(wait):
+            messages = await _fetch_new_messages(schema_name, appointment_id, last_id)
+
+    return JsonResponse(list(messages), safe=False, encoder=DjangoJSONEncoder)
+
+
+@csrf_exempt
+async def chat_messages_entry(request, appointment_id):
+    """
+    Entrada de /<appointment_id>/messages/. Con GET ?wait=<segundos> hace
+    long-polling: responde en cuanto hay mensajes con id > last_id o al
+    vencer la espera (lista vacía). El resto va a chat_messages_view.
+    """
+    if request.method == 'GET' and 'wait' in request.GET and HTTP_WAIT_ENABLED:
+        user = await _authenticate(request)
+        if user is None:
+            return JsonResponse({'detail': 'No autenticado'}, status=401)
+        schema_name = request.tenant.schema_name
+        if not await _check_participant(schema_name, user, appointment_id):
+            return JsonResponse({'error': 'No participas en esta cita'}, status=403)
+        return await _long_poll(request, schema_name, appointment_id)
+
+    # Sin espera disponible, ?wait= se responde al momento como un polling normal
+
+    return await sync_to_async(chat_messages_view)(request, appointment_id)
+
+
+async def chat_messages_stream(request, appointment_id):
+    """
+    Stream Server-Sent Events con los mensajes nuevos de la cita.
+    Reanuda desde la cabecera Last-Event-ID o ?last_id=.
+    """
+    if not HTTP_WAIT_ENABLED:
+        return JsonResponse(
+            {'error': 'Stream no disponible, usa el polling con ?last_id='},
+            status=503
+        )
+
+    user = await _authenticate(request)
+    if user is None:
+        return JsonResponse({'detail': 'No autenticado'}, status=401)
+
+    schema_name = request.tenant.schema_name
+    if not await _check_participant(schema_name, user, appointment_id):
+        return JsonResponse({'error': 'No participas en esta cita'}, status=403)
+    last_id = _parse_last_id(
+        request.headers.get('Last-Event-ID') or request.GET.get('last_id')
+    )
+
+    async def events():
+        nonlocal last_id
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + SSE_MAX_DURATION
+        async with MessageWaiter(schema_name, appointment_id) as waiter:
+            yield 'retry: 3000\n\n'
+            while loop.time() < deadline:
+                messages = await _fetch_new_messages(schema_name, appointment_id, last_id)
+                for message in messages:
+                    last_id = message['id']
+                    data = json.dumps(message, cls=DjangoJSONEncoder)
+                    yield f'id: {last_id}\nevent: message\ndata: {data}\n\n'
+                if len(messages) == MAX_BATCH:
+                    continue
+                if not await waiter.wait(SSE_HEARTBEAT_SECONDS):
+                    yield ': ping\n\n'
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,176 @@
+# apps/clinic_admin/analytics.py
+
+"""
+Reporte de utilización de psicólogos (horas ofrecidas vs. horas reservadas).
+
+Todo se calcula en una sola consulta SQL: generate_series expande la
+disponibilidad semanal sobre el rango de fechas descontando blocked_dates,
+y se cruza por (psicólogo, semana) con las citas agregadas por estado.
+
+El resultado se cachea por (tenant, rango). Cada tenant tiene una versión
+que se incrementa cuando cambia una cita o una disponibilidad, así todos
+los rangos cacheados quedan invalidados sin recorrer claves.
+"""
+
+from django.core.cache import cache
+from django.db import connection
+
+from apps.appointments.models import Appointment, PsychologistAvailability
+from apps.users.models import CustomUser
+
+UTILIZATION_CACHE_TIMEOUT = 60 * 60 * 6
+# Rango máximo consultable de una vez
+MAX_RANGE_DAYS = 366
+
+UTILIZATION_SQL = """
+WITH days AS (
+    SELECT day::date AS day
+    FROM generate_series(%(date_from)s::date, %(date_to)s::date, interval '1 day') AS day
+),
+offered AS (
+    SELECT
+        av.psychologist_id,
+        date_trunc('week', days.day)::date AS week_start,
+        SUM(EXTRACT(EPOCH FROM (av.end_time - av.start_time))) / 3600.0 AS offered_hours
+    FROM {availability} AS av
+    JOIN days ON av.weekday = EXTRACT(ISODOW FROM days.day)::int - 1
+    WHERE av.is_active
+      AND NOT (av.blocked_dates @> to_jsonb(to_char(days.day, 'YYYY-MM-DD')))
+    GROUP BY 1, 2
+),
+booked AS (
+    SELECT
+        ap.psychologist_id,
+        date_trunc('week', ap.appointment_date)::date AS week_start,
+        SUM(EXTRACT(EPOCH FROM (ap.end_time - ap.start_time)))
+            FILTER (WHERE ap.status <> 'cancelled') / 3600.0 AS booked_hours,
+        SUM(EXTRACT(EPOCH FROM (ap.end_time - ap.start_time)))
+            FILTER (WHERE ap.status = 'completed') / 3600.0 AS completed_hours,
+        COUNT(*) AS total_appointments,
+        COUNT(*) FILTER (WHERE ap.status = 'completed') AS completed_count,
+        COUNT(*) FILTER (WHERE ap.status = 'no_show') AS no_show_count,
+        COUNT(*) FILTER (WHERE ap.status = 'cancelled') AS cancelled_count
+    FROM {appointment} AS ap
+    WHERE ap.appointment_date BETWEEN %(date_from)s AND %(date_to)s
+    GROUP BY 1, 2
+)
+SELECT
+    u.id,
+    u.first_name,
+    u.last_name,
+    COALESCE(o.week_start, b.week_start) AS week_start,
+    COALESCE(o.offered_hours, 0),
+    COALESCE(b.booked_hours, 0),
+    COALESCE(b.completed_hours, 0),
+    COALESCE(b.total_appointments, 0),
+    COALESCE(b.completed_count, 0),
+    COALESCE(b.no_show_count, 0),
+    COALESCE(b.cancelled_count, 0)
+FROM offered AS o
+FULL OUTER JOIN booked AS b
+    ON b.psychologist_id = o.psychologist_id AND b.week_start = o.week_start
+JOIN {users} AS u
+    ON u.id = COALESCE(o.psychologist_id, b.psychologist_id)
+ORDER BY u.last_name, u.first_name, u.id, week_start
+"""
+
+
+def _tenant():
+    return getattr(connection, 'schema_name', 'public')
+
+
+def _version_key():
+    return f'utilization:{_tenant()}:version'
+
+
+def _get_version():
+    return cache.get_or_set(_version_key(), 1, timeout=None)
+
+
+def _report_key(date_from, date_to):
+    return f'utilization:{_tenant()}:v{_get_version()}:{date_from.isoformat()}:{date_to.isoformat()}'
+
+
+def invalidate():
+    """Invalida todos los reportes cacheados del tenant actual."""
+    key = _version_key()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, timeout=None)
+
+
+def _rate(part, total):
+    return round(part / total, 4) if total else 0.0
+
+
+def _compute(date_from, date_to):
+    sql = UTILIZATION_SQL.format(
+        availability=connection.ops.quote_name(PsychologistAvailability._meta.db_table),
+        appointment=connection.ops.quote_name(Appointment._meta.db_table),
+        users=connection.ops.quote_name(CustomUser._meta.db_table),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {'date_from': date_from, 'date_to': date_to})
+        rows = cursor.fetchall()
+
+    psychologists = {}
+    for (
+        psychologist_id, first_name, last_name, week_start,
+        offered_hours, booked_hours, completed_hours,
+        total, completed, no_show, cancelled
+    ) in rows:
+        entry = psychologists.setdefault(psychologist_id, {
+            'psychologist_id': psychologist_id,
+            'psychologist_name': f'{first_name} {last_name}'.strip(),
+            'weeks': [],
+        })
+        offered_hours = float(offered_hours)
+        booked_hours = float(booked_hours)
+        entry['weeks'].append({
+            'week_start': week_start.isoformat(),
+            'offered_hours': round(offered_hours, 2),
+            'booked_hours': round(booked_hours, 2),
+            'completed_hours': round(float(completed_hours), 2),
+            'utilization_rate': _rate(booked_hours, offered_hours),
+            'total_appointments': total,
+            'completed_count': completed,
+            'no_show_count': no_show,
+            'cancelled_count': cancelled,
+            'no_show_rate': _rate(no_show, total - cancelled),
+            'cancellation_rate': _rate(cancelled, total),
+        })
+
+    for entry in psychologists.values():
+        weeks = entry['weeks']
+        offered_hours = sum(week['offered_hours'] for week in weeks)
+        booked_hours = sum(week['booked_hours'] for week in weeks)
+        total = sum(week['total_appointments'] for week in weeks)
+        no_show = sum(week['no_show_count'] for week in weeks)
+        cancelled = sum(week['cancelled_count'] for week in weeks)
+        entry['totals'] = {
+            'offered_hours': round(offered_hours, 2),
+            'booked_hours': round(booked_hours, 2),
+            'utilization_rate': _rate(booked_hours, offered_hours),
+            'total_appointments': total,
+            'no_show_rate': _rate(no_show, total - cancelled),
+            'cancellation_rate': _rate(cancelled, total),
+        }
+
+    return {
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'psychologists': list(psychologists.values()),
+    }
+
+
+def get_utilization_report(date_from, date_to):
+    """Devuelve (reporte, cacheado) para el rango [date_from, date_to]."""
+    key = _report_key(date_from, date_to)
+    report = cache.get(key)
+    if report is not None:
+        return report, True
+
+    report = _compute(date_from, date_to)
+    cache.set(key, report, UTILIZATION_CACHE_TIMEOUT)
+    return report, False
@@ -0,0 +1,15 @@
+# apps/clinic_admin/signals.py
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from apps.appointments.models import Appointment, PsychologistAvailability
+from . import analytics
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+@receiver(post_save, sender=PsychologistAvailability)
+@receiver(post_delete, sender=PsychologistAvailability)
+def invalidate_utilization_report(sender, instance, **kwargs):
+    analytics.invalidate()
@@ -1,7 +1,7 @@
 # apps/clinic_admin/urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import UserManagementViewSet, PaymentReportView, BackupConfigView
+from .views import UserManagementViewSet, PaymentReportView, BackupConfigView, UtilizationReportView
 
 # Creamos un router para los ViewSets
 router = DefaultRouter()
@@ -14,4 +14,5 @@ urlpatterns = [
     # El router ahora maneja todas las URLs
     path('', include(router.urls)),
     path('config/backup/', BackupConfigView.as_view(), name='backup-config'),
+    path('reports/utilization/', UtilizationReportView.as_view(), name='utilization-report'),
 ]
\ No newline at end of file
@@ -32,6 +32,7 @@ from .ai_parser import parse_prompt_to_filters
 
 from apps.tenants.models import Clinic
 from .serializers import BackupConfigSerializer
+from . import analytics
 import logging
 logger = logging.getLogger('apps')
 
@@ -417,4 +418,42 @@ class BackupConfigView(generics.RetrieveUpdateAPIView):
         logger.info(
             f"Admin '{self.request.user.email}' actualizó la config de backup a "
             f"'{serializer.validated_data.get('backup_schedule')}'"
-        )
\ No newline at end of file
+        )
+
+class UtilizationReportView(generics.GenericAPIView):
+    """
+    Reporte de utilización por psicólogo y semana: horas ofrecidas vs.
+    reservadas, tasas de inasistencia y de cancelación.
+    Parámetros: ?date_from=YYYY-MM-DD&date_to=YYYY-MM-DD (por defecto, las
+    últimas 4 semanas).
+    """
+    permission_classes = [IsClinicAdmin]
+
+    def get(self, request):
+        today = date.today()
+        try:
+            date_from = date.fromisoformat(
+                request.query_params.get('date_from') or str(today - timedelta(weeks=4))
+            )
+            date_to = date.fromisoformat(request.query_params.get('date_to') or str(today))
+        except ValueError:
+            return Response(
+                {'error': 'Formato de fecha inválido. Use YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if date_from > date_to:
+            return Response(
+                {'error': 'date_from debe ser anterior o igual a date_to'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if (date_to - date_from).days >= analytics.MAX_RANGE_DAYS:
+            return Response(
+                {'error': f'El rango máximo es de {analytics.MAX_RANGE_DAYS} días'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        report, cached = analytics.get_utilization_report(date_from, date_to)
+        response = Response(report)
+        response['X-Cache'] = 'HIT' if cached else 'MISS'
+        return response
@@ -12,7 +12,7 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import datetime, timedelta
 from apps.clinical_history.models import MedicationReminder
-from apps.notifications.fcm_service import send_fcm_to_multiple
+from apps.notifications.fcm_service import send_fcm_to_multiple, deactivate_fcm_tokens
 from apps.notifications.models import PushSubscription
 from django_tenants.utils import schema_context, get_tenant_model
 import logging
@@ -201,18 +201,11 @@ class Command(BaseCommand):
                 )
                 failed_count += 1
             
-            # Desactivar tokens inválidos
-            for i, response in enumerate(result.get('responses', [])):
-                if not response['success'] and response.get('error'):
-                    error = response['error'].lower()
-                    if 'not registered' in error or 'invalid' in error:
-                        subscription = fcm_subscriptions[i]
-                        subscription.is_active = False
-                        subscription.save(update_fields=['is_active'])
-                        self.stdout.write(
-                            self.style.WARNING(
-                                f"      🗑️  Token inválido desactivado: {subscription.fcm_token[:20]}..."
-                            )
-                        )
+            # Desactivar tokens no registrados (un solo UPDATE)
+            deactivated = deactivate_fcm_tokens(result.get('unregistered_tokens', []))
+            if deactivated:
+                self.stdout.write(
+                    self.style.WARNING(f"      🗑️  {deactivated} token(s) no registrado(s) desactivado(s)")
+                )
         
         return sent_count, failed_count
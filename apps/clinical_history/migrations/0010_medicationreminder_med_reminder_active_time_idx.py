@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-19 10:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY no puede ejecutarse dentro de una transacción
+    atomic = False
+
+    dependencies = [
+        ('clinical_history', '0009_medicationreminder'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='medicationreminder',
+            index=models.Index(fields=['is_active', 'time'], name='med_reminder_active_time_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-19 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinical_history', '0010_medicationreminder_med_reminder_active_time_idx'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='clinicaldocument',
+            constraint=models.UniqueConstraint(condition=models.Q(('file', ''), _negated=True), fields=('file',), name='clinical_document_unique_file'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-19 02:37
+
+import apps.clinical_history.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinical_history', '0011_clinicaldocument_unique_file'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='clinicaldocument',
+            name='file',
+            field=models.FileField(storage=apps.clinical_history.storage.ClinicalDocumentS3Storage, upload_to='clinical_documents/%Y/%m/%d/'),
+        ),
+    ]
@@ -55,7 +55,7 @@ class ClinicalDocument(models.Model):
     # El archivo en S3
     file = models.FileField(
         upload_to='clinical_documents/%Y/%m/%d/',
-        storage='apps.clinical_history.storage.ClinicalDocumentS3Storage'
+        storage=ClinicalDocumentS3Storage
     )
     
     description = models.CharField(max_length=255, help_text="Descripción o título del documento.")
@@ -66,6 +66,14 @@ class ClinicalDocument(models.Model):
         verbose_name = 'Documento Clínico'
         verbose_name_plural = 'Documentos Clínicos'
         db_table = 'clinical_documents'
+        constraints = [
+            # Una subida directa confirmada dos veces no duplica el documento
+            models.UniqueConstraint(
+                fields=['file'],
+                condition=~models.Q(file=''),
+                name='clinical_document_unique_file'
+            ),
+        ]
 
     def __str__(self):
         return f"Documento '{self.description}' para {self.patient.get_full_name()}"
@@ -394,6 +402,9 @@ class MedicationReminder(models.Model):
         verbose_name = 'Recordatorio de Medicamento'
         verbose_name_plural = 'Recordatorios de Medicamentos'
         ordering = ['time']
+        indexes = [
+            models.Index(fields=['is_active', 'time'], name='med_reminder_active_time_idx'),
+        ]
     
     def __str__(self):
         return f"{self.prescription.medication_name} - {self.time.strftime('%H:%M')}"
@@ -14,8 +14,16 @@ class ClinicalDocumentS3Storage(Storage):
     """
     
     def __init__(self):
-        self.s3_storage = S3BackupStorage()
+        self._s3_storage = None
         self.base_folder = "clinical_documents"
+
+    @property
+    def s3_storage(self):
+        # El campo instancia el storage al cargar el modelo (también en las
+        # migraciones): el cliente S3 se crea recién en el primer uso
+        if self._s3_storage is None:
+            self._s3_storage = S3BackupStorage()
+        return self._s3_storage
     
     def _save(self, name, content):
         """
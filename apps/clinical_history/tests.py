@@ -1,3 +1,142 @@
-from django.test import TestCase
+from datetime import time, timedelta
+from unittest.mock import patch
 
-# Create your tests here.
+import boto3
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.utils import timezone
+from django_tenants.test.cases import TenantTestCase
+from moto import mock_aws
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.appointments.models import Appointment
+from apps.backups import direct_uploads
+
+from .models import ClinicalDocument
+from .views import DocumentConfirmUploadView, DocumentPresignView
+
+User = get_user_model()
+
+S3_TEST_SETTINGS = {
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+    'AWS_STORAGE_BUCKET_NAME': 'test-bucket',
+    'AWS_S3_REGION_NAME': 'us-east-1',
+    'AWS_S3_ENDPOINT_URL': None,
+}
+
+
+class DocumentUploadTests(TenantTestCase):
+    """Presign y confirmación de documentos clínicos contra un S3 simulado con moto."""
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Clínica de pruebas'
+
+    def setUp(self):
+        # TenantTestCase no aplica @override_settings de clase (no llama a super().setUpClass)
+        s3_settings = override_settings(**S3_TEST_SETTINGS)
+        s3_settings.enable()
+        self.addCleanup(s3_settings.disable)
+        mock = mock_aws()
+        mock.start()
+        self.addCleanup(mock.stop)
+        self.s3 = boto3.client('s3', region_name='us-east-1')
+        self.s3.create_bucket(Bucket='test-bucket')
+
+        self.factory = APIRequestFactory()
+        self.patient = User.objects.create_user(
+            email='paciente@example.com', password='x',
+            first_name='Ana', last_name='Pérez', user_type='patient'
+        )
+        self.psychologist = User.objects.create_user(
+            email='psicologo@example.com', password='x',
+            first_name='Luis', last_name='Gómez', user_type='professional'
+        )
+        self.other_psychologist = User.objects.create_user(
+            email='otro@example.com', password='x',
+            first_name='Eva', last_name='Ríos', user_type='professional'
+        )
+        for psychologist in (self.psychologist, self.other_psychologist):
+            Appointment.objects.create(
+                patient=self.patient,
+                psychologist=psychologist,
+                appointment_date=timezone.localdate() - timedelta(days=7),
+                start_time=time(10, 0),
+                end_time=time(11, 0),
+                consultation_fee=50,
+                status='completed',
+            )
+
+    def _post(self, view, user, data):
+        request = self.factory.post('/api/clinical-history/documents/', data, format='json')
+        force_authenticate(request, user=user)
+        return view.as_view()(request)
+
+    def _presign(self):
+        response = self._post(DocumentPresignView, self.psychologist, {
+            'patient': self.patient.id, 'filename': 'evaluacion.pdf',
+            'content_type': 'application/pdf', 'size': 4,
+        })
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data
+
+    def _upload(self, presigned):
+        # El cliente sube directo a S3: aquí basta con dejar el objeto en el bucket
+        self.s3.put_object(Bucket='test-bucket', Key=presigned['fields']['key'], Body=b'%PDF')
+
+    def _confirm(self, upload_token, user=None):
+        return self._post(DocumentConfirmUploadView, user or self.psychologist, {
+            'upload_token': upload_token, 'description': 'Evaluación inicial',
+        })
+
+    def test_presign_is_limited_to_the_tenant_folder(self):
+        presigned = self._presign()
+        self.assertTrue(presigned['fields']['key'].startswith(f'media/{self.tenant.schema_name}/clinical_documents/'))
+        self.assertEqual(presigned['fields']['Content-Type'], 'application/pdf')
+
+    def test_presign_requires_a_professional(self):
+        response = self._post(DocumentPresignView, self.patient, {
+            'patient': self.patient.id, 'filename': 'evaluacion.pdf',
+            'content_type': 'application/pdf', 'size': 4,
+        })
+        self.assertEqual(response.status_code, 403)
+
+    def test_confirm_registers_the_document_once(self):
+        presigned = self._presign()
+        self._upload(presigned)
+
+        response = self._confirm(presigned['upload_token'])
+        self.assertEqual(response.status_code, 201, response.data)
+        document = ClinicalDocument.objects.get()
+        self.assertEqual(document.file.name, presigned['fields']['key'])
+        self.assertEqual(document.patient, self.patient)
+        self.assertEqual(document.uploaded_by, self.psychologist)
+
+        # Reenviar el mismo token devuelve el mismo documento
+        again = self._confirm(presigned['upload_token'])
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.data['id'], response.data['id'])
+        self.assertEqual(ClinicalDocument.objects.count(), 1)
+
+    def test_confirm_rejects_token_of_another_user(self):
+        presigned = self._presign()
+        self._upload(presigned)
+        response = self._confirm(presigned['upload_token'], user=self.other_psychologist)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ClinicalDocument.objects.exists())
+
+    def test_confirm_rejects_token_of_another_tenant(self):
+        with patch.object(direct_uploads, '_tenant', return_value='otra_clinica'):
+            presigned = self._presign()
+        self._upload(presigned)
+        response = self._confirm(presigned['upload_token'])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ClinicalDocument.objects.exists())
+
+    def test_confirm_before_upload(self):
+        presigned = self._presign()
+        response = self._confirm(presigned['upload_token'])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('todavía no se ha subido', response.data['error'])
+        self.assertFalse(ClinicalDocument.objects.exists())
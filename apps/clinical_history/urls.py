@@ -84,6 +84,8 @@ urlpatterns = [
     path('my-documents/', views.MyDocumentsListView.as_view(), name='my-documents'),
     path('my-patients/', views.MyPastPatientsListView.as_view(), name='my-past-patients'),
     path('documents/upload/', views.DocumentUploadView.as_view(), name='document-upload'),
+    path('documents/presign/', views.DocumentPresignView.as_view(), name='document-presign'),
+    path('documents/confirm/', views.DocumentConfirmUploadView.as_view(), name='document-confirm'),
     path('documents/<int:pk>/download/', views.DownloadDocumentView.as_view(), name='document-download'),
 
     path('patient/<int:patient_id>/', views.ClinicalHistoryDetailView.as_view(), name='clinical-history-detail'),
@@ -6,6 +6,7 @@ from rest_framework import viewsets, permissions, status, generics
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
+from django.db import IntegrityError, transaction
 from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from django.http import FileResponse, Http404
@@ -18,10 +19,23 @@ from datetime import date, timedelta
 from apps.appointments.views import IsPsychologist
 from django.db.models import Count
 from apps.professionals.models import ProfessionalProfile
+from apps.backups import direct_uploads
 
 
 logger = logging.getLogger(__name__)
 
+# Subida directa de documentos clínicos a S3
+MAX_DOCUMENT_SIZE = 25 * 1024 * 1024
+DOCUMENT_CONTENT_TYPES = {
+    'application/pdf',
+    'application/msword',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'text/plain',
+    'image/png',
+    'image/jpeg',
+    'image/gif',
+}
+
 class IsAssociatedProfessional(permissions.BasePermission):
     """
     Permiso personalizado para asegurar que solo el psicólogo de la cita
@@ -140,36 +154,133 @@ class DocumentUploadView(generics.CreateAPIView):
         serializer.save(uploaded_by=self.request.user)
 
     def create(self, request, *args, **kwargs):
-        # Solo psicólogos pueden subir documentos
-        if request.user.user_type != 'professional':
-            return Response(
-                {"error": "Solo los psicólogos pueden subir documentos."},
-                status=status.HTTP_403_FORBIDDEN
-            )
+        error = _check_document_upload_permission(request.user, request.data.get('patient'))
+        if error:
+            return error
+
+        return super().create(request, *args, **kwargs)
+
+
+def _check_document_upload_permission(user, patient_id):
+    """
+    Devuelve una Response de error si el usuario no puede subir documentos
+    al paciente, o None si puede.
+    """
+    # Solo psicólogos pueden subir documentos
+    if user.user_type != 'professional':
+        return Response(
+            {"error": "Solo los psicólogos pueden subir documentos."},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    # --- Validación de Permiso Clave ---
+    # Verifica si el psicólogo tiene permiso para subir archivos a este paciente
+    if not patient_id:
+        return Response(
+            {"error": "Debe especificar un paciente."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    has_had_appointment = Appointment.objects.filter(
+        psychologist=user,
+        patient_id=patient_id
+    ).exists()
+
+    if not has_had_appointment:
+        return Response(
+            {"error": "No tienes permiso para subir documentos a este paciente. Solo puedes subir documentos a pacientes con los que has tenido una cita."},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    return None
+
+
+class DocumentPresignView(generics.GenericAPIView):
+    """
+    Paso 1 de la subida directa: devuelve un POST prefirmado para que el
+    psicólogo suba el documento directamente a S3.
+    Body: {"patient": id, "filename": "...", "content_type": "...", "size": bytes}
+    """
+    permission_classes = [permissions.IsAuthenticated]
 
-        # --- Validación de Permiso Clave ---
-        # Verifica si el psicólogo tiene permiso para subir archivos a este paciente
+    def post(self, request):
         patient_id = request.data.get('patient')
-        if not patient_id:
+        error = _check_document_upload_permission(request.user, patient_id)
+        if error:
+            return error
+
+        filename = request.data.get('filename') or ''
+        content_type = request.data.get('content_type') or ''
+        if content_type not in DOCUMENT_CONTENT_TYPES:
             return Response(
-                {"error": "Debe especificar un paciente."},
+                {"error": f"Tipo de archivo no permitido. Permitidos: {', '.join(sorted(DOCUMENT_CONTENT_TYPES))}"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        psychologist = request.user
+        try:
+            upload = direct_uploads.create_upload(
+                request.user.id,
+                'clinical_documents',
+                filename,
+                content_type,
+                int(request.data.get('size') or 0),
+                MAX_DOCUMENT_SIZE,
+                patient=int(patient_id)
+            )
+        except ValueError:
+            return Response({"error": "size y patient deben ser enteros."}, status=status.HTTP_400_BAD_REQUEST)
+        except direct_uploads.UploadError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(upload, status=status.HTTP_201_CREATED)
 
-        has_had_appointment = Appointment.objects.filter(
-            psychologist=psychologist,
-            patient_id=patient_id
-        ).exists()
 
-        if not has_had_appointment:
-            return Response(
-                {"error": "No tienes permiso para subir documentos a este paciente. Solo puedes subir documentos a pacientes con los que has tenido una cita."},
-                status=status.HTTP_403_FORBIDDEN
+class DocumentConfirmUploadView(generics.GenericAPIView):
+    """
+    Paso 2 de la subida directa: tras subir a S3, registra el documento.
+    Body: {"upload_token": "...", "description": "..."}
+    """
+    serializer_class = ClinicalDocumentSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        try:
+            upload = direct_uploads.confirm_upload(
+                request.data.get('upload_token') or '',
+                request.user.id,
+                'clinical_documents'
             )
-        
-        return super().create(request, *args, **kwargs)
+        except direct_uploads.UploadError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(data={
+            'patient': upload['patient'],
+            'description': request.data.get('description', ''),
+        }, partial=True)
+        serializer.is_valid(raise_exception=True)
+
+        # Confirmación idempotente: reenviar el mismo upload_token devuelve el
+        # documento ya registrado (el archivo es único)
+        existing = ClinicalDocument.objects.filter(file=upload['key']).first()
+        if existing:
+            return Response(self.get_serializer(existing).data)
+
+        # El archivo ya está en S3: sólo se guarda su clave, sin pasar por el storage
+        document = ClinicalDocument(
+            patient_id=upload['patient'],
+            uploaded_by=request.user,
+            description=serializer.validated_data['description'],
+        )
+        document.file.name = upload['key']
+        try:
+            with transaction.atomic():
+                document.save()
+        except IntegrityError:
+            # Otra confirmación del mismo token ganó la carrera
+            existing = ClinicalDocument.objects.get(file=upload['key'])
+            return Response(self.get_serializer(existing).data)
+
+        logger.info(f"✅ [DirectUpload] Documento {document.id} registrado ({upload['size']} bytes): {upload['key']}")
+        return Response(self.get_serializer(document).data, status=status.HTTP_201_CREATED)
 
 
 # --- 👇 AÑADE ESTE NUEVO CÓDIGO AL FINAL DEL ARCHIVO 👇 ---
@@ -16,16 +16,16 @@ class PushSubscriptionAdmin(admin.ModelAdmin):
 
 @admin.register(PushNotification)
 class PushNotificationAdmin(admin.ModelAdmin):
-    list_display = ['title', 'user', 'status', 'created_at', 'sent_at']
+    list_display = ['title', 'user', 'status', 'attempts', 'latency_ms', 'created_at', 'sent_at']
     list_filter = ['status', 'created_at']
     search_fields = ['title', 'body', 'user__email']
-    readonly_fields = ['user', 'title', 'body', 'url', 'icon', 'status', 'error_message', 'created_at', 'sent_at']
+    readonly_fields = ['user', 'title', 'body', 'url', 'icon', 'status', 'error_message', 'attempts', 'next_attempt_at', 'latency_ms', 'created_at', 'sent_at']
     
     fieldsets = (
         ('Información', {
             'fields': ('user', 'title', 'body', 'url', 'icon')
         }),
         ('Estado', {
-            'fields': ('status', 'error_message', 'created_at', 'sent_at')
+            'fields': ('status', 'error_message', 'attempts', 'next_attempt_at', 'latency_ms', 'created_at', 'sent_at')
         }),
     )
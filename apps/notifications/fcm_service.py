@@ -5,9 +5,19 @@ from django.conf import settings
 import logging
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
+
+from .models import PushSubscription
 
 logger = logging.getLogger(__name__)
 
+# Máximo de mensajes por llamada a send_each_for_multicast
+FCM_BATCH_SIZE = 500
+# Lotes enviados en paralelo (cada lote ya abre sus propios hilos en el SDK)
+FCM_MAX_CONCURRENT_BATCHES = 4
+# Errores que indican que el token ya no sirve y hay que desactivarlo
+UNREGISTERED_ERRORS = (messaging.UnregisteredError, messaging.SenderIdMismatchError)
+
 # Inicializar Firebase Admin SDK
 def initialize_firebase():
     """
@@ -135,90 +145,144 @@ def send_fcm_notification(fcm_token, title, body, data=None):
         }
 
 
+def _build_multicast(fcm_tokens, title, body, data=None):
+    """Mismo mensaje que send_fcm_notification, para varios tokens."""
+    return messaging.MulticastMessage(
+        notification=messaging.Notification(
+            title=title,
+            body=body,
+        ),
+        data=data or {},
+        tokens=fcm_tokens,
+        android=messaging.AndroidConfig(
+            priority='high',
+            notification=messaging.AndroidNotification(
+                sound='default',
+                channel_id='default',
+            ),
+        ),
+        apns=messaging.APNSConfig(
+            payload=messaging.APNSPayload(
+                aps=messaging.Aps(
+                    sound='default',
+                    badge=1,
+                ),
+            ),
+        ),
+    )
+
+
+def _send_chunk(fcm_tokens, title, body, data):
+    """
+    Envía un lote (máx. FCM_BATCH_SIZE) con send_each_for_multicast.
+    Devuelve una respuesta por token, en el mismo orden.
+    """
+    try:
+        batch = messaging.send_each_for_multicast(
+            _build_multicast(fcm_tokens, title, body, data)
+        )
+    except Exception as e:
+        # Falla el lote completo (credenciales, red...): todos sus tokens fallan
+        logger.error(f"❌ Error enviando lote FCM de {len(fcm_tokens)} tokens: {str(e)}")
+        return [
+            {'success': False, 'message_id': None, 'error': str(e), 'unregistered': False}
+            for _ in fcm_tokens
+        ]
+
+    return [
+        {
+            'success': response.success,
+            'message_id': response.message_id,
+            'error': None if response.success else str(response.exception),
+            'unregistered': isinstance(response.exception, UNREGISTERED_ERRORS),
+        }
+        for response in batch.responses
+    ]
+
+
 def send_fcm_to_multiple(fcm_tokens, title, body, data=None):
     """
-    Envía notificación FCM a múltiples tokens (usando send individual).
-    
+    Envía notificación FCM a múltiples tokens.
+
+    Los tokens se agrupan en lotes de FCM_BATCH_SIZE y cada lote se envía con
+    send_each_for_multicast (API v1, un envío por token dentro del SDK; no
+    usa el endpoint /batch retirado). Los lotes se envían en paralelo, con
+    FCM_MAX_CONCURRENT_BATCHES como máximo.
+
     Args:
         fcm_tokens (list): Lista de tokens FCM
         title (str): Título de la notificación
         body (str): Cuerpo del mensaje
         data (dict): Datos adicionales opcionales
-    
+
     Returns:
-        dict: {'success_count': int, 'failure_count': int, 'responses': list}
+        dict: {'success_count': int, 'failure_count': int, 'responses': list,
+               'unregistered_tokens': list}
+        responses va en el mismo orden que fcm_tokens.
     """
     if not initialize_firebase():
         return {
             'success_count': 0,
             'failure_count': len(fcm_tokens),
-            'responses': []
+            'responses': [],
+            'unregistered_tokens': []
         }
-    
+
     if not fcm_tokens:
         return {
             'success_count': 0,
             'failure_count': 0,
-            'responses': []
+            'responses': [],
+            'unregistered_tokens': []
         }
-    
-    # Enviar a cada token individualmente para evitar error 404 con /batch
-    success_count = 0
-    failure_count = 0
+
+    fcm_tokens = list(fcm_tokens)
+    chunks = [
+        fcm_tokens[start:start + FCM_BATCH_SIZE]
+        for start in range(0, len(fcm_tokens), FCM_BATCH_SIZE)
+    ]
+
+    if len(chunks) == 1:
+        chunk_results = [_send_chunk(chunks[0], title, body, data)]
+    else:
+        with ThreadPoolExecutor(max_workers=min(FCM_MAX_CONCURRENT_BATCHES, len(chunks))) as executor:
+            # map conserva el orden de los lotes
+            chunk_results = list(executor.map(
+                lambda chunk: _send_chunk(chunk, title, body, data), chunks
+            ))
+
     responses = []
-    
-    for token in fcm_tokens:
-        try:
-            message = messaging.Message(
-                notification=messaging.Notification(
-                    title=title,
-                    body=body,
-                ),
-                data=data or {},
-                token=token,
-                android=messaging.AndroidConfig(
-                    priority='high',
-                    notification=messaging.AndroidNotification(
-                        sound='default',
-                        channel_id='default',
-                    ),
-                ),
-                apns=messaging.APNSConfig(
-                    payload=messaging.APNSPayload(
-                        aps=messaging.Aps(
-                            sound='default',
-                            badge=1,
-                        ),
-                    ),
-                ),
-            )
-            
-            message_id = messaging.send(message)
-            
-            responses.append({
-                'success': True,
-                'message_id': message_id,
-                'error': None
-            })
-            success_count += 1
-            logger.info(f"✅ Notificación enviada: {message_id}")
-            
-        except Exception as token_error:
-            error_msg = str(token_error)
-            responses.append({
-                'success': False,
-                'message_id': None,
-                'error': error_msg
-            })
-            failure_count += 1
-            logger.error(f"❌ Error enviando a token {token[:20]}...: {error_msg}")
-    
+    unregistered_tokens = []
+    for chunk, results in zip(chunks, chunk_results):
+        for token, result in zip(chunk, results):
+            if result.pop('unregistered'):
+                unregistered_tokens.append(token)
+            responses.append(result)
+
+    success_count = sum(1 for response in responses if response['success'])
+    failure_count = len(responses) - success_count
+
     logger.info(
-        f"✅ Notificaciones FCM: {success_count} exitosas, {failure_count} fallidas"
+        f"✅ Notificaciones FCM: {success_count} exitosas, {failure_count} fallidas "
+        f"({len(chunks)} lotes, {len(unregistered_tokens)} tokens no registrados)"
     )
-    
+
     return {
         'success_count': success_count,
         'failure_count': failure_count,
-        'responses': responses
+        'responses': responses,
+        'unregistered_tokens': unregistered_tokens
     }
+
+
+def deactivate_fcm_tokens(fcm_tokens):
+    """Desactiva en un solo UPDATE las suscripciones de tokens no registrados."""
+    if not fcm_tokens:
+        return 0
+    updated = PushSubscription.objects.filter(
+        fcm_token__in=fcm_tokens,
+        is_active=True
+    ).update(is_active=False)
+    if updated:
+        logger.warning(f"🗑️ {updated} tokens FCM desactivados (no registrados)")
+    return updated
@@ -0,0 +1,115 @@
+"""
+Comando para medir el envío de Web Push contra un servidor push local.
+Ejecutar con: python manage.py benchmark_webpush --subscriptions 1000 --latency 50
+
+Levanta un servidor HTTP en 127.0.0.1 que responde 201 a cada push (con
+una latencia simulada) y envía a N suscripciones en memoria (no se tocan
+la BD ni los servicios push reales) de dos formas:
+- secuencial: un webpush() tras otro, una conexión nueva por envío
+- concurrente: dispatch_webpush() con pool de hilos y sesión por origen
+"""
+
+import base64
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from django.core.management.base import BaseCommand, CommandError
+from py_vapid import Vapid
+from pywebpush import webpush
+
+from apps.notifications.models import PushSubscription
+from apps.notifications.webpush_service import dispatch_webpush
+
+
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def _stub_handler(latency, counter):
+    class StubPushHandler(BaseHTTPRequestHandler):
+        # HTTP/1.1 para que el cliente pueda reutilizar la conexión
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(latency)
+            with counter['lock']:
+                counter['received'] += 1
+            self.send_response(201)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    return StubPushHandler
+
+
+class Command(BaseCommand):
+    help = 'Compara el envío secuencial y concurrente de Web Push contra un servidor local'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscriptions', type=int, default=1000, help='Número de suscripciones')
+        parser.add_argument('--latency', type=int, default=50, help='Latencia simulada del servidor en ms')
+        parser.add_argument('--skip-sequential', action='store_true', help='Medir sólo el envío concurrente')
+
+    def handle(self, *args, **options):
+        counter = {'received': 0, 'lock': threading.Lock()}
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _stub_handler(options['latency'] / 1000, counter))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_address[1]
+
+        vapid = Vapid()
+        vapid.generate_keys()
+        payload = {'title': 'Benchmark', 'body': 'Web Push', 'url': '/'}
+        jobs = [(self._fake_subscription(port, index), payload) for index in range(options['subscriptions'])]
+        self.stdout.write(
+            f'🔔 {len(jobs)} suscripciones contra 127.0.0.1:{port} ({options["latency"]} ms de latencia)'
+        )
+
+        try:
+            if not options['skip_sequential']:
+                start = time.perf_counter()
+                for subscription, data in jobs:
+                    webpush(
+                        subscription_info=subscription.to_dict(),
+                        data=json.dumps(data),
+                        vapid_private_key=vapid,
+                        vapid_claims={'sub': 'mailto:benchmark@localhost'},
+                    )
+                self._report('Secuencial', len(jobs), len(jobs), time.perf_counter() - start)
+
+            start = time.perf_counter()
+            results = dispatch_webpush(jobs, vapid_key=vapid)
+            sent = sum(1 for result in results if result['success'])
+            self._report('Concurrente', sent, len(jobs), time.perf_counter() - start)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        if sent != len(jobs):
+            errors = {result['error'] for result in results if not result['success']}
+            raise CommandError(f'{len(jobs) - sent} envíos fallidos: {"; ".join(sorted(errors)[:3])}')
+
+    def _report(self, label, sent, total, elapsed):
+        rate = sent / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(f'📊 {label}: {sent}/{total} en {elapsed:.2f} s ({rate:,.0f} push/s)')
+        )
+
+    @staticmethod
+    def _fake_subscription(port, index):
+        client_key = ec.generate_private_key(ec.SECP256R1()).public_key().public_bytes(
+            serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+        )
+        return PushSubscription(
+            endpoint=f'http://127.0.0.1:{port}/push/{index}',
+            p256dh=_b64(client_key),
+            auth=_b64(os.urandom(16)),
+        )
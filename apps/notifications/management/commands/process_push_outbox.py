@@ -0,0 +1,103 @@
+"""
+Worker de la cola de notificaciones push (apps/notifications/outbox.py).
+Ejecutar con: python manage.py process_push_outbox [--loop] [--workers 4]
+
+En cada pasada recorre todos los tenants y vacía su cola por lotes de
+--batch-size. Los lotes se reclaman con FOR UPDATE SKIP LOCKED, así que se
+pueden levantar varios workers a la vez. Sin --loop hace una sola pasada
+(para cron); con --loop espera --interval segundos cuando no hay trabajo.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django_tenants.utils import schema_context, get_tenant_model
+
+from apps.notifications.outbox import BATCH_SIZE, process_batch
+
+
+class Command(BaseCommand):
+    help = 'Envía las notificaciones push encoladas de todos los tenants'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help=f'Notificaciones reclamadas por lote (por defecto {BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Número máximo de tenants procesados en paralelo (por defecto 4)'
+        )
+        parser.add_argument('--loop', action='store_true', help='Seguir procesando indefinidamente')
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Segundos de espera cuando no hay trabajo (con --loop)'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            claimed = self._run_once(options['batch_size'], options['workers'])
+            if not options['loop']:
+                break
+            if not claimed:
+                time.sleep(options['interval'])
+
+    def _run_once(self, batch_size, workers):
+        Tenant = get_tenant_model()
+        schema_names = list(
+            Tenant.objects.exclude(schema_name='public').values_list('schema_name', flat=True)
+        )
+        totals = {'claimed': 0, 'sent': 0, 'retrying': 0, 'failed': 0}
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {
+                executor.submit(self._process_tenant, schema_name, batch_size): schema_name
+                for schema_name in schema_names
+            }
+            for future in as_completed(futures):
+                schema_name = futures[future]
+                try:
+                    counts = future.result()
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f'❌ {schema_name}: {e}'))
+                    continue
+
+                if counts['claimed']:
+                    self.stdout.write(
+                        f"🏥 {schema_name}: {counts['sent']} enviadas, "
+                        f"{counts['retrying']} reintentando, {counts['failed']} fallidas"
+                    )
+                for key in totals:
+                    totals[key] += counts[key]
+
+        if totals['claimed']:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"📊 Total: {totals['sent']} enviadas, {totals['retrying']} reintentando, "
+                    f"{totals['failed']} fallidas"
+                )
+            )
+        return totals['claimed']
+
+    @staticmethod
+    def _process_tenant(schema_name, batch_size):
+        # Vacía la cola del tenant; cada hilo usa su propia conexión
+        totals = {'claimed': 0, 'sent': 0, 'retrying': 0, 'failed': 0}
+        try:
+            with schema_context(schema_name):
+                while True:
+                    counts = process_batch(batch_size)
+                    for key in totals:
+                        totals[key] += counts[key]
+                    if counts['claimed'] < batch_size:
+                        return totals
+        finally:
+            connection.close()
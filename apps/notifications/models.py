@@ -75,6 +75,11 @@ class PushNotification(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     error_message = models.TextField(blank=True, null=True)
     
+    # Cola de envío (outbox.py): sólo las filas encoladas tienen next_attempt_at
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(blank=True, null=True)
+    latency_ms = models.PositiveIntegerField(blank=True, null=True)  # De encolada a enviada
+    
     created_at = models.DateTimeField(auto_now_add=True)
     sent_at = models.DateTimeField(blank=True, null=True)
     
@@ -83,6 +88,13 @@ class PushNotification(models.Model):
         verbose_name = 'Notificación Push'
         verbose_name_plural = 'Notificaciones Push'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['next_attempt_at'],
+                name='push_notif_outbox_idx',
+                condition=models.Q(status='pending', next_attempt_at__isnull=False)
+            ),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.user.email}"
@@ -0,0 +1,173 @@
+# apps/notifications/outbox.py
+
+"""
+Cola de salida (outbox) de notificaciones Web Push sobre PushNotification.
+
+- enqueue(): la API inserta las filas con un bulk_create (status 'pending',
+  next_attempt_at = ahora) y responde 202 sin esperar al servicio push.
+- process_batch(): el worker (manage.py process_push_outbox) reclama un lote
+  con un UPDATE ... FOR UPDATE SKIP LOCKED que suma un intento y adelanta
+  next_attempt_at LEASE_SECONDS. El UPDATE se confirma antes de enviar, así
+  que varios workers no se pisan y, si uno muere, las filas vuelven a estar
+  disponibles al vencer el plazo.
+- Los envíos del lote van en paralelo (webpush_service.send_webpush). Si
+  ningún dispositivo lo recibe por un error temporal (red, 429, 5xx), se
+  reintenta con backoff exponencial hasta MAX_ATTEMPTS.
+
+Las filas creadas por los envíos síncronos (FCM) no tienen next_attempt_at
+y el worker nunca las toma.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.utils import timezone
+
+from .models import PushNotification, PushSubscription
+from .webpush_service import send_webpush
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 60 * 60
+LEASE_SECONDS = 5 * 60
+DEFAULT_ICON = '/icons/icon-192x192.png'
+
+CLAIM_SQL = """
+WITH due AS (
+    SELECT id
+    FROM {table}
+    WHERE status = 'pending'
+      AND next_attempt_at IS NOT NULL
+      AND next_attempt_at <= %(now)s
+    ORDER BY next_attempt_at
+    LIMIT %(limit)s
+    FOR UPDATE SKIP LOCKED
+)
+UPDATE {table} AS n
+SET attempts = n.attempts + 1,
+    next_attempt_at = %(lease_until)s
+FROM due
+WHERE n.id = due.id
+RETURNING n.id
+"""
+
+
+def enqueue(user_ids, title, body, url=None, icon=None):
+    """
+    Encola una notificación por usuario existente.
+    Devuelve (notificaciones creadas, ids de usuario no encontrados).
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    existing = set(
+        get_user_model().objects.filter(id__in=user_ids).values_list('id', flat=True)
+    )
+    now = timezone.now()
+    notifications = PushNotification.objects.bulk_create([
+        PushNotification(
+            user_id=user_id,
+            title=title,
+            body=body,
+            url=url or '/',
+            icon=icon or DEFAULT_ICON,
+            status='pending',
+            next_attempt_at=now,
+        )
+        for user_id in user_ids
+        if user_id in existing
+    ], batch_size=500)
+    return notifications, [user_id for user_id in user_ids if user_id not in existing]
+
+
+def _claim(limit):
+    now = timezone.now()
+    sql = CLAIM_SQL.format(table=connection.ops.quote_name(PushNotification._meta.db_table))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {
+            'now': now,
+            'limit': limit,
+            'lease_until': now + timedelta(seconds=LEASE_SECONDS),
+        })
+        ids = [row[0] for row in cursor.fetchall()]
+    return list(PushNotification.objects.filter(id__in=ids)) if ids else []
+
+
+def _backoff(attempts):
+    return timedelta(seconds=min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS))
+
+
+def _is_retryable(result):
+    status_code = result['status_code']
+    return status_code is None or status_code == 429 or status_code >= 500
+
+
+def process_batch(batch_size=BATCH_SIZE):
+    """
+    Procesa un lote del tenant actual.
+    Devuelve {'claimed', 'sent', 'retrying', 'failed'}.
+    """
+    notifications = _claim(batch_size)
+    counts = {'claimed': len(notifications), 'sent': 0, 'retrying': 0, 'failed': 0}
+    if not notifications:
+        return counts
+
+    subscriptions_by_user = defaultdict(list)
+    for subscription in PushSubscription.objects.filter(
+        user_id__in={notification.user_id for notification in notifications},
+        is_active=True,
+        platform='web'
+    ):
+        subscriptions_by_user[subscription.user_id].append(subscription)
+
+    jobs = []
+    job_owner = []
+    for index, notification in enumerate(notifications):
+        payload = {
+            'title': notification.title,
+            'body': notification.body,
+            'url': notification.url or '/',
+            'icon': notification.icon or DEFAULT_ICON,
+        }
+        for subscription in subscriptions_by_user[notification.user_id]:
+            jobs.append((subscription, payload))
+            job_owner.append(index)
+
+    results_by_notification = defaultdict(list)
+    for index, result in zip(job_owner, send_webpush(jobs)):
+        results_by_notification[index].append(result)
+
+    now = timezone.now()
+    for index, notification in enumerate(notifications):
+        results = results_by_notification[index]
+        if any(result['success'] for result in results):
+            notification.status = 'sent'
+            notification.sent_at = now
+            notification.next_attempt_at = None
+            notification.error_message = None
+            notification.latency_ms = int((now - notification.created_at).total_seconds() * 1000)
+            counts['sent'] += 1
+        elif not results:
+            notification.status = 'failed'
+            notification.next_attempt_at = None
+            notification.error_message = 'El usuario no tiene suscripciones activas'
+            counts['failed'] += 1
+        elif notification.attempts < MAX_ATTEMPTS and any(_is_retryable(result) for result in results):
+            notification.next_attempt_at = now + _backoff(notification.attempts)
+            notification.error_message = results[0]['error']
+            counts['retrying'] += 1
+        else:
+            notification.status = 'failed'
+            notification.next_attempt_at = None
+            notification.error_message = results[0]['error']
+            counts['failed'] += 1
+
+    PushNotification.objects.bulk_update(
+        notifications,
+        ['status', 'sent_at', 'next_attempt_at', 'error_message', 'latency_ms']
+    )
+    return counts
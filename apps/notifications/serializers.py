@@ -70,6 +70,7 @@ class PushNotificationSerializer(serializers.ModelSerializer):
         model = PushNotification
         fields = [
             'id', 'title', 'body', 'url', 'icon',
-            'status', 'error_message', 'created_at', 'sent_at'
+            'status', 'error_message', 'attempts', 'latency_ms',
+            'created_at', 'sent_at'
         ]
         read_only_fields = fields
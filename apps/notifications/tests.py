@@ -0,0 +1,119 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext
+from django_tenants.test.cases import TenantTestCase
+from firebase_admin import messaging
+
+from . import fcm_service
+from .models import PushSubscription
+
+User = get_user_model()
+
+
+class FakeFCM:
+    """
+    Sustituto de messaging.send_each_for_multicast: no sale a la red y
+    responde como el SDK. Los tokens que empiezan por 'dead' se dan por no
+    registrados y los que empiezan por 'bad' fallan con otro error.
+    """
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def __call__(self, multicast):
+        self.batch_sizes.append(len(multicast.tokens))
+        responses = []
+        for token in multicast.tokens:
+            if token.startswith('dead'):
+                responses.append(messaging.SendResponse(None, messaging.UnregisteredError('Token no registrado')))
+            elif token.startswith('bad'):
+                responses.append(messaging.SendResponse(None, ValueError('Payload inválido')))
+            else:
+                responses.append(messaging.SendResponse({'name': f'projects/test/messages/{token}'}, None))
+        return messaging.BatchResponse(responses)
+
+
+@mock.patch.object(fcm_service, 'initialize_firebase', return_value=True)
+class SendFCMToMultipleTests(SimpleTestCase):
+
+    def test_batches_of_500_keep_token_order(self, _):
+        tokens = [f'token-{index}' for index in range(1200)]
+        tokens[10] = 'dead-10'
+        tokens[700] = 'bad-700'
+        tokens[1100] = 'dead-1100'
+        fake = FakeFCM()
+
+        with mock.patch.object(messaging, 'send_each_for_multicast', fake):
+            result = fcm_service.send_fcm_to_multiple(tokens, 'Título', 'Cuerpo')
+
+        self.assertEqual(sorted(fake.batch_sizes), [200, 500, 500])
+        self.assertEqual(result['success_count'], 1197)
+        self.assertEqual(result['failure_count'], 3)
+        self.assertEqual(result['unregistered_tokens'], ['dead-10', 'dead-1100'])
+        self.assertEqual(len(result['responses']), len(tokens))
+        self.assertEqual(result['responses'][0]['message_id'], 'projects/test/messages/token-0')
+        self.assertEqual(result['responses'][1199]['message_id'], 'projects/test/messages/token-1199')
+        self.assertFalse(result['responses'][700]['success'])
+        self.assertNotIn('unregistered', result['responses'][0])
+
+    def test_failed_batch_fails_all_its_tokens(self, _):
+        tokens = [f'token-{index}' for index in range(600)]
+
+        def send(multicast):
+            if 'token-0' in multicast.tokens:
+                raise ConnectionError('Sin red')
+            return FakeFCM()(multicast)
+
+        with mock.patch.object(messaging, 'send_each_for_multicast', send):
+            result = fcm_service.send_fcm_to_multiple(tokens, 'Título', 'Cuerpo')
+
+        self.assertEqual(result['success_count'], 100)
+        self.assertEqual(result['failure_count'], 500)
+        self.assertEqual(result['responses'][0]['error'], 'Sin red')
+        self.assertEqual(result['unregistered_tokens'], [])
+
+    def test_no_tokens(self, _):
+        with mock.patch.object(messaging, 'send_each_for_multicast') as send:
+            result = fcm_service.send_fcm_to_multiple([], 'Título', 'Cuerpo')
+        send.assert_not_called()
+        self.assertEqual(result['responses'], [])
+
+
+class DeactivateFCMTokensTests(TenantTestCase):
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Clínica de pruebas'
+
+    def test_deactivates_in_one_update(self):
+        user = User.objects.create_user(
+            email='paciente@example.com', password='x',
+            first_name='Ana', last_name='Pérez', user_type='patient'
+        )
+        for token in ['dead-1', 'dead-2', 'live-1']:
+            PushSubscription.objects.create(
+                user=user,
+                endpoint=f'https://fcm.googleapis.com/fcm/send/{token}',
+                fcm_token=token,
+                platform='android'
+            )
+
+        with CaptureQueriesContext(connection) as context:
+            updated = fcm_service.deactivate_fcm_tokens(['dead-1', 'dead-2'])
+
+        # Sólo cuentan las consultas sobre push_subscriptions: django-tenants
+        # añade un SET search_path y el logger.warning escribe en audit_log_entries
+        statements = [
+            query['sql'] for query in context.captured_queries
+            if '"push_subscriptions"' in query['sql']
+        ]
+        self.assertEqual(len(statements), 1, statements)
+        self.assertTrue(statements[0].startswith('UPDATE'))
+        self.assertEqual(updated, 2)
+        self.assertEqual(
+            list(PushSubscription.objects.filter(is_active=True).values_list('fcm_token', flat=True)),
+            ['live-1']
+        )
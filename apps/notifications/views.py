@@ -4,10 +4,7 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from django.conf import settings
 from django.utils import timezone
-from pywebpush import webpush, WebPushException
-import json
 import logging
-from py_vapid import Vapid
 
 from .models import PushSubscription, PushNotification
 from .serializers import (
@@ -15,28 +12,12 @@ from .serializers import (
     SendPushNotificationSerializer,
     PushNotificationSerializer
 )
-from .fcm_service import send_fcm_notification, send_fcm_to_multiple
+from .fcm_service import send_fcm_to_multiple, deactivate_fcm_tokens
+from . import outbox
 
 logger = logging.getLogger(__name__)
 
 
-def get_vapid_key():
-    """
-    Obtiene la clave VAPID en el formato correcto.
-    Maneja tanto formato PEM como raw base64.
-    """
-    private_key = settings.VAPID_PRIVATE_KEY.strip()
-    
-    # Si la clave está en formato PEM (completo), convertirla
-    if private_key.startswith('-----BEGIN'):
-        vapid = Vapid.from_pem(private_key.encode())
-        return vapid
-    else:
-        # Si es formato raw base64 (sin headers), usarla directamente
-        # pywebpush espera el string raw
-        return private_key
-
-
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def subscribe_push(request):
@@ -113,6 +94,7 @@ def send_push_notification(request):
     """
     Enviar notificación push a uno o varios usuarios.
     Requiere permisos de admin o staff.
+    Las notificaciones se encolan (outbox.py) y se responde 202 al momento.
     
     POST /api/notifications/send/
     Body: {
@@ -144,124 +126,24 @@ def send_push_notification(request):
     elif data.get('user_ids'):
         user_ids = data['user_ids']
     
-    # Preparar payload de la notificación
-    payload = {
-        'title': data['title'],
-        'body': data['body'],
-        'url': data.get('url', '/'),
-        'icon': data.get('icon', '/icons/icon-192x192.png'),
-    }
-    
-    results = {
-        'total': len(user_ids),
-        'sent': 0,
-        'failed': 0,
-        'errors': []
-    }
-    
-    # Enviar a cada usuario
-    for user_id in user_ids:
-        result = _send_push_to_user(user_id, payload)
-        if result['success']:
-            results['sent'] += result['count']
-        else:
-            results['failed'] += 1
-            results['errors'].append({
-                'user_id': user_id,
-                'error': result['error']
-            })
-    
-    return Response(results, status=status.HTTP_200_OK)
-
-
-def _send_push_to_user(user_id, payload):
-    """
-    Función interna para enviar notificación push a un usuario específico.
-    Envía a todos los dispositivos suscritos del usuario.
-    """
-    from django.contrib.auth import get_user_model
-    User = get_user_model()
-    
-    try:
-        user = User.objects.get(id=user_id)
-    except User.DoesNotExist:
-        return {
-            'success': False,
-            'error': f'Usuario {user_id} no encontrado',
-            'count': 0
-        }
-    
-    # Obtener todas las suscripciones activas del usuario
-    subscriptions = PushSubscription.objects.filter(
-        user=user,
-        is_active=True
+    # Encolar: el worker process_push_outbox hace el envío real
+    notifications, missing_user_ids = outbox.enqueue(
+        user_ids,
+        title=data['title'],
+        body=data['body'],
+        url=data.get('url'),
+        icon=data.get('icon'),
     )
     
-    if not subscriptions.exists():
-        return {
-            'success': False,
-            'error': f'Usuario {user.email} no tiene suscripciones activas',
-            'count': 0
-        }
-    
-    sent_count = 0
-    vapid_claims = {
-        "sub": f"mailto:{settings.VAPID_CLAIM_EMAIL}"
-    }
-    
-    # Obtener clave VAPID
-    vapid_key = get_vapid_key()
-    
-    # Crear registro de notificación
-    notification = PushNotification.objects.create(
-        user=user,
-        title=payload['title'],
-        body=payload['body'],
-        url=payload.get('url'),
-        icon=payload.get('icon'),
-        status='pending'
-    )
-    
-    # Enviar a cada dispositivo
-    for subscription in subscriptions:
-        try:
-            webpush(
-                subscription_info=subscription.to_dict(),
-                data=json.dumps(payload),
-                vapid_private_key=vapid_key,
-                vapid_claims=vapid_claims
-            )
-            
-            subscription.last_used = timezone.now()
-            subscription.save()
-            sent_count += 1
-            
-            logger.info(f"✅ Push enviado a {user.email}")
-            
-        except WebPushException as e:
-            logger.error(f"❌ Error enviando push a {user.email}: {str(e)}")
-            
-            # Si el endpoint expiró (410), desactivar suscripción
-            if e.response and e.response.status_code == 410:
-                subscription.is_active = False
-                subscription.save()
-                logger.info(f"🗑️ Suscripción desactivada (endpoint expirado)")
-    
-    # Actualizar estado de la notificación
-    if sent_count > 0:
-        notification.status = 'sent'
-        notification.sent_at = timezone.now()
-    else:
-        notification.status = 'failed'
-        notification.error_message = 'No se pudo enviar a ningún dispositivo'
-    
-    notification.save()
-    
-    return {
-        'success': sent_count > 0,
-        'count': sent_count,
-        'error': None if sent_count > 0 else 'No se envió a ningún dispositivo'
-    }
+    return Response({
+        'total': len(user_ids),
+        'queued': len(notifications),
+        'notification_ids': [notification.id for notification in notifications],
+        'errors': [
+            {'user_id': user_id, 'error': f'Usuario {user_id} no encontrado'}
+            for user_id in missing_user_ids
+        ]
+    }, status=status.HTTP_202_ACCEPTED)
 
 
 @api_view(['GET'])
@@ -487,15 +369,8 @@ def _send_fcm_to_user(user_id, title, body, data=None):
     
     sent_count = result['success_count']
     
-    # Desactivar tokens inválidos
-    for i, response in enumerate(result.get('responses', [])):
-        if not response['success'] and response.get('error'):
-            if 'not registered' in response['error'].lower() or 'invalid' in response['error'].lower():
-                # Desactivar suscripción con token inválido
-                subscription = subscriptions[i]
-                subscription.is_active = False
-                subscription.save()
-                logger.warning(f"🗑️ Token FCM desactivado (inválido): {subscription.fcm_token[:20]}...")
+    # Desactivar tokens no registrados (un solo UPDATE)
+    deactivate_fcm_tokens(result.get('unregistered_tokens', []))
     
     # Actualizar estado de la notificación
     if sent_count > 0:
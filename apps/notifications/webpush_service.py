@@ -0,0 +1,136 @@
+# apps/notifications/webpush_service.py
+
+"""
+Envío concurrente de notificaciones Web Push.
+
+dispatch_webpush() recibe una lista de (suscripción, payload) y los envía
+en paralelo con un pool de hilos (WEBPUSH_MAX_WORKERS). Las conexiones HTTPS
+se reutilizan: hay una requests.Session por origen del servicio push
+(fcm.googleapis.com, updates.push.services.mozilla.com, ...) con un pool
+del tamaño del pool de hilos, compartida entre envíos y peticiones.
+
+send_webpush() además aplica los resultados a la BD al final con un solo
+bulk_update (last_used de las enviadas, is_active=False de las 404/410).
+"""
+
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+from py_vapid import Vapid
+from pywebpush import webpush, WebPushException
+from requests.adapters import HTTPAdapter
+
+from .models import PushSubscription
+
+logger = logging.getLogger(__name__)
+
+WEBPUSH_MAX_WORKERS = 16
+WEBPUSH_TIMEOUT = 10
+# El servicio push responde 404/410 cuando la suscripción ya no existe
+EXPIRED_STATUS_CODES = (404, 410)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_vapid_key():
+    """
+    Devuelve la clave VAPID ya parseada (PEM o raw base64), para no
+    volver a parsearla en cada envío.
+    """
+    private_key = settings.VAPID_PRIVATE_KEY.strip()
+    if private_key.startswith('-----BEGIN'):
+        return Vapid.from_pem(private_key.encode())
+    return Vapid.from_string(private_key)
+
+
+def _origin(endpoint):
+    url = urlparse(endpoint)
+    return f'{url.scheme}://{url.netloc}'
+
+
+def _session_for(endpoint):
+    """Session con pool de conexiones por origen del servicio push."""
+    origin = _origin(endpoint)
+    with _sessions_lock:
+        session = _sessions.get(origin)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=WEBPUSH_MAX_WORKERS)
+            session.mount(origin, adapter)
+            _sessions[origin] = session
+        return session
+
+
+def _send_one(subscription, payload, vapid_key, claim_email):
+    try:
+        response = webpush(
+            subscription_info=subscription.to_dict(),
+            data=json.dumps(payload),
+            vapid_private_key=vapid_key,
+            # pywebpush completa 'aud' y 'exp' en el dict: uno nuevo por envío
+            vapid_claims={"sub": f"mailto:{claim_email}"},
+            timeout=WEBPUSH_TIMEOUT,
+            requests_session=_session_for(subscription.endpoint),
+        )
+        return {'success': True, 'status_code': response.status_code, 'error': None}
+    except WebPushException as e:
+        status_code = e.response.status_code if e.response is not None else None
+        return {'success': False, 'status_code': status_code, 'error': str(e)}
+    except Exception as e:
+        return {'success': False, 'status_code': None, 'error': str(e)}
+
+
+def dispatch_webpush(jobs, vapid_key=None, max_workers=WEBPUSH_MAX_WORKERS):
+    """
+    Envía los pushes en paralelo sin tocar la BD.
+
+    Args:
+        jobs (list): [(PushSubscription, payload dict), ...]
+        vapid_key: clave VAPID (por defecto la de settings)
+
+    Returns:
+        list: un {'success', 'status_code', 'error'} por job, en el mismo orden
+    """
+    if not jobs:
+        return []
+
+    vapid_key = vapid_key or get_vapid_key()
+    claim_email = settings.VAPID_CLAIM_EMAIL
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as executor:
+        return list(executor.map(
+            lambda job: _send_one(job[0], job[1], vapid_key, claim_email), jobs
+        ))
+
+
+def send_webpush(jobs):
+    """
+    Igual que dispatch_webpush, pero al final guarda last_used de las
+    suscripciones enviadas y desactiva las expiradas con un solo bulk_update.
+    """
+    results = dispatch_webpush(jobs)
+
+    now = timezone.now()
+    changed = {}
+    for (subscription, _), result in zip(jobs, results):
+        if result['success']:
+            subscription.last_used = now
+            changed[subscription.pk] = subscription
+        elif result['status_code'] in EXPIRED_STATUS_CODES:
+            subscription.is_active = False
+            changed[subscription.pk] = subscription
+            logger.info(f"🗑️ Suscripción {subscription.pk} desactivada (endpoint expirado)")
+
+    if changed:
+        PushSubscription.objects.bulk_update(changed.values(), ['last_used', 'is_active'])
+
+    sent = sum(1 for result in results if result['success'])
+    logger.info(f"✅ Web Push: {sent} enviados, {len(results) - sent} fallidos")
+    return results
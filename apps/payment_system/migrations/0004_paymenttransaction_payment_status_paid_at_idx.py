@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-19 10:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY no puede ejecutarse dentro de una transacción
+    atomic = False
+
+    dependencies = [
+        ('payment_system', '0003_alter_paymenttransaction_appointment'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='paymenttransaction',
+            index=models.Index(fields=['status', 'paid_at'], name='payment_status_paid_at_idx'),
+        ),
+    ]
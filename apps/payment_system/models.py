@@ -57,6 +57,9 @@ class PaymentTransaction(models.Model):
         verbose_name = 'Transacción de Pago'
         verbose_name_plural = 'Transacciones de Pago'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'paid_at'], name='payment_status_paid_at_idx'),
+        ]
     
     def __str__(self):
         return f"Pago {self.stripe_session_id} - {self.amount} {self.currency}"
@@ -3,7 +3,7 @@ import stripe
 from rest_framework import serializers
 from django.conf import settings
 from .models import PaymentTransaction, PatientPlan
-from apps.appointments.models import Appointment
+from apps.appointments.models import Appointment, SlotHold
 from apps.professionals.serializers import CarePlanSerializer
 from apps.professionals.models import CarePlan
 
@@ -49,12 +49,28 @@ class PaymentConfirmationSerializer(serializers.Serializer):
             # 2. Obtenemos la metadata
             metadata = session.get('metadata', {})
             appointment_id = metadata.get('appointment_id')
+            hold_id = metadata.get('hold_id')
             plan_id = metadata.get('plan_id') # <-- AÑADIDO: Buscar el plan_id
             
             # 3. ¡LA CLAVE! Guardamos la sesión
             data['stripe_session'] = session
             
-            if appointment_id:
+            if hold_id:
+                # --- Caso 0: Cita con reserva temporal (checkout web) ---
+                hold = SlotHold.objects.filter(id=hold_id).first()
+                if hold:
+                    data['hold'] = hold
+                else:
+                    # La reserva ya fue convertida: confirmación repetida
+                    transaction = PaymentTransaction.objects.filter(
+                        stripe_session_id=session.id,
+                        appointment__isnull=False
+                    ).select_related('appointment').first()
+                    if not transaction:
+                        raise serializers.ValidationError("La reserva asociada a este pago expiró o no existe.")
+                    data['appointment'] = transaction.appointment
+            
+            elif appointment_id:
                 # --- Caso 1: Es un pago de Cita Única ---
                 appointment = Appointment.objects.get(id=appointment_id)
                 data['appointment'] = appointment # Guardamos la cita
@@ -1,3 +1,92 @@
-from django.test import TestCase
+from datetime import time, timedelta
+from unittest import mock
 
-# Create your tests here.
+import stripe
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django_tenants.test.cases import TenantTestCase
+from rest_framework.test import APIRequestFactory
+
+from apps.appointments.models import Appointment, SlotHold
+from apps.professionals.models import ProfessionalProfile
+
+from .models import PaymentTransaction
+from .views import StripeWebhookView
+
+User = get_user_model()
+
+
+class StripeWebhookHoldTests(TenantTestCase):
+    """Un pago de reserva cuyo horario ya se ocupó se reembolsa y el webhook responde 200."""
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Clínica de pruebas'
+
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            email='paciente@example.com', password='x',
+            first_name='Ana', last_name='Pérez', user_type='patient'
+        )
+        other_patient = User.objects.create_user(
+            email='otro@example.com', password='x',
+            first_name='Eva', last_name='Ríos', user_type='patient'
+        )
+        psychologist = User.objects.create_user(
+            email='psicologo@example.com', password='x',
+            first_name='Luis', last_name='Gómez', user_type='professional'
+        )
+        ProfessionalProfile.objects.create(
+            user=psychologist, license_number='PSI-1', bio='-', education='-', experience_years=5,
+            consultation_fee=50, session_duration=60
+        )
+        appointment_date = timezone.localdate() + timedelta(days=3)
+        self.hold = SlotHold.objects.create(
+            patient=self.patient,
+            psychologist=psychologist,
+            appointment_date=appointment_date,
+            start_time=time(10, 0),
+            end_time=time(11, 0),
+            consultation_fee=50,
+            stripe_session_id='cs_test_1',
+            expires_at=timezone.now() + timedelta(minutes=10)
+        )
+        # Otra cita ocupó el horario mientras el paciente pagaba
+        Appointment.objects.create(
+            patient=other_patient,
+            psychologist=psychologist,
+            appointment_date=appointment_date,
+            start_time=time(10, 0),
+            end_time=time(11, 0),
+            consultation_fee=50,
+            status='confirmed'
+        )
+
+    def _event(self):
+        session = stripe.checkout.Session.construct_from({
+            'id': 'cs_test_1',
+            'payment_intent': 'pi_test_1',
+            'amount_total': 5000,
+            'currency': 'usd',
+            'metadata': {
+                'hold_id': str(self.hold.id),
+                'patient_id': str(self.patient.id),
+                'tenant_schema_name': self.tenant.schema_name,
+            },
+        }, 'sk_test')
+        return {'type': 'checkout.session.completed', 'data': {'object': session}}
+
+    def test_unavailable_slot_is_refunded(self):
+        request = APIRequestFactory().post('/api/payments/webhook/', b'{}', content_type='application/json')
+        with mock.patch.object(stripe.Webhook, 'construct_event', return_value=self._event()), \
+                mock.patch.object(stripe.Refund, 'create') as refund:
+            response = StripeWebhookView.as_view()(request)
+
+        self.assertEqual(response.status_code, 200)
+        refund.assert_called_once_with(
+            payment_intent='pi_test_1', idempotency_key='refund-unbooked-cs_test_1'
+        )
+        transaction = PaymentTransaction.objects.get(stripe_session_id='cs_test_1')
+        self.assertEqual(transaction.status, 'refunded')
+        self.assertIsNone(transaction.appointment)
+        self.assertEqual(Appointment.objects.filter(patient=self.patient).count(), 0)
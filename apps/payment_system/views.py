@@ -7,6 +7,7 @@ from rest_framework.response import Response
 from rest_framework import status, permissions, generics
 from apps.appointments.models import Appointment
 from apps.appointments.serializers import AppointmentCreateSerializer
+from apps.appointments.holds import create_hold, release_hold, convert_hold_to_appointment, SlotUnavailable
 from apps.professionals.models import CarePlan
 from django.shortcuts import get_object_or_404
 from apps.users.models import CustomUser
@@ -17,6 +18,7 @@ from apps.professionals.serializers import CarePlanSerializer
 from .models import PaymentTransaction, PatientPlan
 from .serializers import PaymentTransactionSerializer, PaymentConfirmationSerializer, PatientPlanSerializer
 from django.utils import timezone
+from django.db import connection, transaction as db_transaction
 from decimal import Decimal
 import logging
 from django.db.models import Q
@@ -39,9 +41,10 @@ class CreateCheckoutSessionView(APIView):
     """
     Vista para crear una sesión de pago en Stripe.
     Proceso:
-    1. Valida y crea una cita preliminar en estado 'pending'
-    2. Crea la sesión de pago en Stripe
+    1. Valida los datos y retiene el horario con una reserva temporal (SlotHold)
+    2. Crea la sesión de pago en Stripe (vence junto con la reserva)
     3. Retorna el sessionId para redirigir al usuario
+    La cita se crea recién al confirmar el pago (ConfirmPaymentView).
     """
     permission_classes = [permissions.IsAuthenticated]
 
@@ -56,32 +59,10 @@ class CreateCheckoutSessionView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
         validated_data = serializer.validated_data
-
-        # --- CORRECCIÓN PARA ELIMINAR CITAS "FANTASMA" ---
-        # Antes de crear la nueva cita, buscamos y eliminamos cualquier cita "fantasma"
-        # (pendiente y no pagada) que ocupe el mismo horario.
-        # Esto libera el espacio si un pago anterior fue abandonado.
-        citas_fantasma_eliminadas = Appointment.objects.filter(
-            psychologist=validated_data['psychologist'],
-            appointment_date=validated_data['appointment_date'],
-            start_time=validated_data['start_time'],
-            status='pending',
-            is_paid=False
-        ).delete()
-        
-        if citas_fantasma_eliminadas[0] > 0:
-            logger.info(f"Eliminadas {citas_fantasma_eliminadas[0]} citas fantasma para liberar el horario")
-        # --- FIN DE LA CORRECCIÓN ---
-
-        # Ahora que el espacio está libre, creamos la nueva cita preliminar de forma segura
-        appointment = serializer.save(status='pending', is_paid=False)
-
-        # 2. Obtener el precio de la consulta del psicólogo
         psychologist = validated_data['psychologist']  # Usar los datos ya validados
-        
+
         # Verificar que el psicólogo tenga perfil profesional
         if not hasattr(psychologist, 'professional_profile'):
-            appointment.delete()  # Limpiar la cita creada
             return Response({
                 'error': 'Este usuario no tiene un perfil profesional configurado.'
             }, status=status.HTTP_400_BAD_REQUEST)
@@ -89,11 +70,26 @@ class CreateCheckoutSessionView(APIView):
         fee = psychologist.professional_profile.consultation_fee
         
         if not fee or fee <= 0:
-            appointment.delete()  # Limpiar la cita creada
             return Response({
                 'error': 'Este profesional no tiene una tarifa configurada.'
             }, status=status.HTTP_400_BAD_REQUEST)
 
+        # 2. Retener el horario con una reserva temporal (sin crear la cita).
+        # Si el pago se abandona, la reserva vence y el reaper libera el horario.
+        try:
+            hold = create_hold(
+                patient=request.user,
+                psychologist=psychologist,
+                appointment_date=validated_data['appointment_date'],
+                start_time=validated_data['start_time'],
+                appointment_type=validated_data.get('appointment_type', 'in_person'),
+                reason_for_visit=validated_data.get('reason_for_visit', ''),
+                notes=validated_data.get('notes', ''),
+                consultation_fee=fee,
+            )
+        except SlotUnavailable as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+
         try:
             # --- CORRECCIÓN PARA REDIRECCIÓN AL FRONTEND ---
             backend_host = request.get_host()
@@ -133,7 +129,7 @@ class CreateCheckoutSessionView(APIView):
                             'currency': 'usd',  # Puedes cambiar a 'bob' para bolivianos
                             'product_data': {
                                 'name': f'Consulta con {psychologist.get_full_name()}',
-                                'description': f'Cita agendada para el {appointment.appointment_date} a las {appointment.start_time}',
+                                'description': f'Cita agendada para el {hold.appointment_date} a las {hold.start_time}',
                             },
                             'unit_amount': int(fee * 100),  # Stripe maneja los montos en centavos
                         },
@@ -144,42 +140,114 @@ class CreateCheckoutSessionView(APIView):
                 # URLs de redirección con protocolo correcto (http local, https producción)
                 success_url=f"{protocol}://{frontend_host}/payment-success?session_id={{CHECKOUT_SESSION_ID}}",
                 cancel_url=f"{protocol}://{frontend_host}/payment-cancel",
-                # Guardamos el ID de nuestra cita para saber qué actualizar después
+                # La sesión de Stripe vence junto con la reserva
+                expires_at=int(hold.expires_at.timestamp()),
+                # Guardamos el ID de la reserva para crear la cita al confirmar el pago
                 metadata={
-                    'appointment_id': appointment.id,
+                    'hold_id': hold.id,
                     'patient_id': request.user.id,
                     'psychologist_id': psychologist.id,
                     'tenant_schema_name': request.tenant.schema_name  # <-- GUARDAR EL SCHEMA
                 }
             )
             
-            logger.info(f"Sesión de pago creada: {checkout_session.id} para cita {appointment.id}")
+            hold.stripe_session_id = checkout_session.id
+            hold.save(update_fields=['stripe_session_id'])
+            logger.info(f"Sesión de pago creada: {checkout_session.id} para reserva {hold.id}")
             
             # --- CORRECCIÓN: Devolver URL directa en lugar de solo sessionId ---
             return Response({
                 'sessionId': checkout_session.id,
                 'checkout_url': checkout_session.url,  # <-- URL directa para redirigir
-                'appointment_id': appointment.id,
+                'hold_id': hold.id,
+                'hold_expires_at': hold.expires_at,
                 'amount': fee,
                 'currency': 'USD'
             })
 
         except stripe.error.StripeError as e:
-            # Si Stripe falla, borramos la cita preliminar para liberar el horario
-            appointment.delete()
+            # Si Stripe falla, liberamos la reserva
+            release_hold(hold)
             logger.error(f"Error de Stripe: {str(e)}")
             return Response({
                 'error': f'Error del servicio de pagos: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         except Exception as e:
             # Error general
-            appointment.delete()
+            release_hold(hold)
             logger.error(f"Error general en checkout: {str(e)}")
             return Response({
                 'error': 'Error interno del servidor'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _confirm_hold_payment(session, hold_id):
+    """
+    Convierte la reserva de una sesión pagada y registra la transacción con
+    la cita en la misma transacción de BD, bajo un lock por sesión: dos
+    confirmaciones (confirm-payment repetido o junto con el webhook) no
+    pueden cruzarse. Devuelve la cita, o None si la reserva ya no existe y
+    nadie la convirtió. Lanza SlotUnavailable si el horario se ocupó.
+    """
+    with db_transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [session.id])
+
+        existing = PaymentTransaction.objects.filter(
+            stripe_session_id=session.id,
+            appointment__isnull=False
+        ).select_related('appointment').first()
+        if existing:
+            return existing.appointment
+
+        appointment = convert_hold_to_appointment(hold_id)
+        if appointment is None:
+            return None
+
+        PaymentTransaction.objects.update_or_create(
+            stripe_session_id=session.id,
+            defaults={
+                'patient_id': appointment.patient_id,
+                'appointment': appointment,
+                'stripe_payment_intent_id': session.get('payment_intent'),
+                'amount': Decimal(session.get('amount_total', 0) / 100.0),
+                'currency': session.get('currency', 'usd').upper(),
+                'status': 'completed',
+                'paid_at': timezone.now()
+            }
+        )
+        return appointment
+
+
+def _refund_unbooked_payment(session):
+    """
+    Reembolsa un pago de reserva que no pudo convertirse en cita y lo registra
+    como 'refunded'. La clave de idempotencia evita un segundo reembolso si
+    Stripe reenvía el evento.
+    """
+    payment_intent = session.get('payment_intent')
+    try:
+        stripe.Refund.create(
+            payment_intent=payment_intent,
+            idempotency_key=f'refund-unbooked-{session.id}'
+        )
+    except stripe.error.StripeError as e:
+        logger.error(f"No se pudo reembolsar el pago {session.id}: {e}")
+        return
+
+    PaymentTransaction.objects.update_or_create(
+        stripe_session_id=session.id,
+        defaults={
+            'patient_id': session.get('metadata', {}).get('patient_id'),
+            'stripe_payment_intent_id': payment_intent,
+            'amount': Decimal(session.get('amount_total', 0) / 100.0),
+            'currency': session.get('currency', 'usd').upper(),
+            'status': 'refunded',
+        }
+    )
+    logger.info(f"Pago {session.id} reembolsado: el horario ya estaba ocupado")
+
+
 class StripeWebhookView(APIView):
     """
     Vista para recibir eventos de Stripe.
@@ -187,7 +255,7 @@ class StripeWebhookView(APIView):
     """
     permission_classes = [permissions.AllowAny]
 
-def post(self, request, *args, **kwargs):
+    def post(self, request, *args, **kwargs):
         payload = request.body
         sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
         event = None
@@ -216,8 +284,25 @@ def post(self, request, *args, **kwargs):
 
                     # --- ¡AQUÍ ESTÁ LA NUEVA LÓGICA! ---
                     appointment_id = metadata.get('appointment_id')
+                    hold_id = metadata.get('hold_id')
                     plan_id = metadata.get('plan_id')
 
+                    if hold_id:
+                        # --- 0. Cita con reserva temporal: cita y transacción juntas ---
+                        try:
+                            appointment = _confirm_hold_payment(session, hold_id)
+                        except SlotUnavailable as e:
+                            # Stripe reintenta mientras no reciba 200: el pago se
+                            # reembolsa y el evento se da por procesado
+                            logger.error(f"Pago {session.id} completado pero el horario ya no está libre: {e}")
+                            _refund_unbooked_payment(session)
+                            return Response(status=status.HTTP_200_OK)
+                        if appointment:
+                            logger.info(f"Reserva {hold_id} convertida en Cita {appointment.id}")
+                        else:
+                            logger.error(f"Pago {session.id} confirmado pero la reserva {hold_id} ya no existe")
+                        return Response(status=status.HTTP_200_OK)
+
                     # Creamos la transacción PRIMERO
                     transaction = PaymentTransaction.objects.create(
                         patient=CustomUser.objects.get(id=metadata.get('patient_id')),
@@ -337,6 +422,16 @@ class ConfirmPaymentView(generics.GenericAPIView):
         session = validated_data.get('stripe_session')
         appointment = validated_data.get('appointment') # Será None si es un plan
         plan = validated_data.get('plan')             # Será None si es una cita
+        hold = validated_data.get('hold')             # Reserva temporal pendiente de convertir
+
+        if hold:
+            # La reserva se convierte en cita confirmada (o se recupera la cita
+            # si otra confirmación concurrente ya la convirtió)
+            try:
+                appointment = _confirm_hold_payment(session, hold.id)
+            except SlotUnavailable as e:
+                logger.error(f"🚨 Pago {session.id} confirmado pero el horario ya no está libre: {e}")
+                return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
 
         if not session or (not appointment and not plan):
             logger.error("🚨 Serializer no devolvió session Y (appointment o plan)")
@@ -1,21 +1,31 @@
+from urllib.parse import parse_qs
+
 from channels.middleware import BaseMiddleware
 from channels.db import database_sync_to_async
-from django_tenants.utils import get_tenant_domain_model
+from django_tenants.utils import get_tenant_model, get_tenant_domain_model
 from django.db import connection
 
 class TenantASGIMiddleware(BaseMiddleware):
     """
     Middleware ASGI para detectar el inquilino (tenant) basado en el subdominio
     antes de procesar la conexión WebSocket.
+
+    El navegador no puede mandar el header X-Tenant-Schema en un WebSocket,
+    así que los tenants sin dominio propio se indican con ?tenant=<schema>
+    (misma prioridad que el header en CustomTenantMiddleware).
     """
     async def __call__(self, scope, receive, send):
-        # 1. Obtener el host de los headers
+        # 1. Obtener el schema de la query y el host de los headers
+        query_params = parse_qs(scope.get('query_string', b'').decode())
+        schema_name = query_params.get('tenant', [None])[0]
         headers = dict(scope['headers'])
         host = headers.get(b'host', b'').decode().split(':')[0]
 
         # 2. Buscar el tenant y activar el esquema
         try:
-            tenant = await self.get_tenant(host)
+            tenant = await self.get_tenant_by_schema(schema_name) if schema_name else None
+            if tenant is None:
+                tenant = await self.get_tenant(host)
             if tenant:
                 scope['tenant'] = tenant
                 # Activar el esquema en la conexión de BD para este hilo
@@ -37,6 +47,10 @@ class TenantASGIMiddleware(BaseMiddleware):
         except Domain.DoesNotExist:
             return None
 
+    @database_sync_to_async
+    def get_tenant_by_schema(self, schema_name):
+        return get_tenant_model().objects.filter(schema_name=schema_name).first()
+
     @database_sync_to_async
     def set_schema(self, schema_name):
         connection.set_schema(schema_name)
\ No newline at end of file
@@ -1,10 +1,23 @@
 # apps/tenants/custom_tenant_middleware.py
 import logging
 from django.db import connection
+from django.urls import Resolver404, resolve
 from django_tenants.utils import get_tenant_model, get_tenant_domain_model
 
 logger = logging.getLogger(__name__)
 
+# Únicas rutas que aceptan ?tenant=<schema>: sus clientes no pueden mandar
+# X-Tenant-Schema (Google/Apple Calendar) y el token de la URL es por tenant
+QUERY_TENANT_URL_NAMES = {'calendar-feed'}
+
+
+def _accepts_query_tenant(path):
+    try:
+        return resolve(path, urlconf='config.urls').url_name in QUERY_TENANT_URL_NAMES
+    except Resolver404:
+        return False
+
+
 class CustomTenantMiddleware:
     """
     REEMPLAZO COMPLETO de TenantMainMiddleware de django-tenants.
@@ -19,7 +32,10 @@ class CustomTenantMiddleware:
         logger.info(f"🔍 [CustomTenantMiddleware] Hostname: {hostname}")
         
         # 🔥 PRIORIDAD 1: Detectar por header X-Tenant-Schema (para frontend con subdominio Vercel)
+        # o, sólo en el feed iCal, por ?tenant=<schema> (QUERY_TENANT_URL_NAMES)
         tenant_header = request.headers.get('X-Tenant-Schema')
+        if not tenant_header and 'tenant' in request.GET and _accepts_query_tenant(request.path_info):
+            tenant_header = request.GET['tenant']
         
         if tenant_header:
             logger.info(f"🎯 Header X-Tenant-Schema detectado: {tenant_header}")
@@ -1,5 +1,33 @@
 # apps/tenants/tests.py
 
-from django.test import TestCase
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django_tenants.test.cases import TenantTestCase
+from django_tenants.utils import get_tenant_model
 
-# Create your tests here.
\ No newline at end of file
+from .custom_tenant_middleware import CustomTenantMiddleware
+
+
+class QueryTenantTests(TenantTestCase):
+    """?tenant=<schema> sólo elige el tenant en el feed iCal."""
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Clínica de pruebas'
+
+    def _call(self, path):
+        request = RequestFactory().get(path, {'tenant': self.tenant.schema_name})
+        CustomTenantMiddleware(lambda request: HttpResponse())(request)
+        return request
+
+    def test_calendar_feed_accepts_query_tenant(self):
+        request = self._call('/api/appointments/calendar/abc123.ics')
+        self.assertEqual(request.tenant.schema_name, self.tenant.schema_name)
+
+    def test_other_paths_ignore_query_tenant(self):
+        # Se detecta por dominio y, sin dominio ni tenant público en la BD de
+        # tests, la búsqueda del público falla: nunca se usa el schema pedido
+        for path in ['/api/appointments/appointments/', '/api/appointments/calendar/feed/', '/no-existe/']:
+            with self.subTest(path=path):
+                with self.assertRaises(get_tenant_model().DoesNotExist):
+                    self._call(path)
@@ -9,6 +9,7 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from apps.chat.middleware import TokenAuthMiddleware
 import apps.chat.routing
+import apps.appointments.routing
 
 # --- IMPORTA TU NUEVO MIDDLEWARE ---
 from apps.tenants.asgi_middleware import TenantASGIMiddleware 
@@ -21,7 +22,8 @@ application = ProtocolTypeRouter({
         AuthMiddlewareStack(
             TokenAuthMiddleware(
                 URLRouter(
-                    apps.chat.routing.websocket_urlpatterns
+                    apps.chat.routing.websocket_urlpatterns +
+                    apps.appointments.routing.websocket_urlpatterns
                 )
             )
         )
@@ -232,7 +232,7 @@ AUTHENTICATION_BACKENDS = [
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         #'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'apps.authentication.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -334,16 +334,65 @@ CORS_ALLOW_METHODS = [
     'POST',
     'PUT',
 ]
+
+# Cabeceras de respuesta legibles desde el frontend (paginación del chat)
+CORS_EXPOSE_HEADERS = [
+    'x-has-more',
+    'x-next-before-id',
+]
 # Configuración de ASGI para que Django Channels sea el punto de entrada
 ASGI_APPLICATION = 'config.asgi.application'
 
-# Configuración del "Channel Layer" que usará Redis como intermediario
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-   
-    },
-}
+# Configuración del "Channel Layer" que usará Redis como intermediario.
+# CHANNEL_LAYER_BACKEND: 'redis' (varios procesos ASGI) o 'memory' (un solo
+# proceso: desarrollo y pruebas). Por defecto 'redis' si hay REDIS_URL.
+REDIS_URL = config("REDIS_URL", default="")
+CHANNEL_LAYER_BACKEND = config("CHANNEL_LAYER_BACKEND", default="redis" if REDIS_URL else "memory")
+
+if CHANNEL_LAYER_BACKEND == 'redis':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                # channels_redis mantiene un pool de conexiones por event loop
+                'hosts': [REDIS_URL or 'redis://localhost:6379/0'],
+                'prefix': 'psico',
+                'capacity': config("CHANNEL_LAYER_CAPACITY", default=1000, cast=int),
+                'expiry': 60,
+                'group_expiry': 60 * 60 * 24,
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
+
+# Publicar cambios de disponibilidad por WebSocket desde vistas y señales.
+# Bajo WSGI con el layer en memoria nadie escucha: sólo tiene sentido con
+# Redis (o con un único proceso ASGI en desarrollo: REALTIME_PUBLISH=True).
+REALTIME_PUBLISH = config("REALTIME_PUBLISH", default=CHANNEL_LAYER_BACKEND == 'redis', cast=bool)
+
+# Caché de tokens de autenticación: TTL del nivel en proceso y, si hay una
+# caché compartida, segundo nivel entre workers. Un logout o una desactivación
+# tarda hasta AUTH_TOKEN_CACHE_TTL segundos en llegar a los demás workers
+# (0 desactiva el nivel en proceso).
+AUTH_TOKEN_CACHE_TTL = config("AUTH_TOKEN_CACHE_TTL", default=30, cast=int)
+AUTH_TOKEN_SHARED_CACHE = config("AUTH_TOKEN_SHARED_CACHE", default=bool(REDIS_URL), cast=bool)
+AUTH_TOKEN_SHARED_CACHE_TTL = 300
+
+# Con varios procesos, la caché (horarios, feeds iCal, reportes) también
+# debe ser compartida para que las invalidaciones lleguen a todos.
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'psico',
+        },
+    }
 # URL donde corre tu App de React (Vite usa el puerto 5173 por defecto)
 FRONTEND_URL_LOCAL = 'https://psico-admin-sp1-despliegue-front.vercel.app'
 # ---------------------------------------------------------------
@@ -454,6 +503,8 @@ AWS_ACCESS_KEY_ID = config("AWS_ACCESS_KEY_ID", default="")
 AWS_SECRET_ACCESS_KEY = config("AWS_SECRET_ACCESS_KEY", default="")
 AWS_STORAGE_BUCKET_NAME = config("AWS_STORAGE_BUCKET_NAME", default="psico-backups-2025")
 AWS_S3_REGION_NAME = config("AWS_S3_REGION_NAME", default="us-east-1")
+# Endpoint alternativo compatible con S3 (p. ej. MinIO local para pruebas)
+AWS_S3_ENDPOINT_URL = config("AWS_S3_ENDPOINT_URL", default="") or None
 
 # URL de acceso a S3
 AWS_S3_CUSTOM_DOMAIN = f'{AWS_STORAGE_BUCKET_NAME}.s3.{AWS_S3_REGION_NAME}.amazonaws.com'